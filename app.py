@@ -1,24 +1,334 @@
-from flask import Flask, request, jsonify, session, redirect, url_for, render_template, send_file
+from flask import (Flask, request, jsonify, session, redirect, url_for, render_template, send_file, g, Response,
+                   get_template_attribute, has_request_context)
 import sqlite3
 import os
 import json
-from datetime import datetime
+import random
+import shutil
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
 import io
+import click
+
+from archive import TRIP_COLUMNS, Archiver, trip_source
+from bulk_import import import_records, open_text, read_records
+from db_pool import ConnectionPool, PooledConnection
+from events import EventBus, EventBusFull
+import migrations
+import search
+from page_cache import PageCache
+from reference_cache import ReferenceCache
+from routing import ApproverRouter
+from sql_metrics import SqlMetrics
+from sql_stream import QueryRegistry, csv_chunks, gzip_chunks, iter_rows, ndjson_chunks
+import telemetry
+import trip_stats
+from table_browser import RowCountCache, browse_rows, export_rows, list_tables, table_schema
+from scheduling import (ACTIVE_TRIP_STATUSES, BookingIndex, conflict_map, find_double_bookings,
+                        fleet_usage, match_intervals, pick_vehicle, to_seconds)
+from write_queue import WriteQueue, run_in_transaction, start_daemon_thread
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
+# 连接池配置
+app.config['DB_POOL_SIZE'] = 8
+app.config['DB_TIMEOUT'] = 10.0
+app.config['DB_CACHE_SIZE_KIB'] = 16384
+app.config['DB_MMAP_SIZE'] = 256 * 1024 * 1024
+app.config['DB_CACHED_STATEMENTS'] = 256
+# 单写线程：每个事务最多合并的写单元数、排队上限、等待开始执行的超时（秒）和凑批的等待时间（秒）
+app.config['WRITE_BATCH_SIZE'] = 32
+app.config['WRITE_QUEUE_SIZE'] = 1000
+app.config['WRITE_TIMEOUT'] = 10.0
+app.config['WRITE_BATCH_DELAY'] = 0.0
+# 启动时自动执行数据库迁移
+app.config['AUTO_MIGRATE'] = True
+# 仪表板每页条数
+app.config['DASHBOARD_PAGE_SIZE'] = 20
+app.config['MAX_PAGE_SIZE'] = 100
+# 批量审批单次最多处理的请求数
+app.config['BATCH_MAX_ITEMS'] = 200
+# 审批分配的条件更新因资源已被占用而失败时，重新选择车辆和司机的最多次数
+app.config['ASSIGN_MAX_RETRIES'] = 3
+# 司机一次最多上传的行程读数条数
+app.config['TELEMETRY_MAX_READINGS'] = 1000
+# 行程全文搜索：每次只对最近这么多条匹配按相关度排序
+app.config['SEARCH_MAX_CANDIDATES'] = 5000
+# 管理员表格浏览每页行数，以及表行数缓存的有效期（秒）
+app.config['ADMIN_PAGE_SIZE'] = 50
+app.config['ROW_COUNT_TTL'] = 30.0
+# 管理员执行 SQL 的行数上限和时间预算（秒）
+app.config['SQL_MAX_ROWS'] = 10000
+app.config['SQL_TIME_BUDGET'] = 30.0
+# 批量导入：每次 executemany 的行数和每个事务的行数
+app.config['IMPORT_CHUNK_ROWS'] = 500
+app.config['IMPORT_TRANSACTION_ROWS'] = 5000
+# 审批员部门亲和：本部门审批员比全局最空闲的多出不超过该数量时优先本部门，None 表示不考虑部门
+app.config['APPROVER_AFFINITY_SLACK'] = 2
+# 用户、员工、部门、车辆缓存的条目上限，以及检查数据库版本号的间隔（秒）
+app.config['REFERENCE_CACHE_SIZE'] = 10000
+app.config['REFERENCE_CACHE_CHECK_INTERVAL'] = 1.0
+# 按数据版本号缓存的仪表板页面数量和总字节数上限
+app.config['PAGE_CACHE_SIZE'] = 256
+app.config['PAGE_CACHE_MAX_BYTES'] = 64 * 1024 * 1024
+# 行程变化推送（SSE）：最多同时连接数、心跳间隔和单个连接的最长时间（秒）
+app.config['EVENT_STREAM_MAX_CONNECTIONS'] = 1000
+app.config['EVENT_STREAM_HEARTBEAT'] = 15.0
+app.config['EVENT_STREAM_MAX_DURATION'] = 3600.0
+# 按端点统计 SQL 次数和耗时（默认关闭，有额外开销），慢查询阈值（毫秒）和慢查询日志条数
+app.config['SQL_INSTRUMENTATION'] = False
+app.config['SLOW_QUERY_MS'] = 100.0
+app.config['SLOW_QUERY_LOG_SIZE'] = 100
+# 行程归档：结束超过多少天的已结束行程移到 trip_requests_archive、每批行数、后台执行间隔（秒，0 为不在后台执行）
+app.config['ARCHIVE_AFTER_DAYS'] = 180
+app.config['ARCHIVE_BATCH_SIZE'] = 1000
+app.config['ARCHIVE_INTERVAL'] = 3600.0
+# 执行时间不定的数据库操作（管理员 SQL、导出、等待连接池）的执行器 executor(func, *args)：
+# gevent 下（serve.py）设置为在线程池中执行，None 时在当前线程直接执行
+app.config['BLOCKING_EXECUTOR'] = None
+# 启动写线程和归档线程的函数 spawn(target, name)：gevent 下（serve.py）设置为启动真正的系统线程，
+# None 时使用普通的守护线程
+app.config['THREAD_SPAWNER'] = None
 DATABASE = '5003project.db'
 
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _template_version():
+    """模板目录中最新的修改时间，模板更新后旧的 ETag 全部失效"""
+    folder = os.path.join(app.root_path, app.template_folder)
+    return str(max(os.path.getmtime(os.path.join(folder, name)) for name in os.listdir(folder)))
+
+
+# 每个司机、每辆车已占用时间段的内存日历（通过 trip_changes 与数据库增量同步）
+driver_bookings = BookingIndex('assigned_eid')
+vehicle_bookings = BookingIndex('assigned_vid')
+# 审批员待审批数量（新申请分配给负载最低的审批员）
+approver_router = ApproverRouter(affinity_slack=app.config['APPROVER_AFFINITY_SLACK'])
+# 用户、员工、部门、车辆的显示信息缓存（仪表板不再 JOIN 这些表）
+reference_cache = ReferenceCache(max_entries=app.config['REFERENCE_CACHE_SIZE'],
+                                 check_interval=app.config['REFERENCE_CACHE_CHECK_INTERVAL'])
+
+# 仪表板的 ETag 和渲染结果缓存
+page_cache = PageCache(max_entries=app.config['PAGE_CACHE_SIZE'],
+                       max_bytes=app.config['PAGE_CACHE_MAX_BYTES'], salt=_template_version())
+# 行程变化事件总线，/events 把相关事件推送给仪表板
+event_bus = EventBus(max_subscribers=app.config['EVENT_STREAM_MAX_CONNECTIONS'])
+# 管理员表格浏览的行数缓存
+row_counts = RowCountCache(ttl=app.config['ROW_COUNT_TTL'])
+# 管理员 SQL 的执行记录（用于取消和查看统计）
+sql_queries = QueryRegistry()
+# 每个端点的 SQL 统计和慢查询日志（SQL_INSTRUMENTATION 打开时才记录）
+sql_metrics = SqlMetrics(slow_ms=app.config['SLOW_QUERY_MS'], slow_log_size=app.config['SLOW_QUERY_LOG_SIZE'])
+# 把旧的已结束行程分批移到归档表，热表保持较小
+archiver = Archiver(after_days=app.config['ARCHIVE_AFTER_DAYS'], batch_size=app.config['ARCHIVE_BATCH_SIZE'],
+                    interval=app.config['ARCHIVE_INTERVAL'])
+
+
+def _invalidate_trip_followers():
+    """写事务整批失败或某个写单元被回滚后，让跟随 trip_changes 的内存状态下次整体重建"""
+    for follower in (driver_bookings, vehicle_bookings, approver_router):
+        follower.invalidate()
+
+
+# 唯一的写连接：写端点把写操作提交给写线程，多个写单元合并在一个事务中提交
+writer = WriteQueue(max_batch=app.config['WRITE_BATCH_SIZE'], max_queue=app.config['WRITE_QUEUE_SIZE'],
+                    max_delay=app.config['WRITE_BATCH_DELAY'], on_abort=_invalidate_trip_followers)
+
+
+def _create_pool(auto_migrate=True):
+    """按配置创建只读连接池（不启动写线程），auto_migrate 且 AUTO_MIGRATE 时先执行迁移"""
+    pool = ConnectionPool(
+        DATABASE,
+        size=app.config['DB_POOL_SIZE'],
+        timeout=app.config['DB_TIMEOUT'],
+        cache_size_kib=app.config['DB_CACHE_SIZE_KIB'],
+        mmap_size=app.config['DB_MMAP_SIZE'],
+        cached_statements=app.config['DB_CACHED_STATEMENTS'],
+        query_only=True,
+    )
+    if auto_migrate and app.config['AUTO_MIGRATE']:
+        conn = pool.connect(query_only=False)
+        try:
+            migrations.apply_migrations(conn)
+        finally:
+            conn.close()
+    return pool
+
+
+def get_pool():
+    """获取（必要时创建）进程内共享的连接池，并启动写线程和归档线程"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = _create_pool()
+                spawn = app.config['THREAD_SPAWNER'] or start_daemon_thread
+                writer.start(lambda: pool.connect(query_only=False), spawn)
+                archiver.start(writer, spawn)
+                _pool = pool
+    return _pool
+
+
+def run_write(unit):
+    """在写线程中执行写单元 unit(conn)，等它所在的事务提交后返回结果（unit 的异常原样抛出）
+
+    unit 在写线程中运行，不能访问 request、session 等请求上下文，需要的值先取出来。
+    打开 SQL 统计时，unit 执行的语句计入当前请求。
+    """
+    get_pool()
+    trace = g.get('_sql_trace') if has_request_context() else None
+    if trace is not None:
+        unit = sql_metrics.trace_unit(unit, trace)
+    return writer.submit(unit, timeout=app.config['WRITE_TIMEOUT'])
+
+
+def open_write_connection():
+    """不经过写线程的可写连接，用完后 close()
+
+    只给管理员 SQL 和批量导入这类自己管理事务、执行时间不定的操作使用（命令行见 open_cli_connection），
+    它们和写线程之间仍然通过 busy_timeout 等待写锁。
+    """
+    return get_pool().connect(query_only=False)
+
+
+def open_cli_connection(query_only=False, auto_migrate=True):
+    """命令行使用的单独连接，用完后 close()
+
+    不创建进程内的连接池，也不启动写线程和归档线程（命令行退出时没有人停止它们）；
+    auto_migrate 为 False 时也不自动迁移，flask migrate 自己执行并报告迁移。
+    """
+    return _create_pool(auto_migrate).connect(query_only=query_only)
+
+
+def _forget_connection(conn):
+    if g.get('_db') is conn:
+        g.pop('_db', None)
+
 
 def get_db_connection():
-    """获取数据库连接"""
-    conn = sqlite3.connect(DATABASE, timeout=10.0)  # 添加超时设置
-    conn.row_factory = sqlite3.Row
-    # 启用外键约束
-    conn.execute("PRAGMA foreign_keys = ON")
+    """获取数据库连接（同一请求内复用同一个池化连接）"""
+    conn = g.get('_db')
+    if conn is None or conn.closed:
+        pool = get_pool()
+        trace = g.get('_sql_trace')
+        if trace is not None:
+            conn = sql_metrics.connect(pool, _acquire(pool), trace, on_close=_forget_connection)
+        else:
+            conn = PooledConnection(pool, _acquire(pool), on_close=_forget_connection)
+        g._db = conn
     return conn
 
 
+def acquire_stream_connection(writable=False):
+    """流式响应用的连接：在视图返回后还要继续读取，所以不放在 g 中
+
+    返回 (连接, 归还函数)，归还函数可以重复调用。writable 时使用 open_write_connection()，归还时关闭。
+    """
+    pool = get_pool()
+    conn = open_write_connection() if writable else _acquire(pool)
+    released = []
+
+    def release():
+        if not released:
+            released.append(True)
+            if writable:
+                conn.close()
+            else:
+                pool.release(conn)
+
+    return conn, release
+
+
+def run_blocking(func, *args):
+    """执行可能长时间占用当前线程的数据库操作，返回 func(*args)
+
+    gevent 下 func 在线程池中执行，其他 greenlet（包括 SSE 长连接）照常运行；
+    func 中不能访问 request、session 等请求上下文，需要的值先取出来。
+    """
+    executor = app.config['BLOCKING_EXECUTOR']
+    return func(*args) if executor is None else executor(func, *args)
+
+
+def iterate_blocking(chunks):
+    """流式响应：每一块都通过 run_blocking 生成，响应关闭时关闭 chunks"""
+    done = object()
+    try:
+        while True:
+            chunk = run_blocking(next, chunks, done)
+            if chunk is done:
+                return
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def _acquire(pool):
+    """从连接池取出连接；池满需要等待时通过 run_blocking 等待"""
+    conn = pool.acquire(wait=False)
+    return conn if conn is not None else run_blocking(pool.acquire)
+
+
+@app.before_request
+def start_sql_trace():
+    """打开 SQL 统计时，为本请求记录执行的语句"""
+    if app.config['SQL_INSTRUMENTATION'] and request.endpoint:
+        g._sql_trace = sql_metrics.start_request(request.endpoint)
+
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """请求结束时把连接还给连接池（包括提前 return 没有 close 的情况）"""
+    conn = g.pop('_db', None)
+    if conn is not None:
+        conn.close()
+    trace = g.pop('_sql_trace', None)
+    if trace is not None:
+        sql_metrics.finish_request(trace)
+
+
+# 仪表板 ETag 依赖的参考表版本号（页面上显示了这些表中的名称）
+REFERENCE_VERSIONS = ('users', 'employees', 'departments', 'vehicles')
+
+
+def cached_page(conn, page, params, names, render, mimetype='text/html'):
+    """按 data_versions 中的版本号生成 ETag：客户端的 ETag 未变时返回 304，
+    其他客户端已经渲染过同一版本时直接返回缓存的页面，否则调用 render() 生成并缓存
+
+    render() 返回 Response（出错等不应缓存的结果）时原样返回，不缓存也不带 ETag。
+    """
+    etag = page_cache.etag(conn, page, params, list(names) + list(REFERENCE_VERSIONS))
+    if request.if_none_match.contains(etag):
+        page_cache.record_not_modified()
+        response = Response(status=304)
+    else:
+        body = page_cache.get(etag)
+        if body is None:
+            body = render()
+            if isinstance(body, Response):
+                return body
+            page_cache.put(etag, body)
+        response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    # 浏览器每次都带 If-None-Match 重新验证，不直接使用本地副本
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def publish_trip_event(action, rid, status, requester=None, approver=None, driver=None):
+    """提交后把行程变化推送给相关的申请人、审批员、司机以及管理员"""
+    topics = ['trips']
+    if requester is not None:
+        topics.append(f'requester:{requester}')
+    if approver is not None:
+        topics.append(f'approver:{approver}')
+    if driver is not None:
+        topics.append(f'driver:{driver}')
+    event_bus.publish(topics, 'trip', {'rid': rid, 'action': action, 'status': status})
+
+
 # 登录页面
 @app.route('/')
 def index():
@@ -83,20 +393,37 @@ def user_dashboard():
     conn = get_db_connection()
 
     # 获取当前用户的员工ID
-    user_info = conn.execute(
-        'SELECT eid FROM users WHERE uid = ?', (session['user_id'],)
-    ).fetchone()
-
-    requests = conn.execute('''
-        SELECT tr.*, e.fname, e.lname 
-        FROM trip_requests tr 
-        JOIN employees e ON tr.eid = e.eid 
-        WHERE tr.eid = ? 
-        ORDER BY tr.created_at DESC
-    ''', (user_info['eid'],)).fetchall()
-    conn.close()
+    user_info = reference_cache.user(conn, session['user_id'])
+
+    def render():
+        # 只渲染未结束的申请，已结束的由 /user/trips 按需加载
+        requests = conn.execute(f'''
+            SELECT tr.*
+            FROM trip_requests tr
+            WHERE tr.eid = ? AND tr.current_status IN ({', '.join('?' for _ in REQUESTER_ACTIVE_STATUSES)})
+            ORDER BY tr.created_at DESC
+        ''', (user_info['eid'], *REQUESTER_ACTIVE_STATUSES)).fetchall()
+        requests = reference_cache.trip_details(conn, requests)
+        counts = _status_counts(conn, 'eid', user_info['eid'])
+        conn.close()
 
-    return render_template('user_dashboard.html', requests=requests)
+        return render_template('user_dashboard.html', requests=requests, counts=counts)
+
+    # 自己的申请没有变化时直接返回 304 或缓存的页面
+    return cached_page(conn, 'user_dashboard', (session['user_id'], session.get('full_name')),
+                       [f"requester:{user_info['eid']}"], render)
+
+
+# 普通用户的申请历史（JSON，keyset 分页，按 created_at, rid 倒序）
+@app.route('/user/trips')
+def user_trips():
+    if 'user_id' not in session or session['user_type'] != 'normal':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    conn = get_db_connection()
+    user_info = reference_cache.user(conn, session['user_id'])
+    return trip_history(conn, 'user_trips', 'eid', user_info['eid'], 'created_at', TRIP_STATUSES,
+                        f"requester:{user_info['eid']}", 'user_trip_rows.html')
 
 
 # 提交新申请 - 修改版本，添加备注字段
@@ -109,133 +436,334 @@ def new_request():
     conn = get_db_connection()
 
     try:
-        # 获取当前用户的员工ID
-        user_info = conn.execute(
-            'SELECT eid FROM users WHERE uid = ?', (session['user_id'],)
-        ).fetchone()
-
-        # 随机选择一个审核员
-        approver = conn.execute('''
-            SELECT uid FROM users 
-            WHERE utype = 'approver' AND u_is_active = 1 
-            ORDER BY RANDOM() LIMIT 1
-        ''').fetchone()
-
-        if not approver:
+        # 获取当前用户的员工ID和部门
+        user_info = reference_cache.user(conn, session['user_id'])
+        employee = reference_cache.employee(conn, user_info['eid'])
+
+        def unit(conn):
+            # 分配给待审批数量最少的审批员
+            approver_uid = approver_router.route(conn, did=employee['did'], requester=user_info['eid'])
+            if approver_uid is None:
+                return None, None
+
+            # 插入新请求并分配审核员，包含备注
+            cursor = conn.execute('''
+                INSERT INTO trip_requests (eid, purpose, destination, start_time, end_time, passenger_number, approved_by, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                user_info['eid'],
+                data['purpose'],
+                data['destination'],
+                data['start_time'],
+                data['end_time'],
+                data['passenger_number'],
+                approver_uid,  # 负载最低的审核员
+                data.get('notes', '')  # 获取备注信息，如果没有则为空字符串
+            ))
+            return cursor.lastrowid, approver_uid
+
+        rid, approver_uid = run_write(unit)
+        if approver_uid is None:
             return jsonify({'success': False, 'message': 'No available approvers'})
 
-        # 插入新请求并分配审核员，包含备注
-        conn.execute('''
-            INSERT INTO trip_requests (eid, purpose, destination, start_time, end_time, passenger_number, approved_by, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            user_info['eid'],
-            data['purpose'],
-            data['destination'],
-            data['start_time'],
-            data['end_time'],
-            data['passenger_number'],
-            approver['uid'],  # 随机分配的审核员
-            data.get('notes', '')  # 获取备注信息，如果没有则为空字符串
-        ))
-        conn.commit()
+        # 立即把新请求计入审批员的待审批数量
+        approver_router.sync(conn)
+        publish_trip_event('created', rid, 'pending', requester=user_info['eid'], approver=approver_uid)
         return jsonify({'success': True, 'message': 'Request submitted successfully'})
     except Exception as e:
-        conn.rollback()
         return jsonify({'success': False, 'message': f'Submission failed: {str(e)}'})
     finally:
         conn.close()
 
 
+# 审批员仪表板的标签页（与 trip_requests.current_status 对应）
+APPROVER_TABS = ['pending', 'assigned', 'in_progress', 'completed', 'rejected', 'cancelled']
+TRIP_PURPOSES = ['business trip', 'company tour', 'cargo transport', 'client pickup']
+
+
+def _page_limit(value, default):
+    """解析分页大小参数，限制在 1 ~ MAX_PAGE_SIZE 之间"""
+    try:
+        limit = int(value) if value is not None else default
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+
+
+TRIP_STATUSES = ('pending', 'approved', 'rejected', 'assigned', 'in_progress', 'completed', 'cancelled')
+# 仪表板只在服务端渲染未结束的行程，其余的作为历史按需加载
+REQUESTER_ACTIVE_STATUSES = ('pending', 'approved', 'assigned', 'in_progress')
+DRIVER_TRIP_STATUSES = ('assigned', 'in_progress', 'completed', 'cancelled')
+# 行程历史接口除 TRIP_COLUMNS 外还可以返回的字段（从参考数据缓存补上的显示字段）
+TRIP_DETAIL_FIELDS = ('fname', 'lname', 'dname', 'driver_fname', 'driver_lname', 'plate', 'brand', 'model')
+
+
+def _status_counts(conn, owner_column, owner):
+    """某个申请人或司机各状态的行程数，包括已归档的（没有行程的状态为 0）"""
+    counts = dict.fromkeys(TRIP_STATUSES, 0)
+    counts.update((row['current_status'], row['total']) for row in conn.execute(f'''
+        SELECT current_status, COUNT(*) AS total
+        FROM trip_requests_all
+        WHERE {owner_column} = ?
+        GROUP BY current_status
+    ''', (owner,)))
+    return counts
+
+
+def _history_time(value, end=False):
+    """解析 YYYY-MM-DD 或 YYYY-MM-DD HH:MM[:SS]；只有日期的截止时间包含当天，格式不对时抛出 ValueError"""
+    value = value.strip()
+    parsed = datetime.fromisoformat(value.replace('T', ' '))
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def trip_history(conn, page, owner_column, owner, time_column, statuses, version, template):
+    """行程历史接口：按 (time_column, rid) 倒序 keyset 分页
+
+    查询参数：status（逗号分隔，默认 statuses 全部）、from / to（time_column 的范围，
+    to 不含）、fields（逗号分隔，默认全部字段，rid 总会返回）、limit、before_time 和
+    before_rid（上一页返回的 next_cursor）；html=1 时同时返回用 template 中的
+    trip_row / trip_modal 宏渲染的表格行和详情弹窗。
+    """
+    args = request.args
+    selected = [status for status in args.get('status', '').split(',') if status] or list(statuses)
+    for status in selected:
+        if status not in statuses:
+            return jsonify({'success': False, 'message': f'Invalid status: {status}'})
+
+    fields = [field for field in args.get('fields', '').split(',') if field] or list(TRIP_COLUMNS + TRIP_DETAIL_FIELDS)
+    for field in fields:
+        if field not in TRIP_COLUMNS and field not in TRIP_DETAIL_FIELDS:
+            return jsonify({'success': False, 'message': f'Invalid field: {field}'})
+    if 'rid' not in fields:
+        fields.insert(0, 'rid')
+
+    try:
+        start = _history_time(args['from']) if args.get('from') else None
+        end = _history_time(args['to'], end=True) if args.get('to') else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date range'})
+
+    limit = _page_limit(args.get('limit'), app.config['DASHBOARD_PAGE_SIZE'])
+    before_time = args.get('before_time')
+    before_rid = args.get('before_rid', type=int)
+    html = args.get('html') == '1'
+
+    # 只查询需要的列；名称字段要用 eid、assigned_eid、assigned_vid 从缓存中查找
+    details = html or any(field in TRIP_DETAIL_FIELDS for field in fields)
+    columns = {'rid', time_column} | {field for field in fields if field in TRIP_COLUMNS}
+    if details:
+        columns |= {'eid', 'assigned_eid', 'assigned_vid'}
+    select = 'tr.*' if html else ', '.join(f'tr.{column}' for column in TRIP_COLUMNS if column in columns)
+
+    conditions = [f'tr.{owner_column} = ?', f"tr.current_status IN ({', '.join('?' for _ in selected)})"]
+    params = [owner, *selected]
+    if start:
+        conditions.append(f'tr.{time_column} >= ?')
+        params.append(start)
+    if end:
+        conditions.append(f'tr.{time_column} < ?')
+        params.append(end)
+    if before_time and before_rid is not None:
+        conditions.append(f'(tr.{time_column}, tr.rid) < (?, ?)')
+        params.extend([before_time, before_rid])
+    params.append(limit + 1)
+
+    def render():
+        # 已结束的状态可能已经归档，这时同时查询归档表
+        rows = conn.execute(f'''
+            SELECT {select}
+            FROM {trip_source(selected)} tr
+            WHERE {' AND '.join(conditions)}
+            ORDER BY tr.{time_column} DESC, tr.rid DESC
+            LIMIT ?
+        ''', params).fetchall()
+        rows = reference_cache.trip_details(conn, rows) if details else [dict(row) for row in rows]
+        conn.close()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = {'time': rows[-1][time_column], 'rid': rows[-1]['rid']}
+
+        result = {
+            'success': True,
+            'trips': [{field: row[field] for field in fields} for row in rows],
+            'next_cursor': next_cursor
+        }
+        if html:
+            trip_row = get_template_attribute(template, 'trip_row')
+            trip_modal = get_template_attribute(template, 'trip_modal')
+            result['html'] = ''.join(trip_row(row) for row in rows)
+            result['modals'] = ''.join(trip_modal(row) for row in rows)
+        return jsonify(result).get_data(as_text=True)
+
+    return cached_page(conn, page, (tuple(fields), html, *params), [version], render,
+                       mimetype='application/json')
+
+
+def _approver_page(conn, approver, status, limit, before=None):
+    """审批员某个状态的一页请求（按 created_at, rid 倒序），返回 (带名称的行, 下一页的 (created_at, rid) 或 None)
+
+    before 为上一页最后一条的 (created_at, rid)；多取一行用来判断是否还有下一页。
+    """
+    conditions = ['tr.approved_by = ?', 'tr.current_status = ?']
+    params = [approver, status]
+    if before:
+        conditions.append('(tr.created_at, tr.rid) < (?, ?)')
+        params.extend(before)
+    params.append(limit + 1)
+    rows = conn.execute(f'''
+        SELECT tr.*
+        FROM {trip_source([status])} tr
+        WHERE {' AND '.join(conditions)}
+        ORDER BY tr.created_at DESC, tr.rid DESC
+        LIMIT ?
+    ''', params).fetchall()
+    # 申请人、部门、车辆和司机的名称从缓存中补上
+    rows = reference_cache.trip_details(conn, rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1]['created_at'], rows[-1]['rid'])
+
+
 # 审批员仪表板 - 完善版本
 @app.route('/approver/dashboard')
 def approver_dashboard():
     if 'user_id' not in session or session['user_type'] != 'approver':
         return redirect(url_for('index'))
 
+    page_size = app.config['DASHBOARD_PAGE_SIZE']
     conn = get_db_connection()
 
-    # 获取分配给当前审批员的待审批请求
-    pending_requests = conn.execute('''
-        SELECT tr.*, e.fname, e.lname, d.dname 
-        FROM trip_requests tr 
-        JOIN employees e ON tr.eid = e.eid 
-        JOIN departments d ON e.did = d.did 
-        WHERE tr.current_status = 'pending' AND tr.approved_by = ?
-        ORDER BY tr.created_at DESC
-    ''', (session['user_id'],)).fetchall()
-
-    # 获取已分配的请求
-    assigned_requests = conn.execute('''
-        SELECT tr.*, e.fname, e.lname, d.dname, 
-               v.plate as vehicle_plate, v.brand as vehicle_brand,
-               driver.fname as driver_fname, driver.lname as driver_lname
-        FROM trip_requests tr 
-        JOIN employees e ON tr.eid = e.eid 
-        JOIN departments d ON e.did = d.did 
-        LEFT JOIN vehicles v ON tr.assigned_vid = v.vid
-        LEFT JOIN employees driver ON tr.assigned_eid = driver.eid
-        WHERE tr.current_status = 'assigned' AND tr.approved_by = ?
-        ORDER BY tr.created_at DESC
-    ''', (session['user_id'],)).fetchall()
-
-    # 获取进行中的请求
-    in_progress_requests = conn.execute('''
-        SELECT tr.*, e.fname, e.lname, d.dname, 
-               v.plate as vehicle_plate, v.brand as vehicle_brand,
-               driver.fname as driver_fname, driver.lname as driver_lname
-        FROM trip_requests tr 
-        JOIN employees e ON tr.eid = e.eid 
-        JOIN departments d ON e.did = d.did 
-        LEFT JOIN vehicles v ON tr.assigned_vid = v.vid
-        LEFT JOIN employees driver ON tr.assigned_eid = driver.eid
-        WHERE tr.current_status = 'in_progress' AND tr.approved_by = ?
-        ORDER BY tr.created_at DESC
-    ''', (session['user_id'],)).fetchall()
-
-    # 获取已完成的请求
-    completed_requests = conn.execute('''
-        SELECT tr.*, e.fname, e.lname, d.dname, 
-               v.plate as vehicle_plate, v.brand as vehicle_brand,
-               driver.fname as driver_fname, driver.lname as driver_lname
-        FROM trip_requests tr 
-        JOIN employees e ON tr.eid = e.eid 
-        JOIN departments d ON e.did = d.did 
-        LEFT JOIN vehicles v ON tr.assigned_vid = v.vid
-        LEFT JOIN employees driver ON tr.assigned_eid = driver.eid
-        WHERE tr.current_status = 'completed' AND tr.approved_by = ?
-        ORDER BY tr.created_at DESC
-    ''', (session['user_id'],)).fetchall()
-
-    # 获取已拒绝的请求
-    rejected_requests = conn.execute('''
-        SELECT tr.*, e.fname, e.lname, d.dname 
-        FROM trip_requests tr 
-        JOIN employees e ON tr.eid = e.eid 
-        JOIN departments d ON e.did = d.did 
-        WHERE tr.current_status = 'rejected' AND tr.approved_by = ?
-        ORDER BY tr.created_at DESC
-    ''', (session['user_id'],)).fetchall()
-
-    # 获取已取消的请求
-    cancelled_requests = conn.execute('''
-        SELECT tr.*, e.fname, e.lname, d.dname 
-        FROM trip_requests tr 
-        JOIN employees e ON tr.eid = e.eid 
-        JOIN departments d ON e.did = d.did 
-        WHERE tr.current_status = 'cancelled' AND tr.approved_by = ?
-        ORDER BY tr.created_at DESC
-    ''', (session['user_id'],)).fetchall()
+    def render():
+        # 各状态的总数只读 (approved_by, current_status, created_at) 索引，
+        # 已完成、已拒绝和已取消的标签页包括已归档的行程
+        counts = {status: 0 for status in APPROVER_TABS}
+        counts.update((row['current_status'], row['total']) for row in conn.execute('''
+            SELECT current_status, COUNT(*) AS total
+            FROM trip_requests_all
+            WHERE approved_by = ?
+            GROUP BY current_status
+        ''', (session['user_id'],)) if row['current_status'] in counts)
+
+        # 每个标签页的第一页单独按索引顺序读取，读取的行数只和页大小有关
+        tabs = {status: [] for status in APPROVER_TABS}
+        next_cursors = {status: None for status in APPROVER_TABS}
+        for status in APPROVER_TABS:
+            if counts[status]:
+                tabs[status], next_cursors[status] = _approver_page(conn, session['user_id'], status, page_size)
+
+        # 待审批请求按用途统计（筛选卡片使用）
+        purpose_rows = conn.execute('''
+            SELECT purpose, COUNT(*) AS total
+            FROM trip_requests
+            WHERE approved_by = ? AND current_status = 'pending'
+            GROUP BY purpose
+        ''', (session['user_id'],)).fetchall()
 
-    conn.close()
+        conn.close()
+
+        purpose_counts = {purpose: 0 for purpose in TRIP_PURPOSES}
+        purpose_counts.update({row['purpose']: row['total'] for row in purpose_rows})
+
+        return render_template('approver_dashboard.html',
+                               tabs=tabs,
+                               counts=counts,
+                               purpose_counts=purpose_counts,
+                               next_cursors=next_cursors)
+
+    return cached_page(conn, 'approver_dashboard', (session['user_id'], session.get('full_name'), page_size),
+                       [f"approver:{session['user_id']}"], render)
+
+
+# 审批员按状态分页加载请求（keyset 分页，按 created_at, rid 倒序）
+@app.route('/approver/requests')
+def approver_requests():
+    if 'user_id' not in session or session['user_type'] != 'approver':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    status = request.args.get('status', 'pending')
+    if status not in APPROVER_TABS:
+        return jsonify({'success': False, 'message': f'Invalid status: {status}'})
+
+    limit = _page_limit(request.args.get('limit'), app.config['DASHBOARD_PAGE_SIZE'])
+    before_created = request.args.get('before_created')
+    before_rid = request.args.get('before_rid', type=int)
 
-    return render_template('approver_dashboard.html',
-                           requests=pending_requests,
-                           assigned_requests=assigned_requests,
-                           in_progress_requests=in_progress_requests,
-                           completed_requests=completed_requests,
-                           rejected_requests=rejected_requests,
-                           cancelled_requests=cancelled_requests)
+    before = (before_created, before_rid) if before_created and before_rid is not None else None
+    conn = get_db_connection()
+
+    def render():
+        rows, cursor = _approver_page(conn, session['user_id'], status, limit, before)
+        conn.close()
+
+        next_cursor = {'created_at': cursor[0], 'rid': cursor[1]} if cursor else None
+
+        return jsonify({
+            'success': True,
+            'requests': rows,
+            'html': render_template('approver_request_cards.html', requests=rows, status=status),
+            'next_cursor': next_cursor
+        }).get_data(as_text=True)
+
+    return cached_page(conn, 'approver_requests', (session['user_id'], status, before, limit),
+                       [f"approver:{session['user_id']}"], render, mimetype='application/json')
+
+
+# 审批分配的竞争统计（只在写线程中更新）：条件更新的次数和成功数、因资源被占用而失败（冲突）的次数、
+# 冲突后的重试次数、请求状态已经改变（如已取消）的次数，以及重试用完仍然冲突的次数
+assignment_stats = {'attempts': 0, 'assigned': 0, 'conflicts': 0, 'retries': 0, 'stale': 0, 'exhausted': 0}
+
+
+def _count_assignment(name, amount=1):
+    assignment_stats[name] += amount
+
+
+def _assign_trip(conn, rid, vid, eid):
+    """用条件更新把待审批的请求分配给车辆和司机（compare-and-set）
+
+    只有请求仍是 pending、车辆仍可用、司机和车辆在该时间段内（端点相接也算）没有其他
+    已分配或进行中的行程时才更新。成功时返回 None，否则返回请求当前的状态：
+    不是 pending 说明请求已经被处理或取消，仍是 pending 说明资源已被占用，可以重新选择后重试。
+    """
+    _count_assignment('attempts')
+    cursor = conn.execute('''
+        UPDATE trip_requests
+        SET current_status = 'assigned',
+            assigned_vid = ?,
+            assigned_eid = ?,
+            rejection_reason = NULL
+        WHERE rid = ? AND current_status = 'pending'
+          AND EXISTS (SELECT 1 FROM vehicles v WHERE v.vid = ? AND v.vstatus IN ('available', 'assigned'))
+          AND NOT EXISTS (
+              SELECT 1 FROM trip_requests o
+              WHERE o.assigned_eid = ? AND o.current_status IN ('assigned', 'in_progress')
+                AND o.start_time <= trip_requests.end_time AND o.end_time >= trip_requests.start_time
+                AND o.rid <> trip_requests.rid)
+          AND NOT EXISTS (
+              SELECT 1 FROM trip_requests o
+              WHERE o.assigned_vid = ? AND o.current_status IN ('assigned', 'in_progress')
+                AND o.start_time <= trip_requests.end_time AND o.end_time >= trip_requests.start_time
+                AND o.rid <> trip_requests.rid)
+    ''', (vid, eid, rid, vid, eid, vid))
+    if cursor.rowcount:
+        _count_assignment('assigned')
+        return None
+
+    row = conn.execute('SELECT current_status FROM trip_requests WHERE rid = ?', (rid,)).fetchone()
+    status = row['current_status'] if row else 'deleted'
+    if status == 'pending':
+        # 内存日历没有反映出已有的占用，下次同步时整体重建
+        _count_assignment('conflicts')
+        driver_bookings.invalidate()
+        vehicle_bookings.invalidate()
+    else:
+        _count_assignment('stale')
+    return status
 
 
 # 处理审批 - 完善版本，添加拒绝理由存储，并修复司机随机分配问题，添加时间冲突检测
@@ -248,102 +776,249 @@ def process_request():
     request_id = data['request_id']
     action = data['action']
     reject_reason = data.get('reject_reason', '')
+    approver_uid = session['user_id']
+    max_retries = app.config['ASSIGN_MAX_RETRIES']
 
-    conn = get_db_connection()
-
-    try:
-        # 首先验证这个请求是否分配给当前审批员
+    def unit(conn):
+        # 首先验证这个请求是否分配给当前审批员，并且仍在等待审批
         request_check = conn.execute(
-            'SELECT approved_by FROM trip_requests WHERE rid = ?',
+            'SELECT approved_by, eid, current_status FROM trip_requests WHERE rid = ?',
             (request_id,)
         ).fetchone()
 
-        if not request_check or request_check['approved_by'] != session['user_id']:
-            return jsonify({'success': False, 'message': 'Unauthorized to process this request'})
+        if not request_check or request_check['approved_by'] != approver_uid:
+            return {'message': 'Unauthorized to process this request'}
+        if request_check['current_status'] != 'pending':
+            return {'message': f"Request is already {request_check['current_status']}"}
 
         if action == 'approve':
             # 获取当前请求的时间信息
             current_request = conn.execute(
-                'SELECT start_time, end_time FROM trip_requests WHERE rid = ?',
+                'SELECT start_time, end_time, passenger_number FROM trip_requests WHERE rid = ?',
                 (request_id,)
             ).fetchone()
 
             if not current_request:
-                return jsonify({'success': False, 'message': 'Request not found'})
+                return {'message': 'Request not found'}
 
             start_time = current_request['start_time']
             end_time = current_request['end_time']
 
-            # 随机分配可用车辆
-            vehicle = conn.execute(
-                "SELECT vid FROM vehicles WHERE vstatus = 'available' ORDER BY RANDOM() LIMIT 1"
-            ).fetchone()
-
-            if not vehicle:
-                return jsonify({'success': False, 'message': 'No available vehicles'})
-
-            # 查找没有时间冲突的可用司机
-            available_drivers = conn.execute('''
-                SELECT u.eid 
-                FROM users u 
-                JOIN employees e ON u.eid = e.eid 
-                WHERE u.utype = 'driver' 
-                AND u.u_is_active = 1
-                AND e.e_is_active = 1
-                AND u.eid NOT IN (
-                    SELECT tr.assigned_eid 
-                    FROM trip_requests tr
-                    WHERE tr.current_status IN ('assigned', 'in_progress')
-                    AND tr.assigned_eid IS NOT NULL
-                    AND (
-                        (tr.start_time <= ? AND tr.end_time >= ?) OR
-                        (tr.start_time <= ? AND tr.end_time >= ?) OR
-                        (tr.start_time >= ? AND tr.end_time <= ?)
-                    )
-                )
-                ORDER BY RANDOM() LIMIT 1
-            ''', (start_time, start_time, end_time, end_time, start_time, end_time)).fetchone()
-
-            if not available_drivers:
-                # 如果没有完全空闲的司机，尝试找时间冲突最少的司机
-                # 这里可以扩展为更复杂的调度算法
-                return jsonify({'success': False,
-                                'message': 'No available drivers without time conflicts for the requested time period'})
-
-            driver = available_drivers
-
-            if vehicle and driver:
-                conn.execute('''
-                    UPDATE trip_requests 
-                    SET current_status = 'assigned', 
-                        assigned_vid = ?,
-                        assigned_eid = ?,
-                        rejection_reason = NULL
-                    WHERE rid = ?
-                ''', (vehicle['vid'], driver['eid'], request_id))
-
-                # 更新车辆状态
-                conn.execute(
-                    "UPDATE vehicles SET vstatus = 'assigned' WHERE vid = ?",
-                    (vehicle['vid'],)
-                )
-            else:
-                return jsonify({'success': False, 'message': 'No available vehicles or drivers'})
+            vehicles = conn.execute('''
+                SELECT vid, capacity FROM vehicles
+                WHERE vstatus IN ('available', 'assigned') AND capacity >= ?
+            ''', (current_request['passenger_number'] or 1,)).fetchall()
+            drivers = conn.execute('''
+                SELECT u.eid
+                FROM users u
+                JOIN employees e ON u.eid = e.eid
+                WHERE u.utype = 'driver' AND u.u_is_active = 1 AND e.e_is_active = 1
+            ''').fetchall()
+
+            # 按内存日历选出车辆和司机，再用条件更新分配；资源已被占用时重新同步、重新选择
+            for attempt in range(max_retries + 1):
+                if attempt:
+                    _count_assignment('retries')
+
+                # 分配车辆：座位数够用、该时间段内没有其他预约的车辆中容量最小的一辆
+                with vehicle_bookings.lock:
+                    vehicle_bookings.sync(conn)
+                    vid = pick_vehicle(vehicle_bookings.calendar,
+                                       [(v['vid'], v['capacity']) for v in vehicles],
+                                       to_seconds(start_time), to_seconds(end_time))
+
+                if vid is None:
+                    return {'message': 'No available vehicles with enough seats for the requested time period'}
+
+                # 查找没有时间冲突的可用司机：用内存日历筛掉时间冲突的在职司机
+                free_drivers = driver_bookings.free(conn, [d['eid'] for d in drivers], start_time, end_time)
+
+                if not free_drivers:
+                    # 如果没有完全空闲的司机，尝试找时间冲突最少的司机
+                    # 这里可以扩展为更复杂的调度算法
+                    return {'message': 'No available drivers without time conflicts for the requested time period'}
+
+                driver_eid = random.choice(free_drivers)
+                # 车辆状态在行程开始时才改为 assigned，预约只记录在行程上
+                status = _assign_trip(conn, request_id, vid, driver_eid)
+                if status is None:
+                    return {'eid': request_check['eid'], 'driver': driver_eid}
+                if status != 'pending':
+                    return {'message': f'Request is already {status}'}
+
+            _count_assignment('exhausted')
+            return {'message': 'The assigned driver or vehicle was taken concurrently, please retry'}
 
         elif action == 'reject':
             conn.execute('''
                 UPDATE trip_requests 
                 SET current_status = 'rejected',
                     rejection_reason = ?
-                WHERE rid = ?
+                WHERE rid = ? AND current_status = 'pending'
             ''', (reject_reason, request_id))
 
-        conn.commit()
-        conn.close()
+        return {'eid': request_check['eid'], 'driver': None}
+
+    try:
+        # 校验、分配和更新都在写线程的同一个事务中完成
+        outcome = run_write(unit)
+        if 'message' in outcome:
+            return jsonify({'success': False, 'message': outcome['message']})
+        if action == 'approve':
+            publish_trip_event('approved', request_id, 'assigned', requester=outcome['eid'],
+                               approver=approver_uid, driver=outcome['driver'])
+        elif action == 'reject':
+            publish_trip_event('rejected', request_id, 'rejected', requester=outcome['eid'],
+                               approver=approver_uid)
         return jsonify({'success': True, 'message': 'Request processed successfully'})
     except Exception as e:
-        conn.rollback()
-        conn.close()
+        return jsonify({'success': False, 'message': f'Processing failed: {str(e)}'})
+
+
+# 批量审批 - 一个事务内处理多条请求，批内所有通过的请求一起分配司机和车辆
+@app.route('/approver/process_batch', methods=['POST'])
+def process_batch():
+    if 'user_id' not in session or session['user_type'] != 'approver':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    items = (request.json or {}).get('items') or []
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': 'No items to process'})
+    if len(items) > app.config['BATCH_MAX_ITEMS']:
+        return jsonify({'success': False,
+                        'message': f"At most {app.config['BATCH_MAX_ITEMS']} requests can be processed at once"})
+
+    results = [{'request_id': item.get('request_id') if isinstance(item, dict) else None,
+                'action': item.get('action') if isinstance(item, dict) else None,
+                'success': False} for item in items]
+
+    approver_uid = session['user_id']
+    max_retries = app.config['ASSIGN_MAX_RETRIES']
+
+    # 校验、资源分配和更新都在写线程的同一个事务中完成，批内读取的可用资源在提交前不会被其他审批占用
+    def unit(conn):
+        request_ids = [result['request_id'] for result in results]
+        placeholders = ', '.join('?' for _ in request_ids)
+        rows = conn.execute(f'''
+            SELECT rid, eid, approved_by, current_status, start_time, end_time, passenger_number
+            FROM trip_requests WHERE rid IN ({placeholders})
+        ''', request_ids).fetchall()
+        trips = {row['rid']: row for row in rows}
+
+        # 逐条校验，收集需要分配资源的请求
+        approvals = {}
+        seen = set()
+        for index, (item, result) in enumerate(zip(items, results)):
+            trip = trips.get(result['request_id'])
+            if result['action'] not in ('approve', 'reject'):
+                result['message'] = 'Invalid action'
+            elif result['request_id'] in seen:
+                result['message'] = 'Duplicate request in batch'
+            elif not trip or trip['approved_by'] != approver_uid:
+                result['message'] = 'Unauthorized to process this request'
+            elif trip['current_status'] != 'pending':
+                result['message'] = f"Request is already {trip['current_status']}"
+            elif result['action'] == 'reject':
+                conn.execute('''
+                    UPDATE trip_requests
+                    SET current_status = 'rejected',
+                        rejection_reason = ?
+                    WHERE rid = ? AND current_status = 'pending'
+                ''', (item.get('reject_reason', ''), result['request_id']))
+                result['success'] = True
+                result['message'] = 'Request rejected'
+            else:
+                approvals[index] = trip
+            seen.add(result['request_id'])
+
+        if approvals:
+            vehicles = [(row['vid'], row['capacity']) for row in conn.execute('''
+                SELECT vid, capacity FROM vehicles
+                WHERE vstatus IN ('available', 'assigned')
+                ORDER BY capacity, vid
+            ''').fetchall()]
+            capacities = dict(vehicles)
+            drivers = [row['eid'] for row in conn.execute('''
+                SELECT u.eid
+                FROM users u
+                JOIN employees e ON u.eid = e.eid
+                WHERE u.utype = 'driver' AND u.u_is_active = 1 AND e.e_is_active = 1
+            ''').fetchall()]
+
+            # 条件更新失败（内存日历过期、资源已被占用）的请求重新同步后再匹配，最多重试 max_retries 次
+            unassigned = approvals
+            for attempt in range(max_retries + 1):
+                if attempt:
+                    _count_assignment('retries', len(unassigned))
+
+                intervals = {}
+                driver_candidates = {}
+                vehicle_candidates = {}
+                with driver_bookings.lock, vehicle_bookings.lock:
+                    driver_bookings.sync(conn)
+                    vehicle_bookings.sync(conn)
+                    for index, trip in unassigned.items():
+                        start, end = to_seconds(trip['start_time']), to_seconds(trip['end_time'])
+                        intervals[index] = (start, end)
+                        driver_candidates[index] = driver_bookings.calendar.free(drivers, start, end)
+                        seats = trip['passenger_number'] or 1
+                        vehicle_candidates[index] = vehicle_bookings.calendar.free(
+                            [vid for vid, capacity in vehicles if capacity >= seats], start, end)
+
+                # 先为所有请求匹配司机，再为拿到司机的请求匹配车辆；
+                # 拿不到车辆的请求退出后重新匹配，让它们占用的司机留给其他请求
+                remaining = set(unassigned)
+                no_vehicle = set()
+                while True:
+                    driver_match = match_intervals({k: intervals[k] for k in remaining}, driver_candidates)
+                    vehicle_match = match_intervals({k: intervals[k] for k in driver_match},
+                                                    vehicle_candidates, cost=capacities.get)
+                    without_vehicle = set(driver_match) - set(vehicle_match)
+                    if not without_vehicle:
+                        break
+                    remaining -= without_vehicle
+                    no_vehicle |= without_vehicle
+
+                conflicted = {}
+                for index, trip in unassigned.items():
+                    result = results[index]
+                    if index in no_vehicle:
+                        result['message'] = 'No available vehicles with enough seats for the requested time period'
+                    elif index not in driver_match:
+                        result['message'] = 'No available drivers without time conflicts for the requested time period'
+                    else:
+                        status = _assign_trip(conn, result['request_id'], vehicle_match[index], driver_match[index])
+                        if status is None:
+                            result.update(success=True, message='Request approved',
+                                          assigned_vid=vehicle_match[index], assigned_eid=driver_match[index])
+                        elif status != 'pending':
+                            result['message'] = f'Request is already {status}'
+                        else:
+                            conflicted[index] = trip
+
+                if not conflicted:
+                    break
+                unassigned = conflicted
+            else:
+                _count_assignment('exhausted', len(unassigned))
+                for index in unassigned:
+                    results[index]['message'] = 'The assigned driver or vehicle was taken concurrently, please retry'
+        return trips
+
+    try:
+        trips = run_write(unit)
+        for result in results:
+            if result['success']:
+                approved = 'assigned_eid' in result
+                publish_trip_event('approved' if approved else 'rejected', result['request_id'],
+                                   'assigned' if approved else 'rejected',
+                                   requester=trips[result['request_id']]['eid'], approver=approver_uid,
+                                   driver=result.get('assigned_eid'))
+        processed = sum(1 for result in results if result['success'])
+        return jsonify({'success': True,
+                        'message': f'{processed} of {len(results)} requests processed',
+                        'results': results})
+    except Exception as e:
         return jsonify({'success': False, 'message': f'Processing failed: {str(e)}'})
 
 
@@ -356,49 +1031,72 @@ def driver_dashboard():
     conn = get_db_connection()
 
     # 获取司机的员工ID
-    user_info = conn.execute(
-        'SELECT eid FROM users WHERE uid = ?', (session['user_id'],)
-    ).fetchone()
-
-    assigned_trips = conn.execute('''
-        SELECT tr.*, e.fname, e.lname, v.plate, v.brand, v.model
-        FROM trip_requests tr 
-        JOIN employees e ON tr.eid = e.eid 
-        JOIN vehicles v ON tr.assigned_vid = v.vid
-        WHERE tr.assigned_eid = ? AND tr.current_status IN ('assigned', 'in_progress', 'completed')
-        ORDER BY tr.start_time DESC
-    ''', (user_info['eid'],)).fetchall()
-
-    # 转换为字典列表并添加时间冲突信息
-    trips_list = []
-    for trip in assigned_trips:
-        trip_dict = dict(trip)
-
-        # 检查时间冲突
-        has_conflict = False
-        if trip_dict['current_status'] in ['assigned', 'in_progress']:
-            for other_trip in assigned_trips:
-                if (other_trip['rid'] != trip_dict['rid'] and
-                        other_trip['current_status'] in ['assigned', 'in_progress'] and
-                        trip_dict['start_time'] <= other_trip['end_time'] and
-                        trip_dict['end_time'] >= other_trip['start_time']):
-                    has_conflict = True
-                    break
+    user_info = reference_cache.user(conn, session['user_id'])
+
+    def render():
+        # 只渲染已分配和进行中的行程，历史行程由 /driver/trips 按需加载
+        assigned_trips = conn.execute('''
+            SELECT tr.*
+            FROM trip_requests tr
+            WHERE tr.assigned_eid = ? AND tr.current_status IN ('assigned', 'in_progress')
+            ORDER BY tr.start_time DESC
+        ''', (user_info['eid'],)).fetchall()
+        # 与原来的 JOIN vehicles 一致，只显示车辆存在的行程
+        assigned_trips = [trip for trip in reference_cache.trip_details(conn, assigned_trips)
+                          if trip['plate'] is not None]
+
+        # 只有进行中/已分配的行程之间才可能冲突，用扫描线一次求出所有冲突对
+        conflicts = conflict_map(
+            (trip['start_time'], trip['end_time'], trip['rid'])
+            for trip in assigned_trips
+            if trip['current_status'] in ACTIVE_TRIP_STATUSES
+        )
 
-        trip_dict['has_conflict'] = has_conflict
-        trips_list.append(trip_dict)
+        # 转换为字典列表并添加时间冲突信息
+        trips_list = []
+        for trip in assigned_trips:
+            trip_dict = trip
+            trip_dict['conflicts_with'] = sorted(conflicts.get(trip_dict['rid'], []))
+            trip_dict['has_conflict'] = bool(trip_dict['conflicts_with'])
+            trips_list.append(trip_dict)
 
-    conn.close()
+        counts = _status_counts(conn, 'assigned_eid', user_info['eid'])
+        conn.close()
+
+        # 传递 datetime 模块到模板
+        return render_template('driver_dashboard.html',
+                               trips=trips_list,
+                               counts=counts,
+                               current_trips_count=len(trips_list),
+                               datetime=datetime)
 
-    # 计算当前行程数量
-    current_trips_count = len(
-        [trip for trip in trips_list if trip['current_status'] in ['assigned', 'in_progress']])
+    return cached_page(conn, 'driver_dashboard', (session['user_id'], session.get('full_name')),
+                       [f"driver:{user_info['eid']}"], render)
 
-    # 传递 datetime 模块到模板
-    return render_template('driver_dashboard.html',
-                           trips=trips_list,
-                           current_trips_count=current_trips_count,
-                           datetime=datetime)
+
+# 司机的行程历史（JSON，keyset 分页，按 start_time, rid 倒序）
+@app.route('/driver/trips')
+def driver_trips():
+    if 'user_id' not in session or session['user_type'] != 'driver':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    conn = get_db_connection()
+    user_info = reference_cache.user(conn, session['user_id'])
+    return trip_history(conn, 'driver_trips', 'assigned_eid', user_info['eid'], 'start_time',
+                        DRIVER_TRIP_STATUSES, f"driver:{user_info['eid']}", 'driver_trip_rows.html')
+
+
+def _record_trip_reading(conn, rid, trip, kind, odometer=None, fuel=None):
+    """追加一条行程开始或结束的读数，没有给出的里程和油量取车辆当前的记录"""
+    vehicle = conn.execute('SELECT current_mileage, fuel FROM vehicles WHERE vid = ?',
+                           (trip['assigned_vid'],)).fetchone()
+    odometer = vehicle['current_mileage'] if odometer is None and vehicle else odometer
+    fuel = vehicle['fuel'] if fuel is None and vehicle else fuel
+    if odometer is None or fuel is None:
+        return
+    telemetry.record(conn, [{'rid': rid, 'vid': trip['assigned_vid'], 'eid': trip['assigned_eid'], 'kind': kind,
+                             'recorded_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                             'odometer': odometer, 'fuel': fuel}])
 
 
 # 更新行程状态
@@ -413,17 +1111,33 @@ def update_trip_status():
     current_mileage = data.get('current_mileage')
     fuel = data.get('fuel')  # 使用fuel而不是current_fuel
 
-    conn = get_db_connection()
-
-    try:
+    # 确保里程和fuel是合适的DECIMAL值（在写入之前校验，写单元中途返回不会回滚已执行的更新）
+    mileage_value = fuel_value = None
+    if status in ('in_progress', 'completed'):
+        if current_mileage is not None:
+            try:
+                mileage_value = float(current_mileage)
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'Invalid mileage value.'})
+            if mileage_value < 0:
+                return jsonify({'success': False, 'message': 'Mileage must not be negative.'})
+        if fuel is not None:
+            try:
+                fuel_value = float(fuel)
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'Invalid fuel value.'})
+            if not 0 <= fuel_value <= 100:
+                return jsonify({'success': False, 'message': 'Fuel level must be between 0 and 100.'})
+
+    def unit(conn):
         # 获取行程信息，包括分配的车辆ID
         trip = conn.execute(
-            'SELECT assigned_vid FROM trip_requests WHERE rid = ?',
+            'SELECT assigned_vid, assigned_eid, eid, approved_by FROM trip_requests WHERE rid = ?',
             (trip_id,)
         ).fetchone()
 
         if not trip:
-            return jsonify({'success': False, 'message': 'Trip not found'})
+            return None
 
         # 更新行程状态
         conn.execute(
@@ -431,6 +1145,15 @@ def update_trip_status():
             (status, trip_id)
         )
 
+        # 行程开始后车辆才真正处于使用中
+        if status == 'in_progress' and trip['assigned_vid']:
+            conn.execute(
+                "UPDATE vehicles SET vstatus = 'assigned' WHERE vid = ? AND vstatus = 'available'",
+                (trip['assigned_vid'],)
+            )
+            # 记录行程开始时的里程表读数和油量（司机没有填写时使用车辆当前的记录）
+            _record_trip_reading(conn, trip_id, trip, 'start', mileage_value, fuel_value)
+
         # 如果状态变为"completed"，更新车辆状态和记录车辆信息
         if status == 'completed' and trip['assigned_vid']:
             # 更新车辆状态为"available"
@@ -440,39 +1163,196 @@ def update_trip_status():
             )
 
             # 如果提供了车辆信息，更新车辆详情
-            if current_mileage is not None:
+            if mileage_value is not None:
                 conn.execute(
                     "UPDATE vehicles SET current_mileage = ? WHERE vid = ?",
-                    (current_mileage, trip['assigned_vid'])
+                    (mileage_value, trip['assigned_vid'])
                 )
 
-            if fuel is not None:
-                # 确保fuel是合适的DECIMAL值
-                try:
-                    fuel_value = float(fuel)
-                    if 0 <= fuel_value <= 100:
-                        conn.execute(
-                            "UPDATE vehicles SET fuel = ? WHERE vid = ?",
-                            (fuel_value, trip['assigned_vid'])
-                        )
-                    else:
-                        return jsonify({'success': False, 'message': 'Fuel level must be between 0 and 100.'})
-                except ValueError:
-                    return jsonify({'success': False, 'message': 'Invalid fuel value.'})
+            if fuel_value is not None:
+                conn.execute(
+                    "UPDATE vehicles SET fuel = ? WHERE vid = ?",
+                    (fuel_value, trip['assigned_vid'])
+                )
 
-            # 可选：记录行程结束时间和车辆使用信息到单独的表中
-            # 这里可以根据需要扩展，比如创建一个trip_completion_records表
+            # 填写了结束里程时记录行程结束的读数（trip_telemetry），用于按行程统计里程和油耗
+            if mileage_value is not None:
+                _record_trip_reading(conn, trip_id, trip, 'end', mileage_value, fuel_value)
 
-        conn.commit()
-        conn.close()
+        return trip
+
+    try:
+        trip = run_write(unit)
+        if not trip:
+            return jsonify({'success': False, 'message': 'Trip not found'})
+        publish_trip_event('status_changed', trip_id, status, requester=trip['eid'],
+                           approver=trip['approved_by'], driver=trip['assigned_eid'])
         return jsonify({'success': True, 'message': 'Trip status updated successfully'})
     except Exception as e:
-        conn.rollback()
-        conn.close()
         return jsonify({'success': False, 'message': f'Update failed: {str(e)}'})
 
 
-# 数据库管理员仪表板
+# 司机批量上传行驶中的读数（里程表和油量），返回逐条的错误
+@app.route('/driver/telemetry', methods=['POST'])
+def driver_telemetry():
+    if 'user_id' not in session or session['user_type'] != 'driver':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    items = (request.json or {}).get('readings') or []
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': 'No readings to record'})
+    if len(items) > app.config['TELEMETRY_MAX_READINGS']:
+        return jsonify({'success': False,
+                        'message': f"At most {app.config['TELEMETRY_MAX_READINGS']} readings can be recorded at once"})
+
+    conn = get_db_connection()
+    driver_eid = reference_cache.user(conn, session['user_id'])['eid']
+    conn.close()
+
+    errors = []
+    readings = []
+    now = datetime.now()
+    for index, item in enumerate(items):
+        reading, error = telemetry.parse_reading(item, now)
+        if error:
+            errors.append({'index': index, 'message': error})
+        else:
+            readings.append((index, reading))
+
+    def unit(conn):
+        # 一次查出涉及的行程，只接受分配给当前司机、已有车辆的行程的读数
+        rids = sorted({reading['rid'] for _, reading in readings})
+        trips = {row['rid']: row for row in conn.execute(f'''
+            SELECT rid, assigned_vid, assigned_eid, current_status FROM trip_requests
+            WHERE rid IN ({', '.join('?' for _ in rids)})
+        ''', rids)} if rids else {}
+
+        accepted = []
+        rejected = []
+        for index, reading in readings:
+            trip = trips.get(reading['rid'])
+            if not trip or trip['assigned_eid'] != driver_eid:
+                rejected.append({'index': index, 'message': 'Trip not found'})
+            elif trip['current_status'] not in telemetry.TELEMETRY_STATUSES or trip['assigned_vid'] is None:
+                rejected.append({'index': index, 'message': f"Trip is {trip['current_status']}"})
+            else:
+                accepted.append(dict(reading, vid=trip['assigned_vid'], eid=driver_eid))
+        return telemetry.record(conn, accepted), rejected
+
+    try:
+        inserted, rejected = run_write(unit)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Recording failed: {str(e)}'})
+
+    errors = sorted(errors + rejected, key=lambda error: error['index'])
+    return jsonify({'success': True, 'inserted': inserted, 'failed': len(errors), 'errors': errors})
+
+
+# 各角色可以搜索的行程：(行程表中的列, data_versions 中的名称前缀)，数据库管理员可以搜索全部行程
+SEARCH_SCOPES = {'normal': ('eid', 'requester'), 'approver': ('approved_by', 'approver'),
+                 'driver': ('assigned_eid', 'driver')}
+
+
+# 按目的地、备注和拒绝原因全文搜索行程（包括已归档的）
+@app.route('/trips/search')
+def search_trips():
+    """查询参数：q（搜索文字，双引号括起的部分按短语匹配）、columns 和 status（逗号分隔，
+    默认全部）、limit，以及 after_score 和 after_rid（上一页返回的 next_cursor）
+
+    结果按相关度排序，只包含当前用户的角色可以看到的行程（申请人自己的、审批员审批的、
+    司机被分配的）。只对最近的 SEARCH_MAX_CANDIDATES 条匹配排序，truncated 为 true 时
+    更早的行程没有参与搜索，应该换用更具体的搜索文字。
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    args = request.args
+    columns = [column for column in args.get('columns', '').split(',') if column]
+    for column in columns:
+        if column not in search.SEARCH_COLUMNS:
+            return jsonify({'success': False, 'message': f'Invalid column: {column}'})
+    query = search.match_query(args.get('q', ''), columns)
+    if query is None:
+        return jsonify({'success': False, 'message': 'Search text is required'})
+
+    statuses = [status for status in args.get('status', '').split(',') if status]
+    for status in statuses:
+        if status not in TRIP_STATUSES:
+            return jsonify({'success': False, 'message': f'Invalid status: {status}'})
+
+    limit = _page_limit(args.get('limit'), app.config['DASHBOARD_PAGE_SIZE'])
+    after_score = args.get('after_score', type=float)
+    after_rid = args.get('after_rid', type=int)
+    after = (after_score, after_rid) if after_score is not None and after_rid is not None else None
+
+    conn = get_db_connection()
+    user_type = session['user_type']
+    if user_type == 'database_manager':
+        scope, version = None, 'trip_requests'
+    elif user_type in SEARCH_SCOPES:
+        column, prefix = SEARCH_SCOPES[user_type]
+        owner = session['user_id'] if user_type == 'approver' else reference_cache.user(conn, session['user_id'])['eid']
+        scope, version = (column, owner), f'{prefix}:{owner}'
+    else:
+        conn.close()
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+    # 只搜索未结束的状态时不需要读取归档表
+    source = trip_source(statuses) if statuses else 'trip_requests_all'
+    try:
+        search.check_query(conn, query)
+    except sqlite3.OperationalError as e:
+        conn.close()
+        return jsonify({'success': False, 'message': f'Invalid search: {str(e)}'})
+
+    def render():
+        try:
+            ranked, more, truncated = search.search(conn, query, limit, scope=scope, statuses=statuses,
+                                                    source=source, after=after,
+                                                    max_candidates=app.config['SEARCH_MAX_CANDIDATES'])
+            found = search.hits(conn, query, [rid for rid, _ in ranked], source)
+            trips = reference_cache.trip_details(conn, [found[rid] for rid, _ in ranked if rid in found])
+        except sqlite3.OperationalError as e:
+            return jsonify({'success': False, 'message': f'Search failed: {str(e)}'})
+        finally:
+            conn.close()
+
+        scores = dict(ranked)
+        for trip in trips:
+            trip['score'] = scores[trip['rid']]
+        next_cursor = {'score': ranked[-1][1], 'rid': ranked[-1][0]} if more else None
+        return jsonify({
+            'success': True,
+            'trips': trips,
+            'next_cursor': next_cursor,
+            'truncated': truncated
+        }).get_data(as_text=True)
+
+    return cached_page(conn, 'search_trips', (query, scope, tuple(statuses), limit, after), [version], render,
+                       mimetype='application/json')
+
+
+def _browse_options():
+    """从查询参数中读取表格浏览的排序、筛选、列和游标选项"""
+    options = {
+        'columns': [name for value in request.args.getlist('columns') for name in value.split(',') if name],
+        'sort': request.args.get('sort'),
+        'descending': request.args.get('dir') == 'desc',
+        'search': request.args.get('q', '').strip() or None,
+        'search_column': request.args.get('filter_column'),
+        'exact': request.args.get('exact') == '1',
+        'case_sensitive': request.args.get('case') == '1',
+        'after': None,
+    }
+    cursor = request.args.get('cursor')
+    if cursor:
+        after = json.loads(cursor)
+        if not isinstance(after, list) or len(after) != 2:
+            raise ValueError('Invalid cursor')
+        options['after'] = after
+    return options
+
+
+# 数据库管理员仪表板（服务端 keyset 分页、排序和筛选，只渲染第一页）
 @app.route('/admin/dashboard')
 def admin_dashboard():
     if 'user_id' not in session or session['user_type'] != 'database_manager':
@@ -482,26 +1362,32 @@ def admin_dashboard():
     conn = get_db_connection()
 
     try:
-        # 获取表数据
-        data = conn.execute(f'SELECT * FROM {table}').fetchall()
-
         # 获取所有表名
-        tables = conn.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
-        ).fetchall()
-
-        # 获取列名
-        columns = []
-        if data:
-            columns = data[0].keys()
+        tables = list_tables(conn)
+
+        # 列名和主键来自表结构，空表也能显示表头
+        schema = table_schema(conn, table)
+        options = _browse_options()
+        columns, data, next_cursor = browse_rows(conn, schema, limit=app.config['ADMIN_PAGE_SIZE'], **options)
+        row_count, count_age = row_counts.get(conn, table)
+        # 排序链接保留当前的筛选参数
+        browse_args = {key: values for key, values in request.args.to_dict(flat=False).items()
+                       if key not in ('sort', 'dir', 'cursor')}
+        browse_args['table'] = table
 
         conn.close()
 
         return render_template('admin_dashboard.html',
                                data=data,
-                               tables=[t['name'] for t in tables],
+                               tables=tables,
                                current_table=table,
-                               columns=columns)
+                               columns=columns,
+                               schema=schema,
+                               options=options,
+                               row_count=row_count,
+                               count_age=count_age,
+                               next_cursor=next_cursor,
+                               browse_args=browse_args)
     except Exception as e:
         conn.close()
         return render_template('admin_dashboard.html',
@@ -509,10 +1395,195 @@ def admin_dashboard():
                                tables=[],
                                current_table=table,
                                columns=[],
+                               schema={'names': [], 'pk': None, 'sortable': []},
+                               options={},
+                               row_count=0,
+                               count_age=0,
+                               next_cursor=None,
+                               browse_args={},
                                error=str(e))
 
 
-# 管理员执行SQL
+# 管理员按页加载表格数据（参数与仪表板相同，另加 cursor 和 limit）
+@app.route('/admin/table_rows')
+def admin_table_rows():
+    if 'user_id' not in session or session['user_type'] != 'database_manager':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    table = request.args.get('table', 'users')
+    conn = get_db_connection()
+
+    try:
+        schema = table_schema(conn, table)
+        limit = _page_limit(request.args.get('limit'), app.config['ADMIN_PAGE_SIZE'])
+        columns, data, next_cursor = browse_rows(conn, schema, limit=limit, **_browse_options())
+        conn.close()
+    except Exception as e:
+        conn.close()
+        return jsonify({'success': False, 'message': f'Failed to load rows: {str(e)}'})
+
+    return jsonify({
+        'success': True,
+        'columns': columns,
+        'pk': schema['pk'],
+        'rows': [{name: row[name] for name in columns} for row in data],
+        'html': render_template('admin_table_rows.html', data=data, columns=columns),
+        'next_cursor': next_cursor
+    })
+
+
+# 管理员查看各审批员的待审批数量和最近的分配记录
+@app.route('/admin/approver_load')
+def approver_load():
+    if 'user_id' not in session or session['user_type'] != 'database_manager':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    conn = get_db_connection()
+    with approver_router.lock:
+        approver_router.refresh_roster(conn)
+        approver_router.sync(conn)
+        depths = approver_router.queue_depths()
+        decisions = list(approver_router.decisions)[::-1]
+    conn.close()
+
+    return jsonify({'success': True, **depths, 'recent_decisions': decisions})
+
+
+# 管理员查看全车队的司机/车辆重复预约
+@app.route('/admin/conflicts')
+def admin_conflicts():
+    if 'user_id' not in session or session['user_type'] != 'database_manager':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    conn = get_db_connection()
+    trips = conn.execute('''
+        SELECT rid, assigned_eid, assigned_vid, start_time, end_time
+        FROM trip_requests
+        WHERE current_status IN ('assigned', 'in_progress')
+    ''').fetchall()
+    conn.close()
+
+    bookings = find_double_bookings(trips)
+    return jsonify({
+        'success': True,
+        'active_trips': len(trips),
+        'drivers': [{'eid': eid, 'conflicts': pairs} for eid, pairs in bookings['assigned_eid'].items()],
+        'vehicles': [{'vid': vid, 'conflicts': pairs} for vid, pairs in bookings['assigned_vid'].items()]
+    })
+
+
+# 管理员查看车队利用率和空闲时间碎片化程度
+@app.route('/admin/fleet_utilization')
+def fleet_utilization():
+    if 'user_id' not in session or session['user_type'] != 'database_manager':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    days = max(1, min(request.args.get('days', 14, type=int), 365))
+    start = to_seconds(datetime.now().replace(microsecond=0))
+    end = start + days * 86400
+
+    conn = get_db_connection()
+    vehicles = conn.execute('''
+        SELECT vid, capacity FROM vehicles
+        WHERE vstatus IN ('available', 'assigned')
+        ORDER BY capacity, vid
+    ''').fetchall()
+    with vehicle_bookings.lock:
+        vehicle_bookings.sync(conn)
+        usage = fleet_usage(vehicle_bookings.calendar, [(v['vid'], v['capacity']) for v in vehicles], start, end)
+    conn.close()
+
+    return jsonify({'success': True, 'days': days, **usage})
+
+
+# 管理员查看按日期、部门、车辆、司机汇总的行程数、拒绝率和占用时间（读取触发器维护的 trip_stats）
+@app.route('/admin/analytics')
+def analytics():
+    if 'user_id' not in session or session['user_type'] != 'database_manager':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    dimension = request.args.get('dimension', 'all')
+    if dimension not in trip_stats.DIMENSIONS:
+        return jsonify({'success': False, 'message': f'Invalid dimension: {dimension}'})
+    try:
+        end_day = date.fromisoformat(request.args['to']) if request.args.get('to') else date.today()
+        start_day = date.fromisoformat(request.args['from']) if request.args.get('from') else end_day - timedelta(days=29)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date range'})
+    if start_day > end_day:
+        return jsonify({'success': False, 'message': 'Invalid date range'})
+    key = request.args.get('key', type=int)
+    by_day = request.args.get('by_day') == '1'
+
+    conn = get_db_connection()
+    rows = trip_stats.summarize(conn, dimension, start_day.isoformat(), end_day.isoformat(), key=key, by_day=by_day)
+    keys = [row['key'] for row in rows]
+    if dimension == 'department':
+        names = {did: d['dname'] for did, d in reference_cache.get_many(conn, 'departments', keys).items()}
+    elif dimension == 'vehicle':
+        names = {vid: v['plate'] for vid, v in reference_cache.get_many(conn, 'vehicles', keys).items()}
+    elif dimension == 'driver':
+        names = {eid: f"{e['fname']} {e['lname']}" for eid, e in reference_cache.get_many(conn, 'employees', keys).items()}
+    else:
+        names = {}
+    conn.close()
+
+    # 车辆和司机的利用率 = 占用时间 / 统计时段的总时间
+    days = (end_day - start_day).days + 1
+    for row in rows:
+        row['name'] = names.get(row['key'])
+        if dimension in ('vehicle', 'driver'):
+            row['utilization'] = round(row['busy_hours'] / (24 * (1 if by_day else days)), 4)
+
+    return jsonify({'success': True, 'dimension': dimension, 'from': start_day.isoformat(),
+                    'to': end_day.isoformat(), 'days': days, 'rows': rows})
+
+
+# 管理员查看每辆车的行驶里程、耗油量和百公里油耗（读取触发器维护的 vehicle_daily_usage）
+@app.route('/admin/vehicle_usage')
+def vehicle_usage():
+    if 'user_id' not in session or session['user_type'] != 'database_manager':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    try:
+        end_day = date.fromisoformat(request.args['to']) if request.args.get('to') else date.today()
+        start_day = date.fromisoformat(request.args['from']) if request.args.get('from') else end_day - timedelta(days=29)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date range'})
+    if start_day > end_day:
+        return jsonify({'success': False, 'message': 'Invalid date range'})
+    vid = request.args.get('vid', type=int)
+    by_day = request.args.get('by_day') == '1'
+
+    conn = get_db_connection()
+    rows = telemetry.usage(conn, start_day.isoformat(), end_day.isoformat(), vid=vid, by_day=by_day)
+    vehicles = reference_cache.get_many(conn, 'vehicles', [row['vid'] for row in rows])
+    conn.close()
+
+    for row in rows:
+        row['plate'] = vehicles[row['vid']]['plate'] if row['vid'] in vehicles else None
+
+    return jsonify({'success': True, 'from': start_day.isoformat(), 'to': end_day.isoformat(),
+                    'days': (end_day - start_day).days + 1, 'rows': rows})
+
+
+# 管理员查看一个行程的全部读数和里程、油耗（包括已归档的行程）
+@app.route('/admin/trip_telemetry')
+def trip_telemetry():
+    if 'user_id' not in session or session['user_type'] != 'database_manager':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    rid = request.args.get('trip_id', type=int)
+    if rid is None:
+        return jsonify({'success': False, 'message': 'trip_id is required'})
+
+    conn = get_db_connection()
+    summary = telemetry.trip_summary(conn, rid)
+    conn.close()
+    return jsonify({'success': True, **summary})
+
+
+# 管理员执行SQL（有行数上限和时间预算；format 为 ndjson 或 csv 时边读边返回）
 @app.route('/admin/execute_sql', methods=['POST'])
 def execute_sql():
     if 'user_id' not in session or session['user_type'] != 'database_manager':
@@ -520,28 +1591,170 @@ def execute_sql():
 
     data = request.json
     sql = data['sql']
+    output = data.get('format', 'json')
+    if output not in ('json', 'ndjson', 'csv'):
+        return jsonify({'success': False, 'message': f'Invalid format: {output}'})
 
-    conn = get_db_connection()
+    # 请求只能在配置的上限之内调小行数和时间预算
+    try:
+        max_rows = min(int(data.get('max_rows') or app.config['SQL_MAX_ROWS']), app.config['SQL_MAX_ROWS'])
+        time_budget = min(float(data.get('time_budget') or app.config['SQL_TIME_BUDGET']),
+                          app.config['SQL_TIME_BUDGET'])
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid max_rows or time_budget'})
+
+    # 管理员 SQL 可能是写语句，使用单独的可写连接
+    conn, release = acquire_stream_connection(writable=True)
+    query = sql_queries.start(conn, sql, time_budget, max(max_rows, 0), user=session.get('username'))
+
+    def finish(status=None, error=None):
+        sql_queries.finish(query, status, error)
+        release()
 
     try:
-        if sql.strip().lower().startswith('select'):
-            result = conn.execute(sql).fetchall()
-            columns = [description[0] for description in conn.description] if conn.description else []
-            conn.close()
-            return jsonify({
-                'success': True,
-                'data': [dict(row) for row in result],
-                'columns': columns
-            })
-        else:
-            # 执行非SELECT语句
-            conn.execute(sql)
-            conn.commit()
-            conn.close()
-            return jsonify({'success': True, 'message': 'SQL executed successfully'})
+        cursor = run_blocking(conn.execute, sql)
+        if cursor.description is None:
+            # 非 SELECT 语句
+            run_blocking(conn.commit)
+            query.rows = max(cursor.rowcount, 0)
+            finish()
+            row_counts.invalidate()
+            reference_cache.invalidate()
+            return jsonify({'success': True, 'message': 'SQL executed successfully', 'query': query.summary()})
+    except sqlite3.Error as e:
+        finish(query.interrupted_status() if 'interrupt' in str(e) else 'error', str(e))
+        return jsonify({'success': False, 'message': f'SQL execution failed: {str(e)}', 'query': query.summary()})
+
+    columns = [description[0] for description in cursor.description]
+
+    if output == 'json':
+        try:
+            rows = run_blocking(lambda: [dict(zip(columns, row)) for row in iter_rows(query, cursor)])
+            # INSERT ... RETURNING 之类的语句读完结果后再提交
+            if query.status == 'running' and conn.in_transaction:
+                run_blocking(conn.commit)
+                reference_cache.invalidate()
+        finally:
+            finish()
+        if query.status != 'completed':
+            return jsonify({'success': False, 'message': f'SQL execution {query.status}: {query.error}',
+                            'query': query.summary()})
+        return jsonify({'success': True, 'data': rows, 'columns': columns, 'query': query.summary()})
+
+    def generate():
+        try:
+            encode = ndjson_chunks if output == 'ndjson' else csv_chunks
+            yield from encode(columns, iter_rows(query, cursor))
+            if query.status == 'running' and conn.in_transaction:
+                conn.commit()
+                reference_cache.invalidate()
+            finish()
+            # NDJSON 的最后一行是执行统计；CSV 的统计通过 X-Query-Id 在 /admin/sql_queries 查询
+            if output == 'ndjson':
+                yield json.dumps({'_summary': query.summary()}) + '\n'
+        finally:
+            finish()
+
+    response = Response(iterate_blocking(generate()),
+                        mimetype='application/x-ndjson' if output == 'ndjson' else 'text/csv')
+    response.headers['X-Query-Id'] = str(query.query_id)
+    # 客户端断开或响应从未开始读取时也要归还连接
+    response.call_on_close(finish)
+    return response
+
+
+# 管理员查看正在执行和最近结束的 SQL
+@app.route('/admin/sql_queries')
+def sql_query_list():
+    if 'user_id' not in session or session['user_type'] != 'database_manager':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    query_id = request.args.get('id', type=int)
+    if query_id is not None:
+        query = sql_queries.get(query_id)
+        if query is None:
+            return jsonify({'success': False, 'message': 'Query not found'})
+        return jsonify({'success': True, 'query': query})
+    return jsonify({'success': True, **sql_queries.snapshot()})
+
+
+# 管理员取消正在执行的 SQL
+@app.route('/admin/cancel_sql', methods=['POST'])
+def cancel_sql():
+    if 'user_id' not in session or session['user_type'] != 'database_manager':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    query_id = request.json.get('query_id')
+    if not sql_queries.cancel(query_id):
+        return jsonify({'success': False, 'message': 'Query not found or already finished'})
+    return jsonify({'success': True, 'message': 'Cancellation requested'})
+
+
+# 管理员导出表数据（CSV/NDJSON 流式输出，可筛选、gzip 压缩、按主键续传）
+@app.route('/admin/export')
+def export_table():
+    if 'user_id' not in session or session['user_type'] != 'database_manager':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    table = request.args.get('table', '')
+    output = request.args.get('format', 'csv')
+    compress = request.args.get('gzip') == '1'
+    if output not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'message': f'Invalid format: {output}'})
+
+    after_pk = request.args.get('after_pk')
+    upper_pk = request.args.get('upper_pk')
+    # 导出 trip_requests 时默认包括已归档的行程（archive=0 只导出热表）
+    archived = table == 'trip_requests' and request.args.get('archive') != '0'
+
+    def start(conn, options, upper_pk):
+        schema = table_schema(conn, table)
+        # 整个导出在一个读事务中完成，看到的是同一个快照
+        conn.execute('BEGIN')
+        if archived:
+            schema = dict(schema, table='trip_requests_all')
+            if upper_pk is None:
+                upper_pk = conn.execute('''
+                    SELECT MAX(rid) FROM (SELECT MAX(rid) AS rid FROM trip_requests
+                                          UNION ALL SELECT MAX(rid) FROM trip_requests_archive)
+                ''').fetchone()[0]
+        return (schema, *export_rows(
+            conn, schema,
+            columns=options['columns'],
+            search=options['search'],
+            search_column=options['search_column'],
+            exact=options['exact'],
+            case_sensitive=options['case_sensitive'],
+            after_pk=after_pk,
+            upper_pk=upper_pk
+        ))
+
+    conn, release = acquire_stream_connection()
+    try:
+        schema, columns, rows, upper_pk = run_blocking(start, conn, _browse_options(), upper_pk)
     except Exception as e:
-        conn.close()
-        return jsonify({'success': False, 'message': f'SQL execution failed: {str(e)}'})
+        release()
+        return jsonify({'success': False, 'message': f'Export failed: {str(e)}'})
+
+    def generate():
+        try:
+            chunks = ndjson_chunks(columns, rows) if output == 'ndjson' else csv_chunks(columns, rows)
+            yield from gzip_chunks(chunks) if compress else chunks
+        finally:
+            release()
+
+    filename = f"{table}.{output}{'.gz' if compress else ''}"
+    if compress:
+        mimetype = 'application/gzip'
+    else:
+        mimetype = 'application/x-ndjson' if output == 'ndjson' else 'text/csv'
+    response = Response(iterate_blocking(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # 续传时带上 after_pk=已收到的最后一个主键 和 upper_pk=这个值
+    response.headers['X-Export-Primary-Key'] = columns[0] if schema['pk'] == 'rowid' else schema['pk']
+    response.headers['X-Export-Upper-Pk'] = '' if upper_pk is None else str(upper_pk)
+    response.call_on_close(release)
+    return response
 
 
 # 管理员数据操作 - 添加记录
@@ -554,24 +1767,57 @@ def add_record():
     table = data['table']
     record_data = data['data']
 
-    conn = get_db_connection()
-
     try:
         columns = ', '.join(record_data.keys())
         placeholders = ', '.join(['?' for _ in record_data])
         values = list(record_data.values())
 
         sql = f'INSERT INTO {table} ({columns}) VALUES ({placeholders})'
-        conn.execute(sql, values)
-        conn.commit()
-        conn.close()
+        run_write(lambda conn: conn.execute(sql, values))
+        row_counts.invalidate(table)
+        reference_cache.invalidate(table)
 
         return jsonify({'success': True, 'message': 'Record added successfully'})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'message': f'Failed to add record: {str(e)}'})
 
 
+# 管理员批量导入（CSV/NDJSON，分块 executemany，返回逐行错误报告）
+@app.route('/admin/import', methods=['POST'])
+def import_data():
+    if 'user_id' not in session or session['user_type'] != 'database_manager':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    table = request.args.get('table', '')
+    data_format = request.args.get('format', 'csv')
+    dry_run = request.args.get('dry_run') == '1'
+    # 可以上传文件（multipart 的 file 字段），也可以直接把数据放在请求体中
+    upload = request.files.get('file')
+    body = upload.stream if upload else request.stream
+    if not upload and app.config['BLOCKING_EXECUTOR'] is not None:
+        # 导入在执行器的线程中进行，gevent 的 socket 只能在当前线程读取，先把请求体读到临时文件
+        body = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        shutil.copyfileobj(request.stream, body)
+        body.seek(0)
+    stream = open_text(body)
+
+    # 导入自己分事务提交，不经过写线程
+    conn = open_write_connection()
+    try:
+        report = run_blocking(lambda: import_records(conn, table, read_records(stream, data_format),
+                                                     chunk_size=app.config['IMPORT_CHUNK_ROWS'],
+                                                     transaction_rows=app.config['IMPORT_TRANSACTION_ROWS'],
+                                                     dry_run=dry_run))
+        conn.close()
+    except Exception as e:
+        conn.close()
+        return jsonify({'success': False, 'message': f'Import failed: {str(e)}'})
+
+    row_counts.invalidate(table)
+    reference_cache.invalidate(table)
+    return jsonify({'success': True, **report})
+
+
 # 管理员数据操作 - 更新记录
 @app.route('/admin/update_record', methods=['POST'])
 def update_record():
@@ -584,21 +1830,17 @@ def update_record():
     record_data = data['data']
     id_column = data.get('id_column', 'id')  # 默认使用'id'作为主键列名
 
-    conn = get_db_connection()
-
     try:
         set_clause = ', '.join([f'{key} = ?' for key in record_data.keys()])
         values = list(record_data.values())
         values.append(record_id)
 
         sql = f'UPDATE {table} SET {set_clause} WHERE {id_column} = ?'
-        conn.execute(sql, values)
-        conn.commit()
-        conn.close()
+        run_write(lambda conn: conn.execute(sql, values))
+        reference_cache.invalidate(table)
 
         return jsonify({'success': True, 'message': 'Record updated successfully'})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'message': f'Failed to update record: {str(e)}'})
 
 
@@ -613,17 +1855,14 @@ def delete_record():
     record_id = data['id']
     id_column = data.get('id_column', 'id')  # 默认使用'id'作为主键列名
 
-    conn = get_db_connection()
-
     try:
         sql = f'DELETE FROM {table} WHERE {id_column} = ?'
-        conn.execute(sql, (record_id,))
-        conn.commit()
-        conn.close()
+        run_write(lambda conn: conn.execute(sql, (record_id,)))
+        row_counts.invalidate(table)
+        reference_cache.invalidate(table)
 
         return jsonify({'success': True, 'message': 'Record deleted successfully'})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'message': f'Failed to delete record: {str(e)}'})
 
 
@@ -636,14 +1875,14 @@ def cancel_request():
     data = request.json
     request_id = data.get('request_id')
 
-    conn = get_db_connection()
-    try:
+    def unit(conn):
         # 1. 检查申请当前的状态
-        cur = conn.execute('SELECT current_status FROM trip_requests WHERE rid = ?', (request_id,))
+        cur = conn.execute('SELECT current_status, eid, approved_by, assigned_eid FROM trip_requests WHERE rid = ?',
+                           (request_id,))
         row = cur.fetchone()
 
         if not row:
-            return jsonify({'success': False, 'message': 'Request not found'})
+            return row, 'Request not found'
 
         current_status = row['current_status']
 
@@ -651,19 +1890,23 @@ def cancel_request():
         allowed_statuses = ['pending', 'approved', 'assigned']
 
         if current_status.lower() not in allowed_statuses:
-            return jsonify({'success': False, 'message': f'Cannot cancel request in "{current_status}" status'})
+            return row, f'Cannot cancel request in "{current_status}" status'
 
         # 3. 执行更新
         conn.execute("UPDATE trip_requests SET current_status = 'cancelled' WHERE rid = ?", (request_id,))
-        conn.commit()
+        return row, None
+
+    try:
+        row, error = run_write(unit)
+        if error:
+            return jsonify({'success': False, 'message': error})
+        publish_trip_event('cancelled', request_id, 'cancelled', requester=row['eid'],
+                           approver=row['approved_by'], driver=row['assigned_eid'])
 
         return jsonify({'success': True, 'message': 'Request cancelled successfully'})
 
     except Exception as e:
-        conn.rollback()
         return jsonify({'success': False, 'message': str(e)})
-    finally:
-        conn.close()
 
 
 # 注册页面
@@ -748,28 +1991,233 @@ def register():
         user_type = role_to_utype.get(employee['role'], 'normal')
 
         # 插入新用户并获取生成的UID
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO users (username, password, eid, utype)
-            VALUES (?, ?, ?, ?)
-        ''', (username, password, eid, user_type))
-
-        # 获取新创建用户的UID
-        new_uid = cursor.lastrowid
-
-        conn.commit()
+        def unit(conn):
+            cursor = conn.execute('''
+                INSERT INTO users (username, password, eid, utype)
+                VALUES (?, ?, ?, ?)
+            ''', (username, password, eid, user_type))
+            return cursor.lastrowid
+
+        # 获取新创建用户的UID（用户名唯一约束由数据库保证）
+        new_uid = run_write(unit)
         conn.close()
 
         return render_template('register.html',
                                success=f'Account created successfully! Your User ID is: {new_uid}. You can now login with this ID.')
 
     except Exception as e:
-        conn.rollback()
         conn.close()
         return render_template('register.html',
                                error=f'Registration failed: {str(e)}')
 
 
+# 管理员查看运行指标
+@app.route('/admin/metrics')
+def admin_metrics():
+    if 'user_id' not in session or session['user_type'] != 'database_manager':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    return jsonify({
+        'success': True,
+        'pool': get_pool().stats(),
+        'driver_calendar': driver_bookings.stats(),
+        'vehicle_calendar': vehicle_bookings.stats(),
+        'approver_router': approver_router.stats(),
+        'reference_cache': reference_cache.stats(),
+        'page_cache': page_cache.stats(),
+        'event_bus': event_bus.stats(),
+        'archiver': archiver.stats(),
+        'writer': writer.stats(),
+        'assignment': dict(assignment_stats),
+        'sql': dict(sql_metrics.summary(), enabled=app.config['SQL_INSTRUMENTATION'])
+    })
+
+
+# 管理员查看每个端点的 SQL 统计、延迟直方图和慢查询日志
+@app.route('/admin/sql_metrics')
+def admin_sql_metrics():
+    if 'user_id' not in session or session['user_type'] != 'database_manager':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    top = min(request.args.get('top', 50, type=int), 500)
+    return jsonify({
+        'success': True,
+        'enabled': app.config['SQL_INSTRUMENTATION'],
+        **sql_metrics.snapshot(top=top)
+    })
+
+
+# 管理员清空 SQL 统计
+@app.route('/admin/sql_metrics/reset', methods=['POST'])
+def reset_sql_metrics():
+    if 'user_id' not in session or session['user_type'] != 'database_manager':
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    sql_metrics.reset()
+    return jsonify({'success': True, 'message': 'SQL metrics reset'})
+
+
+# 命令行：flask --app app migrate
+@app.cli.command('migrate')
+def migrate_command():
+    """执行尚未应用的数据库迁移"""
+    conn = open_cli_connection(auto_migrate=False)
+    try:
+        applied = migrations.apply_migrations(conn)
+        print(f"Applied migrations: {applied or 'none'}")
+        print(f"Schema version: {migrations.current_version(conn)}")
+    finally:
+        conn.close()
+
+
+# 命令行：flask --app app check-indexes，有查询未走索引时以非零状态退出
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """检查热点查询的 EXPLAIN QUERY PLAN 是否都使用了索引"""
+    conn = open_cli_connection(query_only=True)
+    try:
+        problems = migrations.check_query_plans(conn)
+    finally:
+        conn.close()
+
+    for name in migrations.HOT_QUERIES:
+        print(f"{'FAIL' if name in problems else 'ok':4}  {name}")
+        for step in problems.get(name, []):
+            print(f"      {step}")
+    if problems:
+        raise SystemExit(1)
+
+
+# 命令行：flask --app app rebuild-stats，按现有行程重建 trip_stats（回填或修复统计）
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """按 trip_requests 全量重建行程统计表 trip_stats"""
+    conn = open_cli_connection()
+    try:
+        rows = trip_stats.rebuild(conn)
+    finally:
+        conn.close()
+    print(f"Rebuilt trip_stats: {rows} rows")
+
+
+# 命令行：flask --app app rebuild-usage，按全部行程读数重建 vehicle_daily_usage
+@app.cli.command('rebuild-usage')
+def rebuild_usage_command():
+    """按 trip_telemetry 全量重建每辆车每天的里程和耗油量"""
+    conn = open_cli_connection()
+    try:
+        rows = telemetry.rebuild(conn)
+    finally:
+        conn.close()
+    print(f"Rebuilt vehicle_daily_usage: {rows} rows")
+
+
+# 命令行：flask --app app rebuild-search，按全部行程（包括已归档的）重建全文索引
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """按 trip_requests 和 trip_requests_archive 全量重建全文索引 trip_search"""
+    conn = open_cli_connection()
+    try:
+        trips = search.rebuild(conn)
+    finally:
+        conn.close()
+    print(f"Rebuilt trip_search: {trips} trips indexed")
+
+
+# 命令行：flask --app app archive-trips，立即把旧的已结束行程移到归档表
+@app.cli.command('archive-trips')
+@click.option('--days', type=int, default=None, help='Archive finished trips that ended more than this many days ago')
+@click.option('--batch-size', type=int, default=None, help='Trips moved per transaction')
+@click.option('--max-batches', type=int, default=None, help='Stop after this many batches')
+def archive_trips_command(days, batch_size, max_batches):
+    """把结束超过 ARCHIVE_AFTER_DAYS 天的已结束行程分批移到 trip_requests_archive"""
+    runner = Archiver(after_days=app.config['ARCHIVE_AFTER_DAYS'] if days is None else days,
+                      batch_size=batch_size or app.config['ARCHIVE_BATCH_SIZE'], interval=0)
+    conn = open_cli_connection()
+    try:
+        moved = runner.run_pass(lambda unit: run_in_transaction(conn, unit), max_batches=max_batches)
+    finally:
+        conn.close()
+    print(f"Archived {moved} trips that ended before {runner.cutoff()}")
+
+
+# 命令行：flask --app app import-data TABLE FILE，批量导入 CSV/NDJSON
+@app.cli.command('import-data')
+@click.argument('table')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'data_format', type=click.Choice(['csv', 'ndjson']),
+              help='defaults to the file extension')
+@click.option('--chunk-size', type=int, default=None, help='rows per executemany')
+@click.option('--transaction-rows', type=int, default=None, help='rows per transaction')
+@click.option('--dry-run', is_flag=True, help='validate and insert, then roll back')
+def import_data_command(table, path, data_format, chunk_size, transaction_rows, dry_run):
+    """批量导入 CSV/NDJSON 文件，并输出逐行错误报告"""
+    data_format = data_format or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    conn = open_cli_connection()
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            report = import_records(conn, table, read_records(f, data_format),
+                                    chunk_size=chunk_size or app.config['IMPORT_CHUNK_ROWS'],
+                                    transaction_rows=transaction_rows or app.config['IMPORT_TRANSACTION_ROWS'],
+                                    dry_run=dry_run)
+    finally:
+        conn.close()
+
+    for error in report['errors']:
+        print(f"row {error['row']}: {'; '.join(error['errors'])}")
+    print(f"{report['inserted']} inserted, {report['failed']} failed, {report['rows']} rows read "
+          f"in {report['elapsed_ms']:.0f} ms ({report['transactions']} transactions)"
+          f"{' [dry run, rolled back]' if dry_run else ''}")
+    if report['failed']:
+        raise SystemExit(1)
+
+
+def _event_topics(conn):
+    """当前用户可以订阅的事件主题"""
+    user_type = session['user_type']
+    if user_type == 'approver':
+        return [f"approver:{session['user_id']}"]
+    if user_type == 'database_manager':
+        return ['trips']
+    eid = reference_cache.user(conn, session['user_id'])['eid']
+    return [f'driver:{eid}'] if user_type == 'driver' else [f'requester:{eid}']
+
+
+# 行程变化推送（Server-Sent Events）；断线后浏览器带 Last-Event-ID 重连，期间的事件会补发
+@app.route('/events')
+def event_stream():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized access'})
+
+    conn = get_db_connection()
+    topics = _event_topics(conn)
+    # 长连接期间不占用数据库连接
+    conn.close()
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        subscription = event_bus.subscribe(topics, last_event_id=last_event_id)
+    except EventBusFull as e:
+        return jsonify({'success': False, 'message': str(e)}), 503
+
+    heartbeat = app.config['EVENT_STREAM_HEARTBEAT']
+    max_duration = app.config['EVENT_STREAM_MAX_DURATION']
+
+    def generate():
+        try:
+            yield f'retry: {int(heartbeat * 1000)}\n\n'
+            yield from subscription.stream(heartbeat=heartbeat, max_duration=max_duration)
+        finally:
+            subscription.close()
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # 反向代理（nginx）不要缓冲事件
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(subscription.close)
+    return response
+
+
 # 注销
 @app.route('/logout')
 def logout():
@@ -0,0 +1,148 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from write_queue import start_daemon_thread
+
+# 只归档这些已结束的状态，进行中的行程始终留在 trip_requests
+ARCHIVED_STATUSES = ('completed', 'rejected', 'cancelled')
+# 两张表共有的列（trip_requests_all 视图也是这些列）
+TRIP_COLUMNS = ('rid', 'eid', 'purpose', 'destination', 'start_time', 'end_time', 'passenger_number',
+                'current_status', 'approved_by', 'assigned_vid', 'assigned_eid', 'created_at', 'notes',
+                'rejection_reason')
+
+
+def trip_source(statuses):
+    """查询这些状态的行程应读取的表：可能已归档时读取 trip_requests_all 视图，否则只读热表"""
+    return 'trip_requests_all' if any(status in ARCHIVED_STATUSES for status in statuses) else 'trip_requests'
+
+
+def archive_batch(conn, cutoff, batch_size):
+    """把最多 batch_size 条在 cutoff 之前结束的已结束行程移到 trip_requests_archive，返回移动的行数
+
+    这是一个写单元：复制和删除在调用者的同一个事务中完成，读者不会看到同一行程出现两次或消失。
+    """
+    rids = [row[0] for row in conn.execute(f'''
+        SELECT rid FROM trip_requests
+        WHERE current_status IN ({', '.join('?' for _ in ARCHIVED_STATUSES)}) AND end_time < ?
+        LIMIT ?
+    ''', (*ARCHIVED_STATUSES, cutoff, batch_size))]
+    if not rids:
+        return 0
+
+    placeholders = ', '.join('?' for _ in rids)
+    columns = ', '.join(TRIP_COLUMNS)
+    conn.execute(f'''
+        INSERT INTO trip_requests_archive ({columns}, archived_at)
+        SELECT {columns}, ? FROM trip_requests WHERE rid IN ({placeholders})
+    ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), *rids))
+    conn.execute(f'DELETE FROM trip_requests WHERE rid IN ({placeholders})', rids)
+    return len(rids)
+
+
+def restore_trips(conn, rids):
+    """把已归档的行程 rids 移回 trip_requests（例如需要更正时），返回移动的行数
+
+    与 archive_batch 相反的写单元：先插入热表再从归档表删除，trip_stats 和 trip_search 不变。
+    """
+    if not rids:
+        return 0
+    placeholders = ', '.join('?' for _ in rids)
+    columns = ', '.join(TRIP_COLUMNS)
+    conn.execute(f'''
+        INSERT INTO trip_requests ({columns})
+        SELECT {columns} FROM trip_requests_archive WHERE rid IN ({placeholders})
+    ''', rids)
+    return conn.execute(f'DELETE FROM trip_requests_archive WHERE rid IN ({placeholders})', rids).rowcount
+
+
+class Archiver:
+    """把结束超过 after_days 天的行程分批移到归档表，热表只保留近期和进行中的行程
+
+    每批是一个写单元，批之间暂停 pause 秒让出写线程；start() 启动的后台线程每
+    interval 秒通过写线程执行一轮，也可以用 flask archive-trips 手动执行。
+    """
+
+    def __init__(self, after_days=180, batch_size=1000, interval=3600.0, pause=0.05):
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pause = pause
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._started = False
+        self._running = False
+        self.passes = 0
+        self.archived = 0
+        self.errors = 0
+        self.last_run = None
+        self.last_archived = 0
+        self.last_error = None
+
+    def cutoff(self, now=None):
+        return ((now or datetime.now()) - timedelta(days=self.after_days)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def run_pass(self, run, max_batches=None):
+        """执行一轮归档（直到没有可归档的行程或达到 max_batches 批），返回移动的行数
+
+        run(unit) 在一个事务中执行写单元并返回它的结果（WriteQueue.submit 或 run_in_transaction）。
+        """
+        with self._lock:
+            cutoff = self.cutoff()
+            moved = batches = 0
+            try:
+                while max_batches is None or batches < max_batches:
+                    count = run(lambda conn: archive_batch(conn, cutoff, self.batch_size))
+                    if not count:
+                        break
+                    moved += count
+                    batches += 1
+                    if self.pause:
+                        time.sleep(self.pause)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                raise
+            finally:
+                self.passes += 1
+                self.archived += moved
+                self.last_archived = moved
+                self.last_run = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            return moved
+
+    def start(self, writer, spawn=start_daemon_thread):
+        """启动后台归档线程，通过写线程 writer 执行（interval 不大于 0 时不启动）
+
+        spawn(target, name) 启动执行 target() 的线程，同 WriteQueue.start。
+        """
+        if self.interval <= 0 or self._started:
+            return
+        self._started = self._running = True
+        spawn(lambda: self._run(writer), 'trip-archiver')
+
+    def _run(self, writer):
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    self.run_pass(writer.submit)
+                except Exception:
+                    pass  # 已记录在 errors / last_error 中，下一轮重试
+        finally:
+            self._running = False
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            'after_days': self.after_days,
+            'batch_size': self.batch_size,
+            'interval': self.interval,
+            'running': self._running,
+            'passes': self.passes,
+            'archived': self.archived,
+            'last_run': self.last_run,
+            'last_archived': self.last_archived,
+            'errors': self.errors,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,474 @@
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+from scheduling import find_overlaps, find_double_bookings
+
+
+def random_trips(n, drivers=1, vehicles=None, seed=42):
+    """生成 n 条随机行程（时间格式与数据库一致），用于基准测试"""
+    rng = random.Random(seed)
+    base = datetime(2025, 1, 1)
+    span_hours = max(n * 6 // max(drivers, 1), 24)
+    trips = []
+    for rid in range(1, n + 1):
+        start = base + timedelta(hours=rng.randint(0, span_hours))
+        end = start + timedelta(hours=rng.randint(1, 48))
+        trips.append({
+            'rid': rid,
+            'assigned_eid': rng.randint(1, drivers),
+            'assigned_vid': rng.randint(1, vehicles or drivers),
+            'start_time': start.strftime('%Y-%m-%d %H:%M:%S'),
+            'end_time': end.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+    return trips
+
+
+def naive_overlaps(intervals):
+    """原来的两两比较写法，作为对照"""
+    pairs = []
+    for i, (start_a, end_a, key_a) in enumerate(intervals):
+        for start_b, end_b, key_b in intervals[i + 1:]:
+            if start_a <= end_b and end_a >= start_b:
+                pairs.append((key_a, key_b))
+    return pairs
+
+
+def timed(func, *args, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_conflicts(args):
+    """单个司机的冲突检测：扫描线 vs 两两比较"""
+    results = []
+    print(f"{'trips':>8} {'sweep ms':>10} {'ns/(n log n)':>13} {'naive ms':>10} {'pairs':>8}")
+    for n in args.sizes:
+        trips = random_trips(n, seed=args.seed)
+        intervals = [(t['start_time'], t['end_time'], t['rid']) for t in trips]
+
+        sweep_time, pairs = timed(find_overlaps, intervals)
+        naive_time = None
+        if n <= args.naive_limit:
+            naive_time, naive_pairs = timed(naive_overlaps, intervals, repeat=1)
+            assert len(naive_pairs) == len(pairs), 'sweep-line and naive results differ'
+
+        per_nlogn = sweep_time * 1e9 / (n * math.log2(n))
+        results.append({
+            'trips': n,
+            'sweep_ms': round(sweep_time * 1000, 3),
+            'sweep_ns_per_nlogn': round(per_nlogn, 2),
+            'naive_ms': round(naive_time * 1000, 3) if naive_time is not None else None,
+            'pairs': len(pairs),
+        })
+        naive_text = f"{naive_time * 1000:10.2f}" if naive_time is not None else f"{'-':>10}"
+        print(f"{n:>8} {sweep_time * 1000:10.2f} {per_nlogn:13.2f} {naive_text} {len(pairs):>8}")
+
+    # 全车队一次扫描
+    fleet = random_trips(args.fleet_trips, drivers=args.fleet_drivers,
+                         vehicles=args.fleet_vehicles, seed=args.seed)
+    fleet_time, bookings = timed(find_double_bookings, fleet)
+    print(f"\nfleet: {args.fleet_trips} trips, {args.fleet_drivers} drivers, "
+          f"{args.fleet_vehicles} vehicles -> {fleet_time * 1000:.2f} ms, "
+          f"{len(bookings['assigned_eid'])} double-booked drivers, "
+          f"{len(bookings['assigned_vid'])} double-booked vehicles")
+
+    return {'conflicts': results,
+            'fleet': {'trips': args.fleet_trips, 'ms': round(fleet_time * 1000, 3),
+                      'drivers_double_booked': len(bookings['assigned_eid']),
+                      'vehicles_double_booked': len(bookings['assigned_vid'])}}
+
+
+# ---------------- 接口压测（python bench.py endpoints ...） ----------------
+
+# 每种角色的操作及其相对权重
+ROLE_ACTIONS = {
+    'normal': [('user_dashboard', 5), ('user_trips', 2), ('new_request', 2)],
+    'approver': [('approver_dashboard', 3), ('approver_requests', 3), ('process_request', 2)],
+    'driver': [('driver_dashboard', 4), ('driver_trips', 2), ('update_trip_status', 1)],
+    'database_manager': [('admin_dashboard', 2), ('admin_table_rows', 2), ('admin_conflicts', 1),
+                         ('admin_metrics', 1)],
+}
+LOCK_MARKERS = ('database is locked', 'database table is locked', 'busy', 'no database connection available')
+
+
+class InProcessClient:
+    """直接调用 Flask 应用（不经过网络），异常原样抛出以便区分锁错误"""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, json_body=None, form=None):
+        response = self._client.open(path, method=method, json=json_body, data=form)
+        return response.status_code, response.get_data()
+
+
+class HttpClient:
+    """通过 HTTP 访问正在运行的服务器（保存登录 cookie）"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, json_body=None, form=None):
+        headers = {}
+        data = None
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self._opener.open(req, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class SimulatedUser:
+    """一个登录后的模拟用户，按权重随机执行本角色的操作"""
+
+    def __init__(self, client, role, account, rng, trip_ids=()):
+        self.client = client
+        self.role = role
+        self.account = account
+        self.rng = rng
+        self.pending = []                  # 审批员：最近看到的待审批请求
+        self.trip_ids = list(trip_ids)     # 司机：可以开始的已分配行程
+        names, weights = zip(*ROLE_ACTIONS[role])
+        self._names = names
+        self._cum_weights = [sum(weights[:i + 1]) for i in range(len(weights))]
+
+    def login(self):
+        uid, username, password = self.account
+        status, _ = self.client.request('POST', '/login', form={
+            'username': username, 'password': password, 'user_id': uid, 'user_type': self.role})
+        if status >= 400:
+            raise RuntimeError(f'login failed for {username}: HTTP {status}')
+
+    def choose(self):
+        """按权重选出下一个操作（没有可处理的数据时退回到只读操作）"""
+        action = self.rng.choices(self._names, cum_weights=self._cum_weights)[0]
+        if action == 'process_request' and not self.pending:
+            action = 'approver_requests'
+        if action == 'update_trip_status' and not self.trip_ids:
+            action = 'driver_dashboard'
+        return action
+
+    def perform(self, action):
+        """执行操作，返回 (HTTP 状态, 响应体)"""
+        return getattr(self, '_' + action)()
+
+    def _get(self, path):
+        return self.client.request('GET', path)
+
+    def _user_dashboard(self):
+        return self._get('/user/dashboard')
+
+    def _user_trips(self):
+        return self._get('/user/trips?status=rejected,completed,cancelled&html=1')
+
+    def _new_request(self):
+        start = datetime.now() + timedelta(days=self.rng.randint(1, 30), hours=self.rng.randint(0, 23))
+        end = start + timedelta(hours=self.rng.randint(1, 6))
+        return self.client.request('POST', '/user/new_request', json_body={
+            'purpose': self.rng.choice(['business trip', 'company tour', 'cargo transport', 'client pickup']),
+            'destination': 'Benchmark destination',
+            'start_time': start.strftime('%Y-%m-%d %H:00:00'),
+            'end_time': end.strftime('%Y-%m-%d %H:00:00'),
+            'passenger_number': self.rng.randint(1, 6),
+            'notes': '',
+        })
+
+    def _approver_dashboard(self):
+        return self._get('/approver/dashboard')
+
+    def _approver_requests(self):
+        status = 'pending' if not self.pending else self.rng.choice(['pending', 'completed', 'rejected'])
+        code, body = self._get(f'/approver/requests?status={status}&limit=20')
+        if status == 'pending' and code == 200:
+            try:
+                self.pending = [item['rid'] for item in json.loads(body).get('requests', [])]
+            except ValueError:
+                pass
+        return code, body
+
+    def _process_request(self):
+        rid = self.pending.pop(self.rng.randrange(len(self.pending)))
+        approve = self.rng.random() < 0.7
+        return self.client.request('POST', '/approver/process_request', json_body={
+            'request_id': rid,
+            'action': 'approve' if approve else 'reject',
+            'reject_reason': '' if approve else 'Benchmark rejection',
+        })
+
+    def _driver_dashboard(self):
+        return self._get('/driver/dashboard')
+
+    def _driver_trips(self):
+        return self._get('/driver/trips?status=completed,cancelled&html=1')
+
+    def _update_trip_status(self):
+        return self.client.request('POST', '/driver/update_trip_status', json_body={
+            'trip_id': self.trip_ids.pop(), 'status': 'in_progress'})
+
+    def _admin_dashboard(self):
+        return self._get('/admin/dashboard?table=trip_requests')
+
+    def _admin_table_rows(self):
+        sort = self.rng.choice(['rid', 'start_time', 'destination'])
+        return self._get(f'/admin/table_rows?table=trip_requests&sort={sort}&dir=desc&limit=50')
+
+    def _admin_conflicts(self):
+        return self._get('/admin/conflicts')
+
+    def _admin_metrics(self):
+        return self._get('/admin/metrics')
+
+
+def classify(status, body):
+    """把一次响应归类为 ok / rejected（业务上的失败）/ lock_error / error"""
+    text = body[:2000].decode('utf-8', 'replace').lower()
+    if any(marker in text for marker in LOCK_MARKERS):
+        return 'lock_error'
+    if status >= 400:
+        return 'error'
+    if text.startswith('{') and '"success": false' in text.replace('"success":false', '"success": false'):
+        return 'rejected'
+    return 'ok'
+
+
+def percentile(sorted_values, p):
+    """最近秩法百分位数"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for _, latency, _ in samples)
+    outcomes = {}
+    for _, _, outcome in samples:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else None,
+        'ok': outcomes.get('ok', 0),
+        'rejected': outcomes.get('rejected', 0),
+        'lock_errors': outcomes.get('lock_error', 0),
+        'errors': outcomes.get('error', 0),
+    }
+
+
+def _load_accounts(database, rng):
+    """从数据库读取每种角色的在职账号，以及每个司机可以开始的行程"""
+    conn = sqlite3.connect(database)
+    accounts = {}
+    for uid, username, password, utype in conn.execute('''
+        SELECT u.uid, u.username, u.password, u.utype
+        FROM users u JOIN employees e ON u.eid = e.eid
+        WHERE u.u_is_active = 1 AND e.e_is_active = 1
+    '''):
+        accounts.setdefault(utype, []).append((uid, username, password))
+    driver_trips = {}
+    for uid, rid in conn.execute('''
+        SELECT u.uid, tr.rid
+        FROM trip_requests tr JOIN users u ON u.eid = tr.assigned_eid
+        WHERE tr.current_status = 'assigned' AND u.utype = 'driver'
+    '''):
+        driver_trips.setdefault(uid, []).append(rid)
+    conn.close()
+    for users in accounts.values():
+        rng.shuffle(users)
+    return accounts, driver_trips
+
+
+def _build_database(args):
+    """用 seed.py 的 scale 模式生成压测数据库；文件不存在时先复制项目数据库的表结构"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    if not os.path.exists(args.database):
+        source = sqlite3.connect(os.path.join(here, '5003project.db'))
+        target = sqlite3.connect(args.database)
+        source.backup(target)
+        source.close()
+        target.close()
+    command = [sys.executable, os.path.join(here, 'seed.py'),
+               '--scale', '--database', args.database, '--seed', str(args.seed),
+               '--employees', str(args.employees), '--vehicles', str(args.vehicles),
+               '--trips', str(args.trips)]
+    print('Building benchmark database:', ' '.join(command[1:]))
+    subprocess.run(command, check=True)
+
+
+def bench_endpoints(args):
+    """多个角色的模拟用户并发访问接口，统计延迟分位数、吞吐量和锁错误"""
+    if args.build or (not args.url and not os.path.exists(args.database)):
+        _build_database(args)
+
+    rng = random.Random(args.seed)
+    accounts, driver_trips = _load_accounts(args.database, rng)
+    concurrency = {}
+    for item in args.users:
+        role, _, count = item.partition('=')
+        if role not in ROLE_ACTIONS:
+            raise SystemExit(f'Unknown role: {role}')
+        concurrency[role] = int(count)
+
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+        app_module = None
+    else:
+        import app as app_module
+        app_module.DATABASE = args.database
+        app_module.app.config['DB_POOL_SIZE'] = args.pool_size
+        # 让异常直接抛出，才能区分 "database is locked" 和其他服务器错误
+        app_module.app.config['PROPAGATE_EXCEPTIONS'] = True
+        app_module.app.config['SQL_INSTRUMENTATION'] = args.sql_metrics
+        make_client = lambda: InProcessClient(app_module.app)
+
+    users = []
+    for role, count in concurrency.items():
+        if not accounts.get(role):
+            raise SystemExit(f'No active {role} accounts in {args.database}')
+        for i in range(count):
+            account = accounts[role][i % len(accounts[role])]
+            user = SimulatedUser(make_client(), role, account, random.Random(f'{args.seed}:{role}:{i}'),
+                                 driver_trips.get(account[0], ()) if i < len(accounts[role]) else ())
+            user.login()
+            users.append(user)
+
+    samples = {id(user): [] for user in users}
+    start_barrier = threading.Barrier(len(users) + 1)
+    timing = {}
+
+    def run(user):
+        records = samples[id(user)]
+        start_barrier.wait()
+        while time.perf_counter() < timing['end']:
+            action = user.choose()
+            started = time.perf_counter()
+            try:
+                status, body = user.perform(action)
+                outcome = classify(status, body)
+            except Exception as e:
+                outcome = 'lock_error' if any(m in str(e).lower() for m in LOCK_MARKERS) else 'error'
+            finished = time.perf_counter()
+            if started >= timing['measure_from']:
+                records.append((f'{user.role}.{action}', finished - started, outcome))
+            if args.think_ms:
+                time.sleep(user.rng.uniform(0, 2 * args.think_ms) / 1000)
+
+    threads = [threading.Thread(target=run, args=(user,), daemon=True) for user in users]
+    for thread in threads:
+        thread.start()
+    now = time.perf_counter()
+    timing['measure_from'] = now + args.warmup
+    timing['end'] = now + args.warmup + args.duration
+    start_barrier.wait()
+    print(f"Running {len(users)} simulated users for {args.duration}s "
+          f"(+{args.warmup}s warm-up) against {args.url or args.database}...")
+    if app_module is not None and args.sql_metrics:
+        # 预热阶段的统计不计入结果
+        time.sleep(max(0.0, timing['measure_from'] - time.perf_counter()))
+        app_module.sql_metrics.reset()
+    for thread in threads:
+        thread.join()
+
+    all_samples = [sample for records in samples.values() for sample in records]
+    by_endpoint = {}
+    for sample in all_samples:
+        by_endpoint.setdefault(sample[0], []).append(sample)
+
+    results = {
+        'config': {'database': args.database, 'url': args.url, 'users': concurrency,
+                   'duration_s': args.duration, 'warmup_s': args.warmup, 'think_ms': args.think_ms},
+        'total': summarize(all_samples, args.duration),
+        'endpoints': {name: summarize(items, args.duration) for name, items in sorted(by_endpoint.items())},
+    }
+    if app_module is not None:
+        results['pool'] = app_module.get_pool().stats()
+        results['writer'] = app_module.writer.stats()
+        results['assignment'] = dict(app_module.assignment_stats)
+        if args.sql_metrics:
+            results['sql'] = app_module.sql_metrics.snapshot()
+
+    print(f"\n{'endpoint':<34} {'reqs':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} "
+          f"{'rej':>5} {'lock':>5} {'err':>5}")
+    for name, row in list(results['endpoints'].items()) + [('TOTAL', results['total'])]:
+        print(f"{name:<34} {row['requests']:>7} {row['throughput_rps']:>8} {row['p50_ms']!s:>8} "
+              f"{row['p95_ms']!s:>8} {row['p99_ms']!s:>8} {row['rejected']:>5} {row['lock_errors']:>5} "
+              f"{row['errors']:>5}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vehicle Management System benchmarks')
+    parser.add_argument('--output', help='write machine-readable results to this JSON file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    conflicts = subparsers.add_parser('conflicts', help='trip conflict detection scaling')
+    conflicts.add_argument('--sizes', type=int, nargs='+', default=[500, 1000, 2000, 4000, 8000, 16000])
+    conflicts.add_argument('--naive-limit', type=int, default=4000,
+                           help='largest size the O(n^2) reference is run for')
+    conflicts.add_argument('--fleet-trips', type=int, default=100000)
+    conflicts.add_argument('--fleet-drivers', type=int, default=500)
+    conflicts.add_argument('--fleet-vehicles', type=int, default=400)
+    conflicts.add_argument('--seed', type=int, default=42)
+    conflicts.set_defaults(func=bench_conflicts)
+
+    endpoints = subparsers.add_parser('endpoints', help='concurrent load test of the HTTP endpoints')
+    endpoints.add_argument('--database', default='bench.db',
+                           help='database to test against (built with seed.py --scale if missing)')
+    endpoints.add_argument('--build', action='store_true', help='rebuild the database before running')
+    endpoints.add_argument('--employees', type=int, default=5000)
+    endpoints.add_argument('--vehicles', type=int, default=500)
+    endpoints.add_argument('--trips', type=int, default=200000)
+    endpoints.add_argument('--url', help='benchmark a running server instead of calling the app in-process')
+    endpoints.add_argument('--users', nargs='+', default=['normal=20', 'approver=5', 'driver=10', 'database_manager=1'],
+                           help='simulated users per role, e.g. normal=50 approver=10')
+    endpoints.add_argument('--duration', type=float, default=30.0, help='measured seconds')
+    endpoints.add_argument('--warmup', type=float, default=3.0, help='seconds excluded from the results')
+    endpoints.add_argument('--think-ms', type=float, default=0.0, help='mean pause between a user\'s requests')
+    endpoints.add_argument('--pool-size', type=int, default=8, help='connection pool size (in-process only)')
+    endpoints.add_argument('--sql-metrics', action='store_true',
+                           help='record per-endpoint SQL statistics and slow queries (in-process only)')
+    endpoints.add_argument('--seed', type=int, default=42)
+    endpoints.set_defaults(func=bench_endpoints)
+
+    args = parser.parse_args()
+    results = args.func(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'command': args.command, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+import csv
+import io
+import json
+import re
+import sqlite3
+import time
+
+from table_browser import quote_identifier, table_schema
+
+# 导入时可以识别的布尔值文本
+BOOLEAN_VALUES = {'true': 1, 'false': 0, 'yes': 1, 'no': 0}
+
+
+def column_affinity(declared_type):
+    """按 SQLite 的规则由声明类型得到列的类型亲和性"""
+    declared = (declared_type or '').upper()
+    if 'INT' in declared:
+        return 'integer'
+    if any(word in declared for word in ('CHAR', 'CLOB', 'TEXT')):
+        return 'text'
+    if 'BLOB' in declared or not declared:
+        return 'blob'
+    if any(word in declared for word in ('REAL', 'FLOA', 'DOUB')):
+        return 'real'
+    return 'numeric'
+
+
+def check_expressions(create_sql):
+    """从 CREATE TABLE 语句中取出所有 CHECK(...) 表达式（跳过字符串和带引号的标识符）"""
+    expressions = []
+    i = 0
+    length = len(create_sql)
+    while i < length:
+        char = create_sql[i]
+        if char in '\'"`[':
+            close = ']' if char == '[' else char
+            i = create_sql.find(close, i + 1)
+            if i < 0:
+                break
+            i += 1
+            continue
+        match = re.match(r'CHECK\s*\(', create_sql[i:], re.IGNORECASE)
+        if match and (i == 0 or not (create_sql[i - 1].isalnum() or create_sql[i - 1] == '_')):
+            start = i + match.end()
+            depth = 1
+            j = start
+            while j < length and depth:
+                if create_sql[j] in '\'"`':
+                    j = create_sql.find(create_sql[j], j + 1)
+                    if j < 0:
+                        break
+                elif create_sql[j] == '(':
+                    depth += 1
+                elif create_sql[j] == ')':
+                    depth -= 1
+                j += 1
+            if depth or j < 0:
+                break
+            expressions.append(create_sql[start:j - 1].strip())
+            i = j
+            continue
+        i += 1
+    return expressions
+
+
+def read_records(stream, data_format):
+    """逐条读取 CSV（第一行为列名）或 NDJSON，产出 (行号, dict)；CSV 中的空字符串视为 NULL"""
+    if data_format == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            if None in record:
+                yield reader.line_num, {None: record[None]}
+                continue
+            yield reader.line_num, {key: (value if value != '' else None) for key, value in record.items()}
+    elif data_format == 'ndjson':
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, {None: f'invalid JSON: {e}'}
+                continue
+            if not isinstance(record, dict):
+                yield line_number, {None: 'each line must be a JSON object'}
+                continue
+            yield line_number, record
+    else:
+        raise ValueError(f'Invalid format: {data_format}')
+
+
+class RowValidator:
+    """导入前按表结构检查每一行：列名、NOT NULL、类型和 CHECK 约束"""
+
+    def __init__(self, conn, table):
+        self.conn = conn
+        self.schema = table_schema(conn, table)
+        self.columns = {column['name']: column for column in self.schema['columns']}
+        self.affinity = {name: column_affinity(column['type']) for name, column in self.columns.items()}
+        create_sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()[0]
+        self.checks = check_expressions(create_sql or '')
+        self._check_sql = None
+        if self.checks:
+            # 用子查询把待插入的值命名为列名，直接让 SQLite 计算 CHECK 表达式
+            aliases = ', '.join(f'? AS {quote_identifier(name)}' for name in self.columns)
+            tests = ', '.join(f'({expression})' for expression in self.checks)
+            self._check_sql = f'SELECT {tests} FROM (SELECT {aliases})'
+
+    def _convert(self, name, value):
+        """按列亲和性转换文本值，返回 (值, 错误)"""
+        if value is None or not isinstance(value, str):
+            if isinstance(value, (dict, list)):
+                return None, f'{name}: nested values are not supported'
+            return value, None
+        affinity = self.affinity[name]
+        text = value.strip()
+        if affinity in ('integer', 'real', 'numeric'):
+            if text.lower() in BOOLEAN_VALUES:
+                return BOOLEAN_VALUES[text.lower()], None
+            try:
+                return int(text), None
+            except ValueError:
+                pass
+            try:
+                number = float(text)
+            except ValueError:
+                if affinity == 'numeric':
+                    # NUMERIC 列（日期时间等）保留原文本，与 SQLite 的行为一致
+                    return value, None
+                return None, f'{name}: expected a number, got {value!r}'
+            if affinity == 'integer' and not number.is_integer():
+                return None, f'{name}: expected an integer, got {value!r}'
+            return (int(number) if affinity == 'integer' else number), None
+        return value, None
+
+    def validate(self, record):
+        """返回 ({列名: 转换后的值}, 错误列表)"""
+        errors = []
+        if None in record:
+            return None, [f'malformed row: {record[None]}']
+        unknown = [key for key in record if key not in self.columns]
+        if unknown:
+            errors.append(f"unknown columns: {', '.join(map(str, unknown))}")
+
+        values = {}
+        invalid = set()
+        for name, value in record.items():
+            if name in self.columns:
+                values[name], error = self._convert(name, value)
+                if error:
+                    errors.append(error)
+                    invalid.add(name)
+
+        for name, column in self.columns.items():
+            if name in invalid:
+                continue
+            if values.get(name) is None and column['notnull'] and column['default'] is None:
+                errors.append(f'{name}: value required')
+
+        if self._check_sql and not errors:
+            results = self.conn.execute(self._check_sql, [values.get(name) for name in self.columns]).fetchone()
+            for expression, result in zip(self.checks, results):
+                # 与 SQLite 一致：结果为 NULL 视为通过
+                if result is not None and not result:
+                    errors.append(f'CHECK failed: {expression}')
+
+        return values, errors
+
+
+def import_records(conn, table, records, chunk_size=500, transaction_rows=5000, dry_run=False, max_errors=1000):
+    """批量导入 (行号, dict) 记录，返回导入报告
+
+    通过校验的行按列集合分组，每 chunk_size 行一次 executemany（每块一个 SAVEPOINT），
+    每个事务最多 transaction_rows 行。某块违反 UNIQUE/外键等约束时回滚该块并逐行重试，
+    只有出错的行被跳过并记入报告，其余行照常导入。
+    """
+    started = time.perf_counter()
+    validator = RowValidator(conn, table)
+    report = {'table': table, 'rows': 0, 'inserted': 0, 'failed': 0, 'errors': [],
+              'chunks': 0, 'transactions': 0, 'dry_run': dry_run}
+
+    def fail(line_number, messages):
+        report['failed'] += 1
+        if len(report['errors']) < max_errors:
+            report['errors'].append({'row': line_number, 'errors': messages})
+
+    state = {'in_transaction': False}
+
+    def begin():
+        if not state['in_transaction']:
+            conn.execute('BEGIN IMMEDIATE')
+            report['transactions'] += 1
+        state['in_transaction'] = True
+
+    def end():
+        if state['in_transaction']:
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+        state['in_transaction'] = False
+
+    def flush(columns, chunk):
+        """插入一块列集合相同的行"""
+        sql = (f"INSERT INTO {quote_identifier(table)} ({', '.join(quote_identifier(c) for c in columns)}) "
+               f"VALUES ({', '.join('?' for _ in columns)})")
+        begin()
+        report['chunks'] += 1
+        conn.execute('SAVEPOINT import_chunk')
+        try:
+            conn.executemany(sql, [values for _, values in chunk])
+            conn.execute('RELEASE import_chunk')
+            report['inserted'] += len(chunk)
+            return
+        except sqlite3.DatabaseError:
+            conn.execute('ROLLBACK TO import_chunk')
+            conn.execute('RELEASE import_chunk')
+
+        # 逐行重试，找出出错的行
+        for line_number, values in chunk:
+            conn.execute('SAVEPOINT import_row')
+            try:
+                conn.execute(sql, values)
+                conn.execute('RELEASE import_row')
+                report['inserted'] += 1
+            except sqlite3.DatabaseError as e:
+                conn.execute('ROLLBACK TO import_row')
+                conn.execute('RELEASE import_row')
+                fail(line_number, [str(e)])
+
+    pending = {}
+    rows_in_transaction = 0
+    try:
+        for line_number, record in records:
+            report['rows'] += 1
+            values, errors = validator.validate(record)
+            if errors:
+                fail(line_number, errors)
+                continue
+
+            # 只插入提供了值的列，其余列使用表的默认值
+            columns = tuple(name for name in validator.columns if values.get(name) is not None)
+            chunk = pending.setdefault(columns, [])
+            chunk.append((line_number, [values[name] for name in columns]))
+            if len(chunk) >= chunk_size:
+                flush(columns, pending.pop(columns))
+                rows_in_transaction += chunk_size
+                if rows_in_transaction >= transaction_rows:
+                    end()
+                    rows_in_transaction = 0
+
+        for columns, chunk in pending.items():
+            flush(columns, chunk)
+        end()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+    report['errors'].sort(key=lambda error: error['row'])
+    report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    report['rows_per_second'] = round(report['rows'] * 1000 / report['elapsed_ms'], 1) if report['elapsed_ms'] else None
+    report['errors_truncated'] = report['failed'] > len(report['errors'])
+    return report
+
+
+def open_text(stream):
+    """把二进制上传流包装成文本流（兼容带 BOM 的 UTF-8）"""
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
@@ -0,0 +1,171 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """连接池在等待时间内没有可用连接"""
+
+
+class ConnectionPool:
+    """有界、线程共享的 SQLite 连接池
+
+    每个连接只在创建时配置一次（WAL、synchronous、缓存、语句缓存等），
+    之后在请求之间复用，避免每个请求都重新连接和重新解析 SQL。
+    query_only 为 True 时池中的连接只能读取，写操作由写线程的连接执行。
+    """
+
+    def __init__(self, database, size=8, timeout=10.0, cache_size_kib=16384,
+                 mmap_size=256 * 1024 * 1024, cached_statements=256, query_only=False):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self.query_only = query_only
+
+        self._idle = deque()
+        self._created = 0
+        self._cond = threading.Condition()
+
+        # 统计计数器
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+
+    def connect(self, query_only=None):
+        """创建并配置一个不属于池的新连接（query_only 默认与池相同），用完后由调用者关闭"""
+        conn = sqlite3.connect(self.database, timeout=self.timeout,
+                               check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        # 负数表示以 KiB 为单位
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+        # 启用外键约束
+        conn.execute("PRAGMA foreign_keys = ON")
+        # 最后设置：切换到 WAL 等配置本身可能需要写入
+        if self.query_only if query_only is None else query_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def acquire(self, wait=True):
+        """从池中取出一个连接，池满时等待其他请求归还；wait 为 False 时池满直接返回 None"""
+        with self._cond:
+            if self._idle:
+                self.hits += 1
+                return self._idle.pop()
+
+            if self._created < self.size:
+                self._created += 1
+                self.misses += 1
+                create = True
+            else:
+                if not wait:
+                    return None
+                create = False
+                self.waits += 1
+                started = time.perf_counter()
+                deadline = started + self.timeout
+                while not self._idle:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f'No database connection available after {self.timeout}s')
+                    self._cond.wait(remaining)
+                waited = time.perf_counter() - started
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+                return self._idle.pop()
+
+        if create:
+            try:
+                return self.connect()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+
+    def release(self, conn):
+        """归还连接；未提交的事务会被回滚，损坏的连接直接丢弃"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._cond:
+            while self._idle:
+                self._idle.pop().close()
+                self._created -= 1
+
+    def stats(self):
+        with self._cond:
+            requests = self.hits + self.misses + self.waits
+            return {
+                'size': self.size,
+                'query_only': self.query_only,
+                'open': self._created,
+                'idle': len(self._idle),
+                'in_use': self._created - len(self._idle),
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'hit_rate': round(self.hits / requests, 4) if requests else None,
+                'wait_time_total_ms': round(self.wait_time_total * 1000, 3),
+                'wait_time_avg_ms': round(self.wait_time_total * 1000 / self.waits, 3) if self.waits else 0.0,
+                'wait_time_max_ms': round(self.wait_time_max * 1000, 3),
+            }
+
+
+class PooledConnection:
+    """池化连接的包装：close() 把连接还给池而不是真正关闭"""
+
+    def __init__(self, pool, conn, on_close=None):
+        self._pool = pool
+        self._conn = conn
+        self._on_close = on_close
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed database.')
+        return getattr(self._conn, name)
+
+    @property
+    def closed(self):
+        return self._conn is None
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._pool.release(conn)
+        if self._on_close:
+            self._on_close(self)
@@ -0,0 +1,161 @@
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+
+class EventBusFull(Exception):
+    """订阅数已达到上限"""
+
+
+def format_sse(event_type, data=None, event_id=None):
+    """编码为一条 Server-Sent Events 消息"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append('data: ' + json.dumps(data if data is not None else {}, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """一个客户端的订阅：只接收相关主题的事件，队列有界，满了丢弃最旧的并要求客户端重新加载"""
+
+    def __init__(self, bus, topics, max_queue):
+        self.bus = bus
+        self.topics = frozenset(topics)
+        self._events = deque(maxlen=max_queue)
+        self._cond = threading.Condition()
+        self.overflowed = False
+        self.closed = False
+
+    def _push(self, event):
+        with self._cond:
+            if len(self._events) == self._events.maxlen:
+                self.overflowed = True
+            self._events.append(event)
+            self._cond.notify()
+
+    def get(self, timeout):
+        """取下一个事件，超时返回 None"""
+        with self._cond:
+            if not self._events and not self.closed:
+                self._cond.wait(timeout)
+            return self._events.popleft() if self._events else None
+
+    def stream(self, heartbeat=15.0, max_duration=3600.0):
+        """产出 SSE 消息；空闲时每 heartbeat 秒发送注释行保持连接（也用来发现已断开的客户端），
+        连接最长保持 max_duration 秒，客户端会带着 Last-Event-ID 自动重连
+        """
+        deadline = time.monotonic() + max_duration
+        while not self.closed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            event = self.get(min(heartbeat, remaining))
+            if self.overflowed:
+                self.overflowed = False
+                yield format_sse('resync', {'reason': 'events were missed'})
+            if event is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield format_sse(event['type'], event['data'], event['id'])
+
+    def close(self):
+        self.bus.unsubscribe(self)
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class EventBus:
+    """进程内的发布/订阅：按主题（如 approver:3、driver:42）把事件推给订阅者
+
+    最近 history 条事件保留在内存中，客户端重连时按 Last-Event-ID 补发；
+    要补发的事件已经不在历史中（或进程已重启）时发送 resync，由客户端重新加载页面。
+    事件 ID 为 "进程启动时间.序号"，不同进程的 ID 不会混淆。
+    """
+
+    def __init__(self, history=1000, max_queue=100, max_subscribers=1000):
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self._history = deque(maxlen=history)
+        self._topics = {}          # 主题 -> 订阅集合
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self._last_seq = 0
+        self.epoch = str(int(time.time() * 1000))
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+        self.rejected = 0
+
+    def publish(self, topics, event_type, data):
+        """发布事件到若干主题，订阅了其中多个主题的客户端只收到一次"""
+        with self._lock:
+            self._last_seq = next(self._ids)
+            event = {'seq': self._last_seq, 'id': f'{self.epoch}.{self._last_seq}',
+                     'type': event_type, 'topics': frozenset(topics), 'data': data}
+            self._history.append(event)
+            targets = set()
+            for topic in event['topics']:
+                targets.update(self._topics.get(topic, ()))
+            self.published += 1
+            self.delivered += len(targets)
+        for subscription in targets:
+            subscription._push(event)
+        return event['id']
+
+    def subscribe(self, topics, last_event_id=None):
+        subscription = Subscription(self, topics, self.max_queue)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                self.rejected += 1
+                raise EventBusFull(f'At most {self.max_subscribers} event streams are allowed')
+            self._subscribers.add(subscription)
+            for topic in subscription.topics:
+                self._topics.setdefault(topic, set()).add(subscription)
+
+            if last_event_id:
+                after = self._parse_id(last_event_id)
+                oldest = self._history[0]['seq'] if self._history else self._last_seq + 1
+                if after is None or after < oldest - 1:
+                    subscription.overflowed = True
+                else:
+                    for event in self._history:
+                        if event['seq'] > after and event['topics'] & subscription.topics:
+                            subscription._push(event)
+        return subscription
+
+    def _parse_id(self, event_id):
+        """返回本进程事件 ID 中的序号，其他进程的或格式不对时返回 None"""
+        epoch, _, seq = event_id.partition('.')
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self._last_seq:
+            return None
+        return int(seq)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription not in self._subscribers:
+                return
+            self._subscribers.discard(subscription)
+            for topic in subscription.topics:
+                subscribers = self._topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._topics[topic]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'max_subscribers': self.max_subscribers,
+                'topics': len(self._topics),
+                'published': self.published,
+                'delivered': self.delivered,
+                'rejected': self.rejected,
+                'history': len(self._history),
+                'last_event_id': f'{self.epoch}.{self._last_seq}' if self._last_seq else None,
+            }
@@ -0,0 +1,725 @@
+import sqlite3
+from datetime import datetime
+
+
+def _trip_stats_upserts(row, sign):
+    """迁移 6 的触发器语句：把 row（NEW 或 OLD）计入（sign 为 1）或移出（sign 为 -1）trip_stats"""
+    busy = (f'MAX(0, COALESCE(CAST(ROUND((julianday({row}.end_time) - julianday({row}.start_time)) * 86400) '
+            f'AS INTEGER), 0))')
+    sources = [
+        ("'all'", '0', '', 'WHERE 1'),
+        ("'department'", 'e.did', ' FROM employees e', f'WHERE e.eid = {row}.eid'),
+        ("'vehicle'", f'{row}.assigned_vid', '', f'WHERE {row}.assigned_vid IS NOT NULL'),
+        ("'driver'", f'{row}.assigned_eid', '', f'WHERE {row}.assigned_eid IS NOT NULL'),
+    ]
+    return ''.join(f'''
+               INSERT INTO trip_stats (dimension, day, key, status, trips, busy_seconds)
+               SELECT {dimension}, substr({row}.start_time, 1, 10), {key}, {row}.current_status, {sign}, {sign} * {busy}{source}
+                   {where}
+                   ON CONFLICT (dimension, day, key, status) DO UPDATE
+                   SET trips = trips + excluded.trips, busy_seconds = busy_seconds + excluded.busy_seconds;'''
+                   for dimension, key, source, where in sources)
+
+
+def _trip_person_versions(row, unless_same_as=None):
+    """迁移 12 的触发器语句：row 的申请人、审批员和司机的版本号加一（与迁移 4 相同）；
+    unless_same_as 为 OLD 时跳过与修改前相同的人"""
+    people = [('requester', 'eid'), ('approver', 'approved_by'), ('driver', 'assigned_eid')]
+    return ''.join(f'''
+               INSERT INTO data_versions (name, version) SELECT '{prefix}:' || {row}.{column}, 1 WHERE {row}.{column} IS NOT NULL'''
+                   + (f' AND {row}.{column} IS NOT {unless_same_as}.{column}' if unless_same_as else '') + '''
+                   ON CONFLICT (name) DO UPDATE SET version = version + 1;'''
+                   for prefix, column in people)
+
+
+# 迁移 9 的触发器中同一行程在 NEW 之前和之后的一次读数（NEW 的 id 最大，时间相同时 NEW 排在后面）
+_TELEMETRY_PREVIOUS = '''SELECT odometer, fuel FROM trip_telemetry
+                     WHERE rid = NEW.rid AND recorded_at <= NEW.recorded_at AND id <> NEW.id
+                     ORDER BY recorded_at DESC, id DESC LIMIT 1'''
+_TELEMETRY_NEXT = '''SELECT odometer, fuel, recorded_at FROM trip_telemetry
+                 WHERE rid = NEW.rid AND recorded_at > NEW.recorded_at
+                 ORDER BY recorded_at, id LIMIT 1'''
+
+
+def _trip_search_triggers(table, other):
+    """迁移 10 中 table 上维护 trip_search 的触发器
+
+    行程归档时先插入 other 再从 table 删除，rid 同时存在于两张表中的插入和删除都跳过，
+    已索引的内容保持不变。外部内容表删除时要给出原来索引的值。
+    """
+    delete = '''INSERT INTO trip_search (trip_search, rowid, destination, notes, rejection_reason)
+               VALUES ('delete', OLD.rid, OLD.destination, OLD.notes, OLD.rejection_reason);'''
+    insert = '''INSERT INTO trip_search (rowid, destination, notes, rejection_reason)
+               VALUES (NEW.rid, NEW.destination, NEW.notes, NEW.rejection_reason);'''
+    name = 'trip_search' if table == 'trip_requests' else 'trip_search_archive'
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS {name}_after_insert
+           AFTER INSERT ON {table}
+           WHEN NOT EXISTS (SELECT 1 FROM {other} WHERE rid = NEW.rid)
+           BEGIN
+               {insert}
+           END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {name}_after_update
+           AFTER UPDATE OF rid, destination, notes, rejection_reason ON {table}
+           BEGIN
+               {delete}
+               {insert}
+           END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {name}_after_delete
+           AFTER DELETE ON {table}
+           WHEN NOT EXISTS (SELECT 1 FROM {other} WHERE rid = OLD.rid)
+           BEGIN
+               {delete}
+           END''',
+    ]
+
+
+# 版本化的数据库迁移：(版本号, 名称, SQL 语句列表)
+# 新的结构变更只能追加到末尾，已发布的迁移不要修改
+MIGRATIONS = [
+    (1, 'indexes for hot queries', [
+        # 审批员仪表板：WHERE approved_by = ? AND current_status = ? ORDER BY created_at
+        '''CREATE INDEX IF NOT EXISTS idx_trip_requests_approver_status
+           ON trip_requests (approved_by, current_status, created_at)''',
+        # 司机仪表板和司机空闲检查：WHERE current_status IN (...) AND assigned_eid = ?
+        '''CREATE INDEX IF NOT EXISTS idx_trip_requests_status_driver
+           ON trip_requests (current_status, assigned_eid, start_time)''',
+        # 普通用户仪表板：WHERE eid = ? ORDER BY created_at
+        '''CREATE INDEX IF NOT EXISTS idx_trip_requests_requester
+           ON trip_requests (eid, created_at)''',
+        # 按角色查找审批员、司机
+        '''CREATE INDEX IF NOT EXISTS idx_users_type_active
+           ON users (utype, u_is_active)''',
+        # 查找可用车辆
+        '''CREATE INDEX IF NOT EXISTS idx_vehicles_status
+           ON vehicles (vstatus)''',
+    ]),
+    (2, 'trip change log', [
+        # 每次行程变更记录一行，供各进程的内存索引增量同步；只保留最近 10000 条
+        '''CREATE TABLE IF NOT EXISTS trip_changes (
+               seq INTEGER PRIMARY KEY AUTOINCREMENT,
+               rid INTEGER NOT NULL
+           )''',
+        '''CREATE TRIGGER IF NOT EXISTS trip_changes_after_insert
+           AFTER INSERT ON trip_requests
+           BEGIN
+               INSERT INTO trip_changes (rid) VALUES (NEW.rid);
+               DELETE FROM trip_changes WHERE seq <= (SELECT MAX(seq) FROM trip_changes) - 10000;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trip_changes_after_update
+           AFTER UPDATE ON trip_requests
+           BEGIN
+               INSERT INTO trip_changes (rid) SELECT OLD.rid WHERE OLD.rid <> NEW.rid;
+               INSERT INTO trip_changes (rid) VALUES (NEW.rid);
+               DELETE FROM trip_changes WHERE seq <= (SELECT MAX(seq) FROM trip_changes) - 10000;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trip_changes_after_delete
+           AFTER DELETE ON trip_requests
+           BEGIN
+               INSERT INTO trip_changes (rid) VALUES (OLD.rid);
+               DELETE FROM trip_changes WHERE seq <= (SELECT MAX(seq) FROM trip_changes) - 10000;
+           END''',
+    ]),
+    (3, 'reference data versions', [
+        # 参考表每次变更时版本号加一，各进程的参考数据缓存据此失效
+        '''CREATE TABLE IF NOT EXISTS data_versions (
+               name TEXT PRIMARY KEY,
+               version INTEGER NOT NULL DEFAULT 0
+           )''',
+        '''INSERT OR IGNORE INTO data_versions (name, version)
+           VALUES ('users', 0), ('employees', 0), ('departments', 0), ('vehicles', 0)''',
+        # 车辆只有显示用的列变化才算变更，状态、里程和油量的更新不影响缓存
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_users_insert
+           AFTER INSERT ON users
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_users_update
+           AFTER UPDATE ON users
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_users_delete
+           AFTER DELETE ON users
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_employees_insert
+           AFTER INSERT ON employees
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'employees';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_employees_update
+           AFTER UPDATE ON employees
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'employees';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_employees_delete
+           AFTER DELETE ON employees
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'employees';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_departments_insert
+           AFTER INSERT ON departments
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'departments';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_departments_update
+           AFTER UPDATE ON departments
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'departments';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_departments_delete
+           AFTER DELETE ON departments
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'departments';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_vehicles_insert
+           AFTER INSERT ON vehicles
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'vehicles';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_vehicles_update
+           AFTER UPDATE OF vid, plate, brand, model, capacity ON vehicles
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'vehicles';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_vehicles_delete
+           AFTER DELETE ON vehicles
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'vehicles';
+           END''',
+    ]),
+    (4, 'trip data versions', [
+        # 行程变更时，除全表版本号外，申请人、审批员和司机各自的版本号也加一（修改前后的都算），
+        # 仪表板据此生成 ETag；这些行在第一次用到时插入
+        '''INSERT OR IGNORE INTO data_versions (name, version) VALUES ('trip_requests', 0)''',
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_trip_requests_insert
+           AFTER INSERT ON trip_requests
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'trip_requests';
+               INSERT INTO data_versions (name, version) SELECT 'requester:' || NEW.eid, 1 WHERE NEW.eid IS NOT NULL
+                   ON CONFLICT (name) DO UPDATE SET version = version + 1;
+               INSERT INTO data_versions (name, version) SELECT 'approver:' || NEW.approved_by, 1 WHERE NEW.approved_by IS NOT NULL
+                   ON CONFLICT (name) DO UPDATE SET version = version + 1;
+               INSERT INTO data_versions (name, version) SELECT 'driver:' || NEW.assigned_eid, 1 WHERE NEW.assigned_eid IS NOT NULL
+                   ON CONFLICT (name) DO UPDATE SET version = version + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_trip_requests_update
+           AFTER UPDATE ON trip_requests
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'trip_requests';
+               INSERT INTO data_versions (name, version) SELECT 'requester:' || OLD.eid, 1 WHERE OLD.eid IS NOT NULL
+                   ON CONFLICT (name) DO UPDATE SET version = version + 1;
+               INSERT INTO data_versions (name, version) SELECT 'requester:' || NEW.eid, 1 WHERE NEW.eid IS NOT NULL AND NEW.eid IS NOT OLD.eid
+                   ON CONFLICT (name) DO UPDATE SET version = version + 1;
+               INSERT INTO data_versions (name, version) SELECT 'approver:' || OLD.approved_by, 1 WHERE OLD.approved_by IS NOT NULL
+                   ON CONFLICT (name) DO UPDATE SET version = version + 1;
+               INSERT INTO data_versions (name, version) SELECT 'approver:' || NEW.approved_by, 1 WHERE NEW.approved_by IS NOT NULL AND NEW.approved_by IS NOT OLD.approved_by
+                   ON CONFLICT (name) DO UPDATE SET version = version + 1;
+               INSERT INTO data_versions (name, version) SELECT 'driver:' || OLD.assigned_eid, 1 WHERE OLD.assigned_eid IS NOT NULL
+                   ON CONFLICT (name) DO UPDATE SET version = version + 1;
+               INSERT INTO data_versions (name, version) SELECT 'driver:' || NEW.assigned_eid, 1 WHERE NEW.assigned_eid IS NOT NULL AND NEW.assigned_eid IS NOT OLD.assigned_eid
+                   ON CONFLICT (name) DO UPDATE SET version = version + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS data_versions_trip_requests_delete
+           AFTER DELETE ON trip_requests
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'trip_requests';
+               INSERT INTO data_versions (name, version) SELECT 'requester:' || OLD.eid, 1 WHERE OLD.eid IS NOT NULL
+                   ON CONFLICT (name) DO UPDATE SET version = version + 1;
+               INSERT INTO data_versions (name, version) SELECT 'approver:' || OLD.approved_by, 1 WHERE OLD.approved_by IS NOT NULL
+                   ON CONFLICT (name) DO UPDATE SET version = version + 1;
+               INSERT INTO data_versions (name, version) SELECT 'driver:' || OLD.assigned_eid, 1 WHERE OLD.assigned_eid IS NOT NULL
+                   ON CONFLICT (name) DO UPDATE SET version = version + 1;
+           END''',
+    ]),
+    (5, 'driver trip history index', [
+        # 司机仪表板的状态统计和历史分页：WHERE assigned_eid = ? [AND current_status IN (...)]
+        '''CREATE INDEX IF NOT EXISTS idx_trip_requests_driver_status
+           ON trip_requests (assigned_eid, current_status, start_time)''',
+    ]),
+    (6, 'trip statistics', [
+        # 按行程开始日期、维度（all / department / vehicle / driver）、键和状态累计的行程数和时长（秒），
+        # 由触发器增量维护；已有的行程在这里一次性回填，之后可以用 flask rebuild-stats 重建
+        '''CREATE TABLE IF NOT EXISTS trip_stats (
+               dimension TEXT NOT NULL,
+               day TEXT NOT NULL,
+               key INTEGER NOT NULL,
+               status TEXT NOT NULL,
+               trips INTEGER NOT NULL DEFAULT 0,
+               busy_seconds INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (dimension, day, key, status)
+           ) WITHOUT ROWID''',
+        *[f'''INSERT INTO trip_stats (dimension, day, key, status, trips, busy_seconds)
+              SELECT '{dimension}', substr(tr.start_time, 1, 10), {key}, tr.current_status, COUNT(*),
+                     SUM(MAX(0, COALESCE(CAST(ROUND((julianday(tr.end_time) - julianday(tr.start_time)) * 86400) AS INTEGER), 0)))
+              FROM trip_requests tr {source}
+              GROUP BY 2, 3, 4''' for dimension, key, source in [
+            ('all', '0', ''),
+            ('department', 'e.did', 'JOIN employees e ON e.eid = tr.eid'),
+            ('vehicle', 'tr.assigned_vid', 'WHERE tr.assigned_vid IS NOT NULL'),
+            ('driver', 'tr.assigned_eid', 'WHERE tr.assigned_eid IS NOT NULL'),
+        ]],
+        f'''CREATE TRIGGER IF NOT EXISTS trip_stats_after_insert
+           AFTER INSERT ON trip_requests
+           BEGIN{_trip_stats_upserts('NEW', 1)}
+           END''',
+        # 只有影响统计的列变化时才更新：先移出旧行，再计入新行
+        f'''CREATE TRIGGER IF NOT EXISTS trip_stats_after_update
+           AFTER UPDATE OF eid, start_time, end_time, current_status, assigned_vid, assigned_eid ON trip_requests
+           BEGIN{_trip_stats_upserts('OLD', -1)}{_trip_stats_upserts('NEW', 1)}
+           END''',
+        f'''CREATE TRIGGER IF NOT EXISTS trip_stats_after_delete
+           AFTER DELETE ON trip_requests
+           BEGIN{_trip_stats_upserts('OLD', -1)}
+           END''',
+    ]),
+    (7, 'trip archive', [
+        # 已结束的旧行程从 trip_requests 移到这里（同一个数据库文件，移动在一个事务内完成），
+        # rid 保持不变；trip_requests 是 AUTOINCREMENT，归档后 rid 不会被重新使用
+        '''CREATE TABLE IF NOT EXISTS trip_requests_archive (
+               rid INTEGER PRIMARY KEY,
+               eid INTEGER NOT NULL,
+               purpose TEXT NOT NULL,
+               destination TEXT NOT NULL,
+               start_time DATETIME NOT NULL,
+               end_time DATETIME NOT NULL,
+               passenger_number INTEGER,
+               current_status TEXT NOT NULL,
+               approved_by INTEGER,
+               assigned_vid INTEGER,
+               assigned_eid INTEGER,
+               created_at DATETIME,
+               notes TEXT,
+               rejection_reason TEXT,
+               archived_at DATETIME NOT NULL
+           )''',
+        # 与热表上历史查询使用的索引相同
+        '''CREATE INDEX IF NOT EXISTS idx_trip_requests_archive_requester
+           ON trip_requests_archive (eid, created_at)''',
+        '''CREATE INDEX IF NOT EXISTS idx_trip_requests_archive_approver_status
+           ON trip_requests_archive (approved_by, current_status, created_at)''',
+        '''CREATE INDEX IF NOT EXISTS idx_trip_requests_archive_driver_status
+           ON trip_requests_archive (assigned_eid, current_status, start_time)''',
+        # 全部历史：WHERE 和 ORDER BY ... LIMIT 会下推到两张表各自的索引上再合并
+        '''CREATE VIEW IF NOT EXISTS trip_requests_all AS
+           SELECT rid, eid, purpose, destination, start_time, end_time, passenger_number, current_status,
+                  approved_by, assigned_vid, assigned_eid, created_at, notes, rejection_reason
+           FROM trip_requests
+           UNION ALL
+           SELECT rid, eid, purpose, destination, start_time, end_time, passenger_number, current_status,
+                  approved_by, assigned_vid, assigned_eid, created_at, notes, rejection_reason
+           FROM trip_requests_archive''',
+        # 查找可归档的行程：WHERE current_status IN (...) AND end_time < ?
+        '''CREATE INDEX IF NOT EXISTS idx_trip_requests_status_end
+           ON trip_requests (current_status, end_time)''',
+        # 归档时从热表删除的行程仍计入 trip_stats
+        'DROP TRIGGER IF EXISTS trip_stats_after_delete',
+        f'''CREATE TRIGGER trip_stats_after_delete
+           AFTER DELETE ON trip_requests
+           WHEN NOT EXISTS (SELECT 1 FROM trip_requests_archive WHERE rid = OLD.rid)
+           BEGIN{_trip_stats_upserts('OLD', -1)}
+           END''',
+    ]),
+    (8, 'vehicle booking index', [
+        # 审批分配的条件更新检查车辆在该时间段内是否已被占用：WHERE assigned_vid = ? AND current_status IN (...)
+        '''CREATE INDEX IF NOT EXISTS idx_trip_requests_vehicle_status
+           ON trip_requests (assigned_vid, current_status, start_time)''',
+    ]),
+    (9, 'trip telemetry', [
+        # 只追加的行程读数：开始、结束和行驶中的里程表读数与油量（占油箱的百分比）。
+        # rid 不设外键，行程归档后读数仍然保留
+        '''CREATE TABLE IF NOT EXISTS trip_telemetry (
+               id INTEGER PRIMARY KEY,
+               rid INTEGER NOT NULL,
+               vid INTEGER NOT NULL,
+               eid INTEGER NOT NULL,
+               kind TEXT NOT NULL CHECK(kind IN ('start', 'reading', 'end')),
+               recorded_at TEXT NOT NULL,
+               odometer REAL NOT NULL CHECK(odometer >= 0),
+               fuel REAL NOT NULL CHECK(fuel >= 0 AND fuel <= 100),
+               received_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+           )''',
+        # 单个行程的读数：WHERE rid = ? ORDER BY recorded_at
+        '''CREATE INDEX IF NOT EXISTS idx_trip_telemetry_trip
+           ON trip_telemetry (rid, recorded_at)''',
+        '''CREATE TRIGGER IF NOT EXISTS trip_telemetry_no_update
+           BEFORE UPDATE ON trip_telemetry
+           BEGIN SELECT RAISE(ABORT, 'trip_telemetry is append-only'); END''',
+        '''CREATE TRIGGER IF NOT EXISTS trip_telemetry_no_delete
+           BEFORE DELETE ON trip_telemetry
+           BEGIN SELECT RAISE(ABORT, 'trip_telemetry is append-only'); END''',
+        # 每辆车每天的行驶里程和耗油量：同一行程相邻两次读数之间的里程增加和油量减少
+        # （加油不算负的耗油）计入后一次读数的日期，由触发器增量维护
+        '''CREATE TABLE IF NOT EXISTS vehicle_daily_usage (
+               day TEXT NOT NULL,
+               vid INTEGER NOT NULL,
+               distance_km REAL NOT NULL DEFAULT 0,
+               fuel_used REAL NOT NULL DEFAULT 0,
+               readings INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (day, vid)
+           ) WITHOUT ROWID''',
+        # 新读数插在前一次读数 p 和后一次读数 n 之间（迟到的读数）：
+        # 计入 p→NEW 和 NEW→n 两段，移出原来计入的 p→n 一段
+        f'''CREATE TRIGGER IF NOT EXISTS vehicle_daily_usage_after_insert
+           AFTER INSERT ON trip_telemetry
+           BEGIN
+               INSERT INTO vehicle_daily_usage (day, vid, readings)
+               VALUES (substr(NEW.recorded_at, 1, 10), NEW.vid, 1)
+                   ON CONFLICT (day, vid) DO UPDATE SET readings = readings + 1;
+               INSERT INTO vehicle_daily_usage (day, vid, distance_km, fuel_used)
+               SELECT substr(NEW.recorded_at, 1, 10), NEW.vid,
+                      MAX(0, NEW.odometer - p.odometer), MAX(0, p.fuel - NEW.fuel)
+               FROM ({_TELEMETRY_PREVIOUS}) p
+               WHERE 1
+                   ON CONFLICT (day, vid) DO UPDATE
+                   SET distance_km = distance_km + excluded.distance_km, fuel_used = fuel_used + excluded.fuel_used;
+               INSERT INTO vehicle_daily_usage (day, vid, distance_km, fuel_used)
+               SELECT substr(n.recorded_at, 1, 10), NEW.vid,
+                      MAX(0, n.odometer - NEW.odometer) - COALESCE(MAX(0, n.odometer - p.odometer), 0),
+                      MAX(0, NEW.fuel - n.fuel) - COALESCE(MAX(0, p.fuel - n.fuel), 0)
+               FROM ({_TELEMETRY_NEXT}) n LEFT JOIN ({_TELEMETRY_PREVIOUS}) p ON 1
+               WHERE 1
+                   ON CONFLICT (day, vid) DO UPDATE
+                   SET distance_km = distance_km + excluded.distance_km, fuel_used = fuel_used + excluded.fuel_used;
+           END''',
+    ]),
+    (10, 'trip search', [
+        # 目的地、备注和拒绝原因的全文索引，包括已归档的行程。外部内容表：文本不再保存一份，
+        # 需要时按 rowid（即 rid）从 trip_requests_all 读取；已有的行程在这里建立索引，
+        # 之后由触发器增量维护，可以用 flask rebuild-search 重建
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS trip_search USING fts5 (
+               destination, notes, rejection_reason,
+               content = 'trip_requests_all', content_rowid = 'rid',
+               tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+           )''',
+        # ORDER BY rank 使用的相关度：目的地中的匹配权重加倍
+        "INSERT INTO trip_search (trip_search, rank) VALUES ('rank', 'bm25(2.0, 1.0, 1.0)')",
+        "INSERT INTO trip_search (trip_search) VALUES ('rebuild')",
+        *_trip_search_triggers('trip_requests', 'trip_requests_archive'),
+        *_trip_search_triggers('trip_requests_archive', 'trip_requests'),
+    ]),
+    (11, 'trip restore', [
+        # 行程从归档表移回热表时先插入 trip_requests 再从归档表删除，归档时没有移出 trip_stats，
+        # 这时也不再计入一次
+        'DROP TRIGGER IF EXISTS trip_stats_after_insert',
+        f'''CREATE TRIGGER trip_stats_after_insert
+           AFTER INSERT ON trip_requests
+           WHEN NOT EXISTS (SELECT 1 FROM trip_requests_archive WHERE rid = NEW.rid)
+           BEGIN{_trip_stats_upserts('NEW', 1)}
+           END''',
+    ]),
+    (12, 'trip archive triggers', [
+        # 管理员也可以直接修改、删除归档表中的行程：与热表一样维护 trip_stats 和 data_versions。
+        # 恢复行程时先插入热表再从归档表删除，这时不从 trip_stats 移出（与迁移 7 的热表删除触发器对称）
+        f'''CREATE TRIGGER IF NOT EXISTS trip_stats_archive_after_update
+           AFTER UPDATE OF eid, start_time, end_time, current_status, assigned_vid, assigned_eid ON trip_requests_archive
+           BEGIN{_trip_stats_upserts('OLD', -1)}{_trip_stats_upserts('NEW', 1)}
+           END''',
+        f'''CREATE TRIGGER IF NOT EXISTS trip_stats_archive_after_delete
+           AFTER DELETE ON trip_requests_archive
+           WHEN NOT EXISTS (SELECT 1 FROM trip_requests WHERE rid = OLD.rid)
+           BEGIN{_trip_stats_upserts('OLD', -1)}
+           END''',
+        f'''CREATE TRIGGER IF NOT EXISTS data_versions_trip_requests_archive_update
+           AFTER UPDATE ON trip_requests_archive
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'trip_requests';{_trip_person_versions('OLD')}{_trip_person_versions('NEW', 'OLD')}
+           END''',
+        f'''CREATE TRIGGER IF NOT EXISTS data_versions_trip_requests_archive_delete
+           AFTER DELETE ON trip_requests_archive
+           BEGIN
+               UPDATE data_versions SET version = version + 1 WHERE name = 'trip_requests';{_trip_person_versions('OLD')}
+           END''',
+    ]),
+]
+
+# 热点查询，用于检查执行计划是否使用了索引（参数值不影响执行计划）
+HOT_QUERIES = {
+    'login': ('''
+        SELECT u.*, e.fname, e.lname
+        FROM users u
+        JOIN employees e ON u.eid = e.eid
+        WHERE u.username = ? AND u.password = ? AND u.u_is_active = 1
+    ''', ('username', 'password')),
+    'user_dashboard': ('''
+        SELECT tr.*
+        FROM trip_requests tr
+        WHERE tr.eid = ? AND tr.current_status IN (?, ?, ?, ?)
+        ORDER BY tr.created_at DESC
+    ''', (1, 'pending', 'approved', 'assigned', 'in_progress')),
+    'user_dashboard.counts': ('''
+        SELECT current_status, COUNT(*) AS total
+        FROM trip_requests_all
+        WHERE eid = ?
+        GROUP BY current_status
+    ''', (1,)),
+    'user_trips': ('''
+        SELECT tr.*
+        FROM trip_requests_all tr
+        WHERE tr.eid = ? AND tr.current_status IN (?, ?, ?) AND tr.created_at >= ? AND tr.created_at < ?
+              AND (tr.created_at, tr.rid) < (?, ?)
+        ORDER BY tr.created_at DESC, tr.rid DESC
+        LIMIT ?
+    ''', (1, 'rejected', 'completed', 'cancelled', '2025-01-01 00:00:00', '2026-01-01 00:00:00',
+          '2025-06-01 00:00:00', 1, 21)),
+    'reference_cache.versions': ('''
+        SELECT name, version FROM data_versions WHERE name IN (?, ?, ?, ?)
+    ''', ('users', 'employees', 'departments', 'vehicles')),
+    'page_cache.versions': ('''
+        SELECT name, version FROM data_versions WHERE name IN (?, ?, ?, ?, ?)
+    ''', ('approver:1', 'users', 'employees', 'departments', 'vehicles')),
+    'reference_cache.employees': ('''
+        SELECT eid, fname, lname, did, e_is_active FROM employees
+        WHERE eid IN (?, ?)
+    ''', (1, 2)),
+    'approver_router.roster': ('''
+        SELECT u.uid, e.did
+        FROM users u
+        JOIN employees e ON u.eid = e.eid
+        WHERE u.utype = 'approver' AND u.u_is_active = 1 AND e.e_is_active = 1
+    ''', ()),
+    'approver_router.rebuild': ('''
+        SELECT rid, current_status, approved_by
+        FROM trip_requests
+        WHERE current_status = 'pending' AND approved_by IS NOT NULL
+    ''', ()),
+    'approver_dashboard.counts': ('''
+        SELECT current_status, COUNT(*) AS total
+        FROM trip_requests_all
+        WHERE approved_by = ?
+        GROUP BY current_status
+    ''', (1,)),
+    'approver_dashboard.page': ('''
+        SELECT tr.*
+        FROM trip_requests_all tr
+        WHERE tr.approved_by = ? AND tr.current_status = ?
+        ORDER BY tr.created_at DESC, tr.rid DESC
+        LIMIT ?
+    ''', (1, 'completed', 21)),
+    'approver_dashboard.purposes': ('''
+        SELECT purpose, COUNT(*) AS total
+        FROM trip_requests
+        WHERE approved_by = ? AND current_status = 'pending'
+        GROUP BY purpose
+    ''', (1,)),
+    'approver_requests': ('''
+        SELECT tr.*
+        FROM trip_requests_all tr
+        WHERE tr.approved_by = ? AND tr.current_status = ? AND (tr.created_at, tr.rid) < (?, ?)
+        ORDER BY tr.created_at DESC, tr.rid DESC
+        LIMIT ?
+    ''', (1, 'completed', '2025-01-01 00:00:00', 1, 21)),
+    'process_request.check': ('''
+        SELECT approved_by, eid, current_status FROM trip_requests WHERE rid = ?
+    ''', (1,)),
+    'process_request.vehicles': ('''
+        SELECT vid, capacity FROM vehicles
+        WHERE vstatus IN ('available', 'assigned') AND capacity >= ?
+    ''', (1,)),
+    'process_request.drivers': ('''
+        SELECT u.eid
+        FROM users u
+        JOIN employees e ON u.eid = e.eid
+        WHERE u.utype = 'driver' AND u.u_is_active = 1 AND e.e_is_active = 1
+    ''', ()),
+    'process_request.assign': ('''
+        UPDATE trip_requests
+        SET current_status = 'assigned',
+            assigned_vid = ?,
+            assigned_eid = ?,
+            rejection_reason = NULL
+        WHERE rid = ? AND current_status = 'pending'
+          AND EXISTS (SELECT 1 FROM vehicles v WHERE v.vid = ? AND v.vstatus IN ('available', 'assigned'))
+          AND NOT EXISTS (
+              SELECT 1 FROM trip_requests o
+              WHERE o.assigned_eid = ? AND o.current_status IN ('assigned', 'in_progress')
+                AND o.start_time <= trip_requests.end_time AND o.end_time >= trip_requests.start_time
+                AND o.rid <> trip_requests.rid)
+          AND NOT EXISTS (
+              SELECT 1 FROM trip_requests o
+              WHERE o.assigned_vid = ? AND o.current_status IN ('assigned', 'in_progress')
+                AND o.start_time <= trip_requests.end_time AND o.end_time >= trip_requests.start_time
+                AND o.rid <> trip_requests.rid)
+    ''', (1, 1, 1, 1, 1, 1)),
+    'booking_index.rebuild': ('''
+        SELECT rid, current_status, assigned_eid, start_time, end_time
+        FROM trip_requests
+        WHERE current_status IN (?, ?) AND assigned_eid IS NOT NULL
+    ''', ('assigned', 'in_progress')),
+    'driver_dashboard': ('''
+        SELECT tr.*
+        FROM trip_requests tr
+        WHERE tr.assigned_eid = ? AND tr.current_status IN ('assigned', 'in_progress')
+        ORDER BY tr.start_time DESC
+    ''', (1,)),
+    'driver_dashboard.counts': ('''
+        SELECT current_status, COUNT(*) AS total
+        FROM trip_requests_all
+        WHERE assigned_eid = ?
+        GROUP BY current_status
+    ''', (1,)),
+    'driver_trips': ('''
+        SELECT tr.*
+        FROM trip_requests_all tr
+        WHERE tr.assigned_eid = ? AND tr.current_status IN (?, ?) AND (tr.start_time, tr.rid) < (?, ?)
+        ORDER BY tr.start_time DESC, tr.rid DESC
+        LIMIT ?
+    ''', (1, 'completed', 'cancelled', '2025-06-01 00:00:00', 1, 21)),
+    'archive.candidates': ('''
+        SELECT rid FROM trip_requests
+        WHERE current_status IN (?, ?, ?) AND end_time < ?
+        LIMIT ?
+    ''', ('completed', 'rejected', 'cancelled', '2025-01-01 00:00:00', 1000)),
+    'analytics': ('''
+        SELECT key, status, SUM(trips) AS trips, SUM(busy_seconds) AS busy_seconds
+        FROM trip_stats
+        WHERE dimension = ? AND day >= ? AND day <= ? AND trips <> 0
+        GROUP BY key, status
+    ''', ('vehicle', '2025-01-01', '2025-01-30')),
+    'telemetry.trip': ('''
+        SELECT id, kind, recorded_at, odometer, fuel, vid, eid, received_at
+        FROM trip_telemetry
+        WHERE rid = ?
+        ORDER BY recorded_at, id
+    ''', (1,)),
+    'telemetry.previous': ('''
+        SELECT odometer, fuel FROM trip_telemetry
+        WHERE rid = ? AND recorded_at <= ? AND id <> ?
+        ORDER BY recorded_at DESC, id DESC LIMIT 1
+    ''', (1, '2025-01-01 00:00:00', 1)),
+    'vehicle_usage': ('''
+        SELECT vid, TOTAL(distance_km) AS distance_km, TOTAL(fuel_used) AS fuel_used,
+               SUM(readings) AS readings, COUNT(*) AS active_days
+        FROM vehicle_daily_usage
+        WHERE day >= ? AND day <= ?
+        GROUP BY vid
+        ORDER BY vid
+    ''', ('2025-01-01', '2025-01-31')),
+    'search': ('''
+        SELECT s.rowid AS rid, s.rank AS score
+        FROM trip_search s
+        WHERE trip_search MATCH ?
+        ORDER BY s.rowid DESC
+        LIMIT ?
+    ''', ('"street"*', 5000)),
+    'search.scoped': ('''
+        SELECT s.rowid AS rid, s.rank AS score
+        FROM trip_search s
+        LEFT JOIN trip_requests h ON h.rid = s.rowid
+        LEFT JOIN trip_requests_archive a ON a.rid = s.rowid
+        WHERE trip_search MATCH ? AND COALESCE(h.approved_by, a.approved_by) = ?
+        ORDER BY s.rowid DESC
+        LIMIT ?
+    ''', ('"street"*', 1, 5000)),
+    'search.check': ('''
+        SELECT rowid FROM trip_search WHERE trip_search MATCH ? LIMIT 1
+    ''', ('"street"*',)),
+    'search.hits': ('''
+        SELECT tr.*, snippet(trip_search, -1, '**', '**', '…', 16) AS snippet
+        FROM trip_search s
+        JOIN trip_requests_all tr ON tr.rid = s.rowid
+        WHERE trip_search MATCH ? AND s.rowid IN (?, ?, ?)
+    ''', ('"street"*', 1, 2, 3)),
+}
+
+# 允许按整个索引扫描（SCAN ... USING [COVERING] INDEX）的热点查询名，其余查询只能用 SEARCH 步骤
+INDEX_SCAN_ALLOWED = frozenset()
+# ANALYZE 统计的行数不超过这么多的表只占一两个页面，扫描它不比查索引慢
+SMALL_TABLE_ROWS = 64
+
+
+def ensure_migrations_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def current_version(conn):
+    """返回数据库当前的结构版本号（未迁移过为 0）"""
+    ensure_migrations_table(conn)
+    row = conn.execute('SELECT MAX(version) FROM schema_migrations').fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn, target=None):
+    """依次执行尚未应用的迁移，返回本次应用的版本号列表
+
+    每个迁移在单独的 BEGIN IMMEDIATE 事务中执行，并在事务内重新检查版本，
+    因此多个进程同时启动时同一个迁移只会执行一次。
+    """
+    ensure_migrations_table(conn)
+    applied = []
+
+    for version, name, statements in MIGRATIONS:
+        if target is not None and version > target:
+            break
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            done = conn.execute(
+                'SELECT 1 FROM schema_migrations WHERE version = ?', (version,)
+            ).fetchone()
+            if done:
+                conn.rollback()
+                continue
+
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                'INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)',
+                (version, name, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            )
+            conn.commit()
+            applied.append(version)
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+    return applied
+
+
+def query_plan(conn, sql, params=()):
+    """返回 EXPLAIN QUERY PLAN 的描述行"""
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+
+
+def _small_table(conn, table):
+    """表最多只有一行，或 sqlite_stat1 中的行数不超过 SMALL_TABLE_ROWS 时返回 True；名字是别名或子查询时返回 False"""
+    try:
+        if conn.execute(f'SELECT COUNT(*) FROM (SELECT 1 FROM "{table}" LIMIT 2)').fetchone()[0] <= 1:
+            return True
+        # stat 的第一个数是表的行数；没有执行过 ANALYZE 时没有 sqlite_stat1
+        rows = conn.execute('SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = ?', (table,)).fetchone()[0]
+    except sqlite3.Error:
+        return False
+    return rows is not None and rows <= SMALL_TABLE_ROWS
+
+
+def check_query_plans(conn, queries=None, index_scans_allowed=INDEX_SCAN_ALLOWED):
+    """检查热点查询的执行计划，返回 {查询名: 扫描步骤列表}，为空表示全部按索引查找
+
+    按整个索引扫描（SCAN ... USING INDEX）和全表扫描一样要读完整棵 B 树，
+    只有 index_scans_allowed 中的查询可以这样做。
+    """
+    problems = {}
+    for name, (sql, params) in (queries or HOT_QUERIES).items():
+        plan = query_plan(conn, sql, params)
+        # 物化的 CTE / 子查询本身不是表，扫描它们不算全表扫描
+        derived = {step.split(' ', 1)[1] for step in plan
+                   if step.startswith(('MATERIALIZE ', 'CO-ROUTINE '))}
+        # 虚拟表（FTS5 的 MATCH）的扫描由虚拟表自己的索引完成；很小的表直接扫描也不慢
+        scans = [step for step in plan
+                 if step.startswith('SCAN ') and ' VIRTUAL TABLE INDEX ' not in step
+                 and not (name in index_scans_allowed and ' USING ' in step)
+                 and step[5:] not in derived and not step[5:].startswith('(subquery-')
+                 and not _small_table(conn, step[5:].split(' ')[0])]
+        if scans:
+            problems[name] = scans
+    return problems
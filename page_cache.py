@@ -0,0 +1,82 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def read_versions(conn, names):
+    """读取 data_versions 中的版本号，没有记录的名字视为 0"""
+    names = list(names)
+    rows = conn.execute(
+        f"SELECT name, version FROM data_versions WHERE name IN ({', '.join('?' for _ in names)})", names
+    ).fetchall()
+    versions = dict.fromkeys(names, 0)
+    versions.update((row['name'], row['version']) for row in rows)
+    return versions
+
+
+class PageCache:
+    """根据数据版本号生成页面的 ETag，并按 ETag 缓存渲染好的页面（LRU）
+
+    ETag 由页面名、页面参数（用户、分页参数等）、相关版本号和 salt（模板版本）计算，
+    版本号不变时页面内容一定不变：客户端带着相同的 ETag 时直接返回 304，
+    其他客户端第一次打开同一页面时直接使用缓存的结果，不再查询和渲染。
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, salt=''):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.salt = salt
+        self._pages = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.not_modified = 0
+        self.hits = 0
+        self.misses = 0
+
+    def etag(self, conn, page, params, names):
+        versions = read_versions(conn, names)
+        key = repr((self.salt, page, params, sorted(versions.items())))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def get(self, etag):
+        with self._lock:
+            body = self._pages.get(etag)
+            if body is None:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(etag)
+            self.hits += 1
+            return body
+
+    def put(self, etag, body):
+        size = len(body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._pages.pop(etag, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._pages[etag] = body
+            self._bytes += size
+            while len(self._pages) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= len(self._pages.popitem(last=False)[1])
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._pages),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'not_modified': self.not_modified,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
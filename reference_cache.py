@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import OrderedDict
+
+# 缓存的参考数据：表名 -> (主键, 查询的列)；只缓存显示用的、很少变化的列
+REFERENCE_TABLES = {
+    'users': ('uid', ('uid', 'eid', 'username', 'utype', 'u_is_active')),
+    'employees': ('eid', ('eid', 'fname', 'lname', 'did', 'e_is_active')),
+    'departments': ('did', ('did', 'dname')),
+    'vehicles': ('vid', ('vid', 'plate', 'brand', 'model', 'capacity')),
+}
+
+# IN (...) 列表每次最多的参数个数
+_LOOKUP_CHUNK = 500
+
+
+class ReferenceCache:
+    """进程内的用户、员工、部门、车辆缓存，按 uid/eid/did/vid 查找，LRU 淘汰
+
+    数据库中每张参考表在 data_versions 里有一个由触发器维护的版本号，
+    最多每 check_interval 秒读取一次；某张表的版本变化（其他进程或直接改库）
+    时清空该表的缓存。本进程的管理员写操作还会调用 invalidate 立即失效。
+    """
+
+    def __init__(self, max_entries=10000, check_interval=1.0):
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self._entries = OrderedDict()   # (表名, 主键) -> dict
+        self._versions = {}
+        # 每次失效加一；加载前后不一致说明加载期间发生了失效，结果不放入缓存
+        self._generations = dict.fromkeys(REFERENCE_TABLES, 0)
+        self._checked = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_versions(self, conn):
+        now = time.monotonic()
+        with self._lock:
+            if self._checked is not None and now - self._checked < self.check_interval:
+                return
+            self._checked = now
+        versions = {row['name']: row['version'] for row in conn.execute(
+            f"SELECT name, version FROM data_versions WHERE name IN ({', '.join('?' for _ in REFERENCE_TABLES)})",
+            tuple(REFERENCE_TABLES))}
+        with self._lock:
+            changed = [table for table in REFERENCE_TABLES
+                       if table in self._versions and self._versions[table] != versions.get(table)]
+            self._versions = versions
+        for table in changed:
+            self.invalidate(table)
+
+    def get_many(self, conn, table, keys):
+        """返回 {主键: 行 dict}，不存在的主键不出现在结果中"""
+        self._check_versions(conn)
+        found = {}
+        missing = []
+        with self._lock:
+            for key in set(keys):
+                if key is None:
+                    continue
+                entry = self._entries.get((table, key))
+                if entry is None:
+                    missing.append(key)
+                else:
+                    self._entries.move_to_end((table, key))
+                    found[key] = entry
+            self.hits += len(found)
+            self.misses += len(missing)
+            generation = self._generations[table]
+
+        if missing:
+            pk, columns = REFERENCE_TABLES[table]
+            loaded = {}
+            for start in range(0, len(missing), _LOOKUP_CHUNK):
+                chunk = missing[start:start + _LOOKUP_CHUNK]
+                rows = conn.execute(f'''
+                    SELECT {', '.join(columns)} FROM {table}
+                    WHERE {pk} IN ({', '.join('?' for _ in chunk)})
+                ''', chunk).fetchall()
+                loaded.update((row[pk], dict(row)) for row in rows)
+            with self._lock:
+                if self._generations[table] == generation:
+                    for key, entry in loaded.items():
+                        self._entries[(table, key)] = entry
+                        self._entries.move_to_end((table, key))
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            found.update(loaded)
+        return found
+
+    def get(self, conn, table, key):
+        return self.get_many(conn, table, [key]).get(key)
+
+    def user(self, conn, uid):
+        return self.get(conn, 'users', uid)
+
+    def employee(self, conn, eid):
+        """员工信息，附带部门名称 dname"""
+        employee = self.get(conn, 'employees', eid)
+        if employee is None:
+            return None
+        department = self.get(conn, 'departments', employee['did'])
+        return dict(employee, dname=department['dname'] if department else None)
+
+    def trip_details(self, conn, trips):
+        """给行程行补上申请人、部门、车辆和司机的显示字段，返回 dict 列表
+
+        字段名与原来 JOIN 查询中的别名一致（fname、lname、dname、vehicle_plate、
+        vehicle_brand、driver_fname、driver_lname，以及 plate、brand、model）。
+        """
+        trips = [dict(trip) for trip in trips]
+        employees = self.get_many(conn, 'employees',
+                                  [trip['eid'] for trip in trips] +
+                                  [trip.get('assigned_eid') for trip in trips])
+        departments = self.get_many(conn, 'departments', [employee['did'] for employee in employees.values()])
+        vehicles = self.get_many(conn, 'vehicles', [trip.get('assigned_vid') for trip in trips])
+
+        for trip in trips:
+            requester = employees.get(trip['eid']) or {}
+            driver = employees.get(trip.get('assigned_eid')) or {}
+            vehicle = vehicles.get(trip.get('assigned_vid')) or {}
+            trip['fname'] = requester.get('fname')
+            trip['lname'] = requester.get('lname')
+            trip['dname'] = departments.get(requester.get('did'), {}).get('dname')
+            trip['driver_fname'] = driver.get('fname')
+            trip['driver_lname'] = driver.get('lname')
+            trip['plate'] = trip['vehicle_plate'] = vehicle.get('plate')
+            trip['brand'] = trip['vehicle_brand'] = vehicle.get('brand')
+            trip['model'] = vehicle.get('model')
+        return trips
+
+    def invalidate(self, table=None):
+        """清空某张参考表的缓存，table 为 None 时清空全部；其他表名没有影响"""
+        if table is not None and table not in REFERENCE_TABLES:
+            return
+        with self._lock:
+            self.invalidations += 1
+            if table is None:
+                self._entries.clear()
+                for name in self._generations:
+                    self._generations[name] += 1
+                return
+            self._generations[table] += 1
+            for key in [key for key in self._entries if key[0] == table]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'versions': dict(self._versions),
+            }
@@ -0,0 +1,163 @@
+import heapq
+import time
+from collections import deque
+
+from scheduling import TripChangeFollower
+
+
+class ApproverRouter(TripChangeFollower):
+    """把新申请分配给待审批数量最少的在职审批员
+
+    每个审批员的待审批数量保存在内存中：启动时从 trip_requests 加载，之后通过
+    trip_changes 增量更新（审批、拒绝、取消、管理员修改，以及其他进程的写入都会体现）。
+    全局和每个部门各维护一个 (待审批数, uid) 的最小堆，数量变化时压入新条目，
+    旧条目在弹出时惰性丢弃，因此每次分配为 O(log n)。
+
+    affinity_slack 为 None 时不考虑部门；否则申请人所在部门的审批员只要比全局
+    最空闲的审批员多出不超过 affinity_slack 条待审批，就优先分配给本部门。
+    """
+
+    columns = ('rid', 'current_status', 'approved_by')
+
+    def __init__(self, affinity_slack=None, roster_ttl=60.0, history=200):
+        super().__init__()
+        self.affinity_slack = affinity_slack
+        self.roster_ttl = roster_ttl
+        self.decisions = deque(maxlen=history)
+        self.routed = 0
+        self._roster = {}          # uid -> did
+        self._roster_loaded = None
+        self._load = {}            # uid -> 待审批数量（包括已离职审批员名下的）
+        self._pending = {}         # rid -> uid
+        self._heaps = {}           # None 为全局堆，其余为部门 did
+
+    # 跟随 trip_changes 维护待审批数量
+
+    def rebuild_query(self):
+        return '''
+            SELECT rid, current_status, approved_by
+            FROM trip_requests
+            WHERE current_status = 'pending' AND approved_by IS NOT NULL
+        ''', ()
+
+    def reset(self):
+        self._load.clear()
+        self._pending.clear()
+        self._rebuild_heaps()
+
+    def apply_row(self, row):
+        uid = row['approved_by'] if row['current_status'] == 'pending' else None
+        previous = self._pending.get(row['rid'])
+        if previous == uid:
+            return
+        if previous is not None:
+            del self._pending[row['rid']]
+            self._adjust(previous, -1)
+        if uid is not None:
+            self._pending[row['rid']] = uid
+            self._adjust(uid, 1)
+
+    def forget(self, rid):
+        previous = self._pending.pop(rid, None)
+        if previous is not None:
+            self._adjust(previous, -1)
+
+    def _adjust(self, uid, delta):
+        self._load[uid] = self._load.get(uid, 0) + delta
+        if uid in self._roster:
+            self._push(uid)
+
+    # 审批员名单和堆
+
+    def _push(self, uid):
+        entry = (self._load.get(uid, 0), uid)
+        heapq.heappush(self._heaps.setdefault(None, []), entry)
+        heapq.heappush(self._heaps.setdefault(self._roster[uid], []), entry)
+
+    def _rebuild_heaps(self):
+        self._heaps = {}
+        for uid in self._roster:
+            self._push(uid)
+
+    def refresh_roster(self, conn, force=False):
+        """重新加载在职审批员名单（默认最多每 roster_ttl 秒一次）"""
+        with self.lock:
+            now = time.monotonic()
+            if not force and self._roster_loaded is not None and now - self._roster_loaded < self.roster_ttl:
+                return
+            rows = conn.execute('''
+                SELECT u.uid, e.did
+                FROM users u
+                JOIN employees e ON u.eid = e.eid
+                WHERE u.utype = 'approver' AND u.u_is_active = 1 AND e.e_is_active = 1
+            ''').fetchall()
+            self._roster = {row['uid']: row['did'] for row in rows}
+            self._roster_loaded = now
+            self._rebuild_heaps()
+
+    def _peek(self, key):
+        """返回某个堆中当前有效的最小条目，顺便丢弃过期条目"""
+        heap = self._heaps.get(key)
+        while heap:
+            count, uid = heap[0]
+            if uid in self._roster and self._load.get(uid, 0) == count and (key is None or self._roster[uid] == key):
+                return count, uid
+            heapq.heappop(heap)
+        return None
+
+    def route(self, conn, did=None, requester=None):
+        """选出待审批数量最少的审批员，没有在职审批员时返回 None"""
+        with self.lock:
+            self.refresh_roster(conn)
+            self.sync(conn)
+
+            best = self._peek(None)
+            if best is None:
+                return None
+            reason = 'least_loaded'
+
+            if self.affinity_slack is not None and did is not None:
+                local = self._peek(did)
+                if local is not None and local[0] <= best[0] + self.affinity_slack:
+                    best = local
+                    reason = 'department'
+
+            # 堆中过期条目过多时整体重建，避免无限增长
+            if len(self._heaps.get(None, [])) > 4 * len(self._roster) + 64:
+                self._rebuild_heaps()
+
+            count, uid = best
+            self.routed += 1
+            self.decisions.append({
+                'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'requester_eid': requester,
+                'requester_did': did,
+                'approver_uid': uid,
+                'approver_did': self._roster[uid],
+                'pending_before': count,
+                'reason': reason,
+            })
+            return uid
+
+    def queue_depths(self):
+        """返回每个在职审批员的待审批数量，以及负载不均衡程度"""
+        with self.lock:
+            depths = sorted(({'uid': uid, 'did': did, 'pending': self._load.get(uid, 0)}
+                             for uid, did in self._roster.items()),
+                            key=lambda item: (-item['pending'], item['uid']))
+            counts = [item['pending'] for item in depths]
+            mean = sum(counts) / len(counts) if counts else 0.0
+            return {
+                'approvers': depths,
+                'total_pending': sum(counts),
+                'max': max(counts, default=0),
+                'min': min(counts, default=0),
+                'mean': round(mean, 2),
+                'stddev': round((sum((c - mean) ** 2 for c in counts) / len(counts)) ** 0.5, 2) if counts else 0.0,
+                'unassigned_pending': sum(count for uid, count in self._load.items()
+                                          if uid not in self._roster and count > 0),
+            }
+
+    def stats(self):
+        with self.lock:
+            return {'approvers': len(self._roster), 'routed': self.routed, **super().stats()}
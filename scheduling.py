@@ -0,0 +1,452 @@
+import bisect
+import heapq
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+# 占用车辆和司机的行程状态
+ACTIVE_TRIP_STATUSES = ('assigned', 'in_progress')
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def find_overlaps(intervals):
+    """扫描线检测区间冲突，返回所有互相重叠的 (key_a, key_b) 对
+
+    intervals 为 (start, end, key) 的可迭代对象，start/end 可以是任何可比较的值
+    （例如 'YYYY-MM-DD HH:MM:SS' 字符串）。与原有判断一致，端点相接也算冲突。
+    按开始时间排序后维护一个按结束时间排序的最小堆，复杂度 O(n log n + k)，
+    k 为冲突对数量。
+    """
+    active = []  # (end, seq, key)
+    pairs = []
+    for seq, (start, end, key) in enumerate(sorted(intervals, key=lambda item: (item[0], item[1]))):
+        # 结束时间早于当前开始时间的区间不会再和后面的任何区间重叠
+        while active and active[0][0] < start:
+            heapq.heappop(active)
+        for _, _, other in active:
+            pairs.append((other, key))
+        heapq.heappush(active, (end, seq, key))
+    return pairs
+
+
+def conflict_map(intervals):
+    """返回 {key: [与之冲突的 key, ...]}，只包含有冲突的 key"""
+    conflicts = defaultdict(list)
+    for a, b in find_overlaps(intervals):
+        conflicts[a].append(b)
+        conflicts[b].append(a)
+    return dict(conflicts)
+
+
+def find_double_bookings(trips, resources=('assigned_eid', 'assigned_vid')):
+    """一次扫描找出全车队中被重复预约的司机和车辆
+
+    trips 为包含 rid、start_time、end_time 以及资源列的映射（如 sqlite3.Row）。
+    所有行程只排序一次，然后按 (资源列, 资源ID) 分别维护活动堆。
+    返回 {资源列: {资源ID: [(rid_a, rid_b), ...]}}。
+    """
+    ordered = sorted(trips, key=lambda trip: (trip['start_time'], trip['end_time']))
+    active = defaultdict(list)
+    result = {column: defaultdict(list) for column in resources}
+
+    for seq, trip in enumerate(ordered):
+        for column in resources:
+            resource_id = trip[column]
+            if resource_id is None:
+                continue
+            heap = active[(column, resource_id)]
+            while heap and heap[0][0] < trip['start_time']:
+                heapq.heappop(heap)
+            for _, _, other_rid in heap:
+                result[column][resource_id].append((other_rid, trip['rid']))
+            heapq.heappush(heap, (trip['end_time'], seq, trip['rid']))
+
+    return {column: dict(found) for column, found in result.items()}
+
+
+def to_seconds(value):
+    """把 'YYYY-MM-DD HH:MM[:SS]' 形式的时间转换为秒数，便于区间计算"""
+    moment = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    return int((moment - _EPOCH).total_seconds())
+
+
+class IntervalCalendar:
+    """按资源（司机、车辆）维护的有序区间日历
+
+    每个资源一个按开始时间排序的列表，同时记录该资源最长的区间长度。
+    与 [start, end] 重叠的区间的开始时间一定落在 [start - 最长区间, end] 内，
+    因此用二分查找定位候选区间，单个资源的空闲判断为 O(log n + k)。
+    """
+
+    def __init__(self):
+        self._items = defaultdict(list)     # 资源 -> [(start, end, rid), ...]
+        self._max_length = defaultdict(int)
+        self._where = {}                    # rid -> (资源, start, end)
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, rid):
+        return rid in self._where
+
+    def resources(self):
+        return [resource for resource, items in self._items.items() if items]
+
+    def add(self, resource, start, end, rid):
+        self.remove(rid)
+        bisect.insort(self._items[resource], (start, end, rid))
+        self._max_length[resource] = max(self._max_length[resource], end - start)
+        self._where[rid] = (resource, start, end)
+
+    def remove(self, rid):
+        entry = self._where.pop(rid, None)
+        if entry is None:
+            return
+        resource, start, end = entry
+        items = self._items[resource]
+        index = bisect.bisect_left(items, (start, end, rid))
+        if index < len(items) and items[index] == (start, end, rid):
+            del items[index]
+        if not items:
+            del self._items[resource]
+            self._max_length.pop(resource, None)
+
+    def clear(self):
+        self._items.clear()
+        self._max_length.clear()
+        self._where.clear()
+
+    def overlapping(self, resource, start, end):
+        """返回该资源与 [start, end] 重叠的行程ID（端点相接也算重叠）"""
+        items = self._items.get(resource)
+        if not items:
+            return []
+        low = bisect.bisect_left(items, (start - self._max_length[resource],))
+        high = bisect.bisect_right(items, (end, float('inf')))
+        return [rid for item_start, item_end, rid in items[low:high] if item_end >= start]
+
+    def is_free(self, resource, start, end, ignore=()):
+        return not any(rid not in ignore for rid in self.overlapping(resource, start, end))
+
+    def free(self, candidates, start, end, ignore=()):
+        """从候选资源中筛选出在 [start, end] 内空闲的资源"""
+        return [resource for resource in candidates if self.is_free(resource, start, end, ignore)]
+
+    def bookings(self, resource):
+        return list(self._items.get(resource, []))
+
+    def idle_before(self, resource, start):
+        """该资源在 start 之前最近一次预约结束后空闲了多久（没有更早的预约时为无穷大）"""
+        items = self._items.get(resource)
+        if not items:
+            return float('inf')
+        index = bisect.bisect_left(items, (start,))
+        if index == 0:
+            return float('inf')
+        return max(start - items[index - 1][1], 0)
+
+    def usage(self, resource, start, end):
+        """统计 [start, end] 内的占用时长和空闲片段，返回 (busy, [gap, ...])"""
+        items = self._items.get(resource, [])
+        low = bisect.bisect_left(items, (start - self._max_length.get(resource, 0),))
+        high = bisect.bisect_right(items, (end, float('inf')))
+
+        busy = 0
+        gaps = []
+        cursor = start
+        for item_start, item_end, _ in items[low:high]:
+            item_start, item_end = max(item_start, start), min(item_end, end)
+            if item_end <= cursor:
+                continue
+            if item_start > cursor:
+                gaps.append(item_start - cursor)
+                cursor = item_start
+            busy += item_end - cursor
+            cursor = item_end
+        if cursor < end:
+            gaps.append(end - cursor)
+        return busy, gaps
+
+
+def pick_vehicle(calendar, vehicles, start, end):
+    """在时间段内空闲的车辆中选出容量最小的一辆，同容量时选空档衔接最紧的
+
+    vehicles 为 [(vid, capacity), ...]，应已按乘客人数过滤。没有合适车辆时返回 None。
+    """
+    best = None
+    for vid, capacity in vehicles:
+        if not calendar.is_free(vid, start, end):
+            continue
+        rank = (capacity, calendar.idle_before(vid, start), vid)
+        if best is None or rank < best[0]:
+            best = (rank, vid)
+    return best[1] if best else None
+
+
+def fleet_usage(calendar, vehicles, start, end):
+    """统计车队在 [start, end] 内的利用率和碎片化程度
+
+    vehicles 为 [(vid, capacity), ...]。碎片化 = 1 - 最大空闲片段 / 总空闲时长，
+    0 表示空闲时间是连续的一整段，越接近 1 说明空闲时间被零散的预约切得越碎。
+    """
+    window = end - start
+    per_vehicle = []
+    classes = defaultdict(lambda: {'vehicles': 0, 'busy': 0, 'fragmentation': 0.0})
+
+    for vid, capacity in vehicles:
+        busy, gaps = calendar.usage(vid, start, end)
+        free_time = sum(gaps)
+        fragmentation = 1 - max(gaps) / free_time if free_time else 0.0
+        per_vehicle.append({
+            'vid': vid,
+            'capacity': capacity,
+            'busy_hours': round(busy / 3600, 2),
+            'utilization': round(busy / window, 4) if window else 0.0,
+            'free_gaps': len(gaps),
+            'largest_free_gap_hours': round(max(gaps, default=0) / 3600, 2),
+            'fragmentation': round(fragmentation, 4),
+        })
+        summary = classes[capacity]
+        summary['vehicles'] += 1
+        summary['busy'] += busy
+        summary['fragmentation'] += fragmentation
+
+    by_capacity = [{
+        'capacity': capacity,
+        'vehicles': summary['vehicles'],
+        'utilization': round(summary['busy'] / (window * summary['vehicles']), 4) if window else 0.0,
+        'fragmentation': round(summary['fragmentation'] / summary['vehicles'], 4),
+    } for capacity, summary in sorted(classes.items())]
+
+    total_busy = sum(summary['busy'] for summary in classes.values())
+    return {
+        'vehicles': len(per_vehicle),
+        'utilization': round(total_busy / (window * len(per_vehicle)), 4) if window and per_vehicle else 0.0,
+        'fragmentation': round(sum(v['fragmentation'] for v in per_vehicle) / len(per_vehicle), 4) if per_vehicle else 0.0,
+        'by_capacity': by_capacity,
+        'per_vehicle': per_vehicle,
+    }
+
+
+class TripChangeFollower:
+    """跟随 trip_changes 日志维护的内存状态的基类
+
+    数据库中的触发器把每次行程变更记录到 trip_changes。sync() 只读取上次同步
+    之后变更过的行程并交给 apply_row()，已删除的行程交给 forget()；日志被清理
+    或首次使用时调用 rebuild() 整体重建。这样重启后、以及其他进程写入后都能保持一致。
+    子类需要实现 columns、rebuild_query()、reset()、apply_row() 和 forget()。
+    """
+
+    columns = ('rid', 'current_status')
+
+    def __init__(self):
+        self.last_seq = None
+        self.rebuilds = 0
+        self.incremental_syncs = 0
+        self.changes_applied = 0
+        self.lock = threading.RLock()
+
+    def rebuild_query(self):
+        """返回 (sql, params)，查询重建时需要加载的行程"""
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+    def apply_row(self, row):
+        raise NotImplementedError
+
+    def forget(self, rid):
+        raise NotImplementedError
+
+    def rebuild(self, conn):
+        """从数据库整体重建（在同一个读事务中读取日志位置和行程，保证一致）"""
+        sql, params = self.rebuild_query()
+        with self.lock:
+            began = not conn.in_transaction
+            if began:
+                conn.execute('BEGIN')
+            try:
+                last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM trip_changes').fetchone()[0]
+                rows = conn.execute(sql, params).fetchall()
+            finally:
+                if began:
+                    conn.rollback()
+
+            self.reset()
+            for row in rows:
+                self.apply_row(row)
+            self.last_seq = last_seq
+            self.rebuilds += 1
+
+    def sync(self, conn):
+        """应用 trip_changes 中上次同步之后的变更"""
+        with self.lock:
+            if self.last_seq is None:
+                self.rebuild(conn)
+                return
+
+            bounds = conn.execute('SELECT MIN(seq), MAX(seq) FROM trip_changes').fetchone()
+            min_seq, max_seq = bounds[0], bounds[1]
+            if max_seq is None or max_seq <= self.last_seq:
+                return
+            if min_seq > self.last_seq + 1:
+                # 需要的日志已经被清理，只能重建
+                self.rebuild(conn)
+                return
+
+            changed = conn.execute('''
+                SELECT DISTINCT rid FROM trip_changes WHERE seq > ? AND seq <= ?
+            ''', (self.last_seq, max_seq)).fetchall()
+            rids = [row['rid'] for row in changed]
+            found = set()
+            for offset in range(0, len(rids), 500):
+                chunk = rids[offset:offset + 500]
+                placeholders = ', '.join('?' for _ in chunk)
+                for row in conn.execute(f'''
+                    SELECT {', '.join(self.columns)}
+                    FROM trip_requests WHERE rid IN ({placeholders})
+                ''', chunk):
+                    found.add(row['rid'])
+                    self.apply_row(row)
+            for rid in rids:
+                if rid not in found:
+                    self.forget(rid)
+
+            self.last_seq = max_seq
+            self.incremental_syncs += 1
+            self.changes_applied += len(rids)
+
+    def invalidate(self):
+        """下次 sync() 时整体重建（内存状态可能已经应用了没有提交的变更）"""
+        with self.lock:
+            self.last_seq = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'last_seq': self.last_seq,
+                'rebuilds': self.rebuilds,
+                'incremental_syncs': self.incremental_syncs,
+                'changes_applied': self.changes_applied,
+            }
+
+
+class BookingIndex(TripChangeFollower):
+    """由 trip_requests 中占用资源的行程构建的内存日历
+
+    column 为资源列（assigned_eid 或 assigned_vid），只收录 statuses 中的行程。
+    """
+
+    def __init__(self, column, statuses=ACTIVE_TRIP_STATUSES):
+        super().__init__()
+        self.column = column
+        self.statuses = tuple(statuses)
+        self.columns = ('rid', 'current_status', column, 'start_time', 'end_time')
+        self.calendar = IntervalCalendar()
+
+    def rebuild_query(self):
+        placeholders = ', '.join('?' for _ in self.statuses)
+        return f'''
+            SELECT {', '.join(self.columns)}
+            FROM trip_requests
+            WHERE current_status IN ({placeholders}) AND {self.column} IS NOT NULL
+        ''', self.statuses
+
+    def reset(self):
+        self.calendar.clear()
+
+    def forget(self, rid):
+        self.calendar.remove(rid)
+
+    def apply_row(self, row):
+        if (row['current_status'] in self.statuses and row[self.column] is not None
+                and row['start_time'] and row['end_time']):
+            try:
+                start, end = to_seconds(row['start_time']), to_seconds(row['end_time'])
+            except ValueError:
+                self.calendar.remove(row['rid'])
+                return
+            self.calendar.add(row[self.column], start, end, row['rid'])
+        else:
+            self.calendar.remove(row['rid'])
+
+    def free(self, conn, candidates, start_time, end_time):
+        """同步后返回在该时间段内空闲的候选资源"""
+        start, end = to_seconds(start_time), to_seconds(end_time)
+        with self.lock:
+            self.sync(conn)
+            return self.calendar.free(candidates, start, end)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'resources': len(self.calendar.resources()),
+                'bookings': len(self.calendar),
+                **super().stats(),
+            }
+
+
+def match_intervals(items, candidates, exclusive=False, cost=None):
+    """为一批区间分配资源（增广路二分匹配）
+
+    items 为 {key: (start, end)}，candidates 为 {key: [可用资源, ...]}（候选资源
+    已经排除了与数据库中已有行程冲突的资源）。exclusive=True 时每个资源只能分给
+    一个区间（标准二分匹配，结果为最大匹配）；否则同一资源可以分给批内互不重叠的
+    多个区间：优先放到衔接最紧的空闲资源上，没有空闲资源时才通过增广路
+    挪走唯一的冲突区间。cost(资源) 可选，空闲资源中优先选择代价最小的
+    （例如容量最小的车辆）。
+    按开始时间依次处理，返回 {key: 资源}，未能分配的 key 不在结果中。
+    """
+    assigned = {}                       # key -> 资源
+    holders = defaultdict(list)         # 资源 -> [key, ...]
+
+    def blockers(resource, key):
+        start, end = items[key]
+        if exclusive:
+            return list(holders[resource])
+        return [other for other in holders[resource]
+                if items[other][0] <= end and items[other][1] >= start]
+
+    def place(key, resource):
+        assigned[key] = resource
+        holders[resource].append(key)
+
+    def unplace(key):
+        holders[assigned.pop(key)].remove(key)
+
+    def gap_before(resource, key):
+        # 该资源在此区间开始前最后一个区间的结束时间，越晚说明排得越紧凑
+        start = items[key][0]
+        return max((items[other][1] for other in holders[resource] if items[other][1] < start),
+                   default=float('-inf'))
+
+    def augment(key, visited):
+        options = [resource for resource in candidates.get(key, []) if resource not in visited]
+
+        # 优先直接放到空闲资源上（选衔接最紧的），避免不必要的挪动
+        free = [resource for resource in options if not blockers(resource, key)]
+        if free:
+            place(key, min(free, key=lambda resource: (cost(resource) if cost else 0,
+                                                        -gap_before(resource, key))))
+            return True
+
+        for resource in options:
+            if resource in visited:
+                continue
+            visited.add(resource)
+            blocking = blockers(resource, key)
+            if len(blocking) == 1:
+                other = blocking[0]
+                unplace(other)
+                if augment(other, visited):
+                    place(key, resource)
+                    return True
+                place(other, resource)
+        return False
+
+    for key in sorted(items, key=lambda k: items[k]):
+        augment(key, set())
+
+    return assigned
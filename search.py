@@ -0,0 +1,126 @@
+import re
+import sqlite3
+
+# trip_search 中建立全文索引的列（与迁移 10 中的顺序一致）
+SEARCH_COLUMNS = ('destination', 'notes', 'rejection_reason')
+# 摘要中匹配词的标记（结果是 JSON，不输出 HTML 标签）
+HIGHLIGHT = ('**', '**')
+MAX_TERMS = 16
+
+# 双引号括起的短语，或不含空白和引号的一段文字
+_TERMS = re.compile(r'"([^"]*)"?|([^\s"]+)')
+_WORDS = re.compile(r'\w+')
+
+
+def match_query(text, columns=None):
+    """把用户输入的搜索文字转换为 FTS5 查询，没有可搜索的词时返回 None
+
+    每个词都加引号按字面匹配（不解析 FTS5 的运算符），词之间是 AND；双引号括起的部分
+    按短语匹配，最后一个词按前缀匹配（边输入边搜索）。columns 限定只搜索这些列。
+    """
+    terms = []
+    prefix = False
+    for phrase, chunk in _TERMS.findall(text or ''):
+        words = _WORDS.findall(phrase or chunk)
+        if words:
+            terms.append('"' + ' '.join(words) + '"')
+            prefix = not phrase
+    if not terms:
+        return None
+    terms = terms[:MAX_TERMS]
+    if prefix and len(terms) < MAX_TERMS:
+        terms[-1] += '*'
+    query = ' '.join(terms)
+    if columns:
+        query = '{' + ' '.join(columns) + '} : (' + query + ')'
+    return query
+
+
+def check_query(conn, query):
+    """检查 FTS5 查询 query 能否执行（只读第一条匹配），不能时抛出 sqlite3.OperationalError"""
+    conn.execute('SELECT rowid FROM trip_search WHERE trip_search MATCH ? LIMIT 1', (query,)).fetchone()
+
+
+def search(conn, query, limit, scope=None, statuses=None, source='trip_requests_all', after=None,
+           max_candidates=5000):
+    """按相关度返回匹配 FTS5 查询 query 的行程，返回 ([(rid, score)]，最多 limit 条, 还有下一页, truncated)
+
+    相关度是 bm25（迁移 10 中设置的 rank，destination 的权重最高），score 越小越相关。
+    只对最近的 max_candidates 条匹配（rid 越大越新）打分排序，常见词匹配再多也只读这么多行；
+    truncated 表示更早的匹配没有参与排序。scope 为 (列名, 值) 时只返回该列等于值的行程
+    （调用者的角色可以看到的范围），statuses 限定状态；source 为 trip_requests 时不读取归档表；
+    after 为上一页最后一条的 (score, rid)。
+    """
+    conditions = ['trip_search MATCH ?']
+    params = [query]
+    joins = []
+    if scope or statuses:
+        # 先按 rowid 从新到旧读取匹配，再按主键查找行程的列。不能 JOIN trip_requests_all：
+        # 查询规划器可能先取出该用户的全部行程，再对每一行单独执行 MATCH。
+        # CROSS JOIN 和 LEFT JOIN 都固定了连接顺序
+        if source == 'trip_requests':
+            joins.append('CROSS JOIN trip_requests h ON h.rid = s.rowid')
+            column = 'h.{}'.format
+        else:
+            joins.append('LEFT JOIN trip_requests h ON h.rid = s.rowid')
+            joins.append('LEFT JOIN trip_requests_archive a ON a.rid = s.rowid')
+            column = 'COALESCE(h.{0}, a.{0})'.format
+        if scope:
+            conditions.append(f'{column(scope[0])} = ?')
+            params.append(scope[1])
+        if statuses:
+            conditions.append(f"{column('current_status')} IN ({', '.join('?' for _ in statuses)})")
+            params.extend(statuses)
+    params.append(max_candidates)
+
+    page = ''
+    if after is not None:
+        page = 'WHERE score > ? OR (score = ? AND rid < ?)'
+        params.extend([after[0], after[0], after[1]])
+    params.append(limit + 1)
+
+    rows = conn.execute(f'''
+        SELECT rid, score, candidates
+        FROM (
+            SELECT rid, score, COUNT(*) OVER () AS candidates
+            FROM (
+                SELECT s.rowid AS rid, s.rank AS score
+                FROM trip_search s {' '.join(joins)}
+                WHERE {' AND '.join(conditions)}
+                ORDER BY s.rowid DESC
+                LIMIT ?
+            )
+        )
+        {page}
+        ORDER BY score, rid DESC
+        LIMIT ?
+    ''', params).fetchall()
+
+    truncated = bool(rows) and rows[0]['candidates'] >= max_candidates
+    return [(row['rid'], row['score']) for row in rows[:limit]], len(rows) > limit, truncated
+
+
+def hits(conn, query, rids, source='trip_requests_all'):
+    """读取 rids 中的行程和匹配部分的摘要，返回 {rid: 行程 dict（含 snippet）}"""
+    if not rids:
+        return {}
+    rows = conn.execute(f'''
+        SELECT tr.*, snippet(trip_search, -1, ?, ?, '…', 16) AS snippet
+        FROM trip_search s
+        JOIN {source} tr ON tr.rid = s.rowid
+        WHERE trip_search MATCH ? AND s.rowid IN ({', '.join('?' for _ in rids)})
+    ''', (*HIGHLIGHT, query, *rids)).fetchall()
+    return {row['rid']: dict(row) for row in rows}
+
+
+def rebuild(conn):
+    """按 trip_requests 和 trip_requests_archive 重建全文索引 trip_search（在一个事务中），返回索引的行程数"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute("INSERT INTO trip_search (trip_search) VALUES ('rebuild')")
+        total = conn.execute('SELECT COUNT(*) FROM trip_requests_all').fetchone()[0]
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return total
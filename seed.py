@@ -1,9 +1,17 @@
+import argparse
+import heapq
+import math
+import multiprocessing
 import sqlite3
 import random
 import re
+import time
 from datetime import datetime, timedelta
 from faker import Faker
 
+import search
+import trip_stats
+
 # 初始化 Faker，使用英文环境
 fake = Faker('en_US')
 
@@ -20,11 +28,27 @@ USER_TYPES = {
 }
 VEHICLE_STATUSES = ['available', 'assigned', 'maintenance', 'scrapped']
 
-# 注意：Schema中存在中文逗号导致约束问题，为避免报错，仅使用前两个确定的目的
-TRIP_PURPOSES = ['business trip', 'company tour']
-# TRIP_PURPOSES = ['business trip', 'company tour', 'cargo transport', 'client pickup']
+TRIP_PURPOSES = ['business trip', 'company tour', 'cargo transport', 'client pickup']
+
+# 与 trip_requests.current_status 的 CHECK 约束一致（小写）
+TRIP_STATUSES = ['pending', 'assigned', 'in_progress', 'completed', 'rejected', 'cancelled']
 
-TRIP_STATUSES = ['Pending', 'Approved', 'Rejected', 'Completed', 'Cancelled']
+VEHICLE_BRANDS = [
+    ('Toyota', ['Camry', 'HiAce', 'Coaster']),
+    ('Ford', ['Transit', 'F-150']),
+    ('Honda', ['Odyssey', 'CR-V']),
+    ('Mercedes', ['Sprinter', 'V-Class'])
+]
+VEHICLE_COLORS = ['White', 'Black', 'Silver', 'Blue', 'Red']
+VEHICLE_CAPACITIES = [4, 6, 7, 15, 20]
+
+REJECTION_REASONS = [
+    'No available vehicles',
+    'Insufficient justification',
+    'Please use public transport',
+    'Duplicate request',
+    'Budget limit reached for this month',
+]
 
 
 def get_db_connection():
@@ -49,14 +73,22 @@ def clean_database(conn):
     """清空现有数据"""
     print("正在清空旧数据...")
     # 注意表名必须与数据库完全一致
-    tables = ['trip_requests', 'vehicles', 'users', 'employees', 'departments']
+    tables = ['trip_telemetry', 'vehicle_daily_usage', 'trip_requests_archive', 'trip_requests', 'vehicles', 'users',
+              'employees', 'departments']
     cursor = conn.cursor()
+    # trip_telemetry 只允许追加，清空时暂时去掉禁止删除的触发器
+    guard = cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trip_telemetry_no_delete'").fetchone()
+    if guard:
+        cursor.execute("DROP TRIGGER trip_telemetry_no_delete")
     for table in tables:
         try:
             cursor.execute(f"DELETE FROM {table}")
             cursor.execute(f"DELETE FROM sqlite_sequence WHERE name='{table}'")  # 重置自增ID
         except sqlite3.Error as e:
             print(f"提示: 清理表 {table} 时遇到状态: {e}")
+    if guard:
+        cursor.execute(guard[0])
     conn.commit()
     print("旧数据已清空。")
 
@@ -170,13 +202,8 @@ def create_vehicles(conn):
     print("正在生成车辆...")
     cursor = conn.cursor()
 
-    brands = [
-        ('Toyota', ['Camry', 'HiAce', 'Coaster']),
-        ('Ford', ['Transit', 'F-150']),
-        ('Honda', ['Odyssey', 'CR-V']),
-        ('Mercedes', ['Sprinter', 'V-Class'])
-    ]
-    colors = ['White', 'Black', 'Silver', 'Blue', 'Red']
+    brands = VEHICLE_BRANDS
+    colors = VEHICLE_COLORS
 
     vehicle_ids = []
 
@@ -191,7 +218,7 @@ def create_vehicles(conn):
         plate_nums = "".join(random.choices("0123456789", k=4))
         plate = f"{plate_letters}-{plate_nums}"
 
-        capacity = random.choice([4, 6, 7, 15, 20])
+        capacity = random.choice(VEHICLE_CAPACITIES)
         status = random.choice(['available', 'available', 'available', 'maintenance', 'assigned'])
         mileage = round(random.uniform(1000, 150000), 2)
         fuel = round(random.uniform(10, 60), 2)
@@ -215,21 +242,26 @@ def create_trip_requests(conn, employees, drivers, approvers, vehicle_ids):
     print("正在生成行程记录...")
     cursor = conn.cursor()
 
+    # approved_by 引用的是审批员的 users.uid，而不是员工 eid
+    approver_uids = [row[0] for row in cursor.execute(
+        f"SELECT uid FROM users WHERE eid IN ({','.join('?' for _ in approvers)})", approvers
+    )] if approvers else []
+
     for _ in range(200):
         requester = random.choice(employees)
         eid = requester['eid']
 
         purpose = random.choice(TRIP_PURPOSES)
         destination = fake.address().replace('\n', ', ')
-        num_passengers = random.randint(1, 10)
+        passenger_number = random.randint(1, 10)
 
         is_past = random.choice([True, True, False])
         if is_past:
             start_time = fake.date_time_between(start_date='-60d', end_date='now')
-            status_choices = ['Completed', 'Rejected', 'Cancelled']
+            status_choices = ['completed', 'rejected', 'cancelled']
         else:
             start_time = fake.date_time_between(start_date='now', end_date='+30d')
-            status_choices = ['Pending', 'Approved']
+            status_choices = ['pending', 'assigned']
 
         duration_hours = random.randint(1, 48)
         end_time = start_time + timedelta(hours=duration_hours)
@@ -239,30 +271,31 @@ def create_trip_requests(conn, employees, drivers, approvers, vehicle_ids):
 
         current_status = random.choice(status_choices)
 
-        approver_id = None
-        driver_id = None
-        vid = None
+        # 新申请提交时就分配了审批员
+        approved_by = random.choice(approver_uids) if approver_uids else None
+        assigned_eid = None
+        assigned_vid = None
+        rejection_reason = None
 
-        if current_status in ['Approved', 'Completed']:
-            if approvers:
-                approver_id = random.choice(approvers)
+        if current_status in ['assigned', 'completed']:
             if drivers:
-                driver_id = random.choice(drivers)
+                assigned_eid = random.choice(drivers)
             if vehicle_ids:
-                vid = random.choice(vehicle_ids)
+                assigned_vid = random.choice(vehicle_ids)
 
-        elif current_status == 'Rejected':
-            if approvers:
-                approver_id = random.choice(approvers)
+        elif current_status == 'rejected':
+            rejection_reason = random.choice(REJECTION_REASONS)
 
         try:
             # 确保表名是 trip_requests
             cursor.execute('''
                 INSERT INTO trip_requests 
-                (eid, purpose, destination, start_time, end_time, num_passengers, current_status, approver_id, driver_id, vid)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                (eid, purpose, destination, start_time, end_time, passenger_number, current_status,
+                 approved_by, assigned_eid, assigned_vid, rejection_reason)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
-            eid, purpose, destination, start_str, end_str, num_passengers, current_status, approver_id, driver_id, vid))
+            eid, purpose, destination, start_str, end_str, passenger_number, current_status,
+            approved_by, assigned_eid, assigned_vid, rejection_reason))
         except sqlite3.Error as e:
             print(f"插入行程记录失败: {e}")
             # 如果是表名错误，在这里会打印出来
@@ -271,6 +304,433 @@ def create_trip_requests(conn, employees, drivers, approvers, vehicle_ids):
     conn.commit()
 
 
+# ---------------- 大规模数据生成（python seed.py --scale ...） ----------------
+
+SCALE_DEPARTMENT_NAMES = [
+    'Human Resources', 'Sales', 'IT Department', 'Logistics', 'Finance', 'Marketing',
+    'Procurement', 'Legal', 'Customer Service', 'Research', 'Operations', 'Quality Assurance',
+    'Facilities', 'Security', 'Training', 'Public Relations'
+]
+
+# 每个小时出发的相对权重：早高峰和午后最多，夜间很少
+START_HOUR_WEIGHTS = [0.1, 0.05, 0.05, 0.05, 0.1, 0.3, 0.8, 2.0, 3.0, 2.5, 2.0, 1.5,
+                      1.2, 2.0, 2.2, 1.8, 1.4, 1.0, 0.7, 0.5, 0.3, 0.2, 0.15, 0.1]
+# 周一到周日的相对出行量
+WEEKDAY_WEIGHTS = [1.0, 1.0, 1.0, 1.0, 0.9, 0.3, 0.2]
+# 各用途：(权重, 行程时长中位数（小时）, 乘客人数范围)
+PURPOSE_PROFILES = {
+    'business trip': (0.45, 4.0, (1, 4)),
+    'company tour': (0.10, 8.0, (5, 20)),
+    'cargo transport': (0.20, 3.0, (1, 2)),
+    'client pickup': (0.25, 1.5, (1, 6)),
+}
+
+# 大规模写入时使用的 pragma：数据可以重新生成，因此关闭日志和同步
+SCALE_PRAGMAS = [
+    "PRAGMA foreign_keys = OFF",
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA locking_mode = EXCLUSIVE",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",
+]
+
+_context = None
+
+
+def _init_worker(context):
+    """工作进程初始化：保存所有分块共享的参数"""
+    global _context
+    _context = context
+
+
+def _rng(*parts):
+    """由种子和分块编号得到独立的随机数生成器，结果与进程数无关"""
+    return random.Random(':'.join(str(part) for part in parts))
+
+
+def _format_ts(ts):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+
+
+def _role_ranges(args):
+    """按 eid 顺序划分角色：经理、司机、审批员、数据库管理员，其余为普通员工"""
+    managers = args.departments
+    drivers = managers + args.drivers
+    approvers = drivers + args.approvers
+    admins = approvers + 1
+    return {
+        'manager': (1, managers),
+        'driver': (managers + 1, drivers),
+        'approver': (drivers + 1, approvers),
+        'database_manager': (approvers + 1, admins),
+        'employee': (admins + 1, args.employees),
+    }
+
+
+def _role_of(eid, ranges):
+    for role, (first, last) in ranges.items():
+        if first <= eid <= last:
+            return role
+    return 'employee'
+
+
+def generate_employee_chunk(bounds):
+    """生成一块员工和用户记录（eid、uid 与序号一致，用户名包含 eid，因此不会重复）"""
+    first, last = bounds
+    ctx = _context
+    rng = _rng(ctx['seed'], 'employees', first)
+    chunk_fake = Faker('en_US')
+    chunk_fake.seed_instance(f"{ctx['seed']}:employees:{first}")
+    join_start = ctx['now'] - 10 * 365 * 86400
+
+    employees = []
+    users = []
+    for eid in range(first, last + 1):
+        role = _role_of(eid, ctx['roles'])
+        did = eid if role == 'manager' else rng.randint(1, ctx['departments'])
+        fname = chunk_fake.first_name()
+        lname = chunk_fake.last_name()
+        phone = f"({rng.randint(200, 999)}){rng.randint(200, 999)}{rng.randint(0, 9999):04d}"
+        email = f"{fname.lower()}.{lname.lower()}{eid}@company.com"
+        # 少量普通员工已离职
+        active = 0 if role == 'employee' and rng.random() < 0.02 else 1
+        join_date = _format_ts(join_start + rng.random() * (ctx['now'] - join_start))[:10]
+        employees.append((eid, fname, lname, phone, email, role, did, active, join_date))
+        users.append((eid, 'password123', f"{fname.lower()}{eid}", eid, active, USER_TYPES[role]))
+    return employees, users
+
+
+def generate_vehicles(args):
+    """生成车辆（车牌由序号决定，不会重复）"""
+    rng = _rng(args.seed, 'vehicles')
+    vehicles = []
+    for vid in range(1, args.vehicles + 1):
+        brand, models = rng.choice(VEHICLE_BRANDS)
+        index = vid - 1
+        # 7919 与 26^3 互质，三个字母在前 17576 辆车中互不相同
+        letters_index = (index * 7919) % 17576
+        letters = ''.join(chr(ord('A') + (letters_index // 26 ** k) % 26) for k in (2, 1, 0))
+        plate = f"{letters}-{(index // 17576) * 1000 + rng.randint(0, 999):04d}"
+        status = rng.choices(['available', 'maintenance', 'scrapped'], weights=[92, 6, 2])[0]
+        vehicles.append((vid, plate, brand, rng.choice(models), rng.choice(VEHICLE_CAPACITIES),
+                         rng.choice(VEHICLE_COLORS), status,
+                         round(rng.uniform(1000, 150000), 2), round(rng.uniform(10, 60), 2)))
+    return vehicles
+
+
+class _ResourcePool:
+    """按出发时间顺序分配司机或车辆：从空闲的里随机挑一个，都在忙时返回 None"""
+
+    def __init__(self, ids):
+        self.free = list(ids)
+        self.busy = []
+        self.holds = {}
+
+    def release_until(self, ts):
+        # 与应用的冲突判断一致：结束时间等于下一趟出发时间也算重叠
+        while self.busy and self.busy[0][0] < ts:
+            _, resource = heapq.heappop(self.busy)
+            self.holds[resource] -= 1
+            if not self.holds[resource]:
+                del self.holds[resource]
+                self.free.append(resource)
+
+    def available(self):
+        return bool(self.free)
+
+    def take(self, rng, end, double_book=False):
+        if double_book and self.busy:
+            # 故意重复预约一个正在出车的资源，让冲突检测有数据可查
+            resource = rng.choice(self.busy)[1]
+        elif self.free:
+            i = rng.randrange(len(self.free))
+            self.free[i], self.free[-1] = self.free[-1], self.free[i]
+            resource = self.free.pop()
+        else:
+            return None
+        self.holds[resource] = self.holds.get(resource, 0) + 1
+        heapq.heappush(self.busy, (end, resource))
+        return resource
+
+
+# 各时间段的状态分布（累计权重，供 random.choices 直接使用）
+PAST_STATUSES = (['completed', 'rejected', 'cancelled'], [82, 90, 100])
+ONGOING_STATUSES = (['in_progress', 'rejected', 'cancelled'], [88, 94, 100])
+FUTURE_STATUSES = (['pending', 'assigned', 'rejected', 'cancelled'], [35, 85, 92, 100])
+
+
+def _trip_status(rng, start, end, now):
+    """按行程时间与当前时间的关系决定状态"""
+    statuses, cum_weights = PAST_STATUSES if end <= now else ONGOING_STATUSES if start <= now else FUTURE_STATUSES
+    return rng.choices(statuses, cum_weights=cum_weights)[0]
+
+
+def generate_trip_day(task):
+    """生成一天内出发的行程，按出发时间排序；司机和车辆由主进程按时间顺序统一分配
+
+    返回 (出发时间戳, 结束时间戳, 行) 的列表，行中的司机、车辆稍后填写。
+    """
+    day, count = task
+    ctx = _context
+    rng = _rng(ctx['seed'], 'trips', day)
+    day_start = ctx['first_day'] + day * 86400
+    now = ctx['now']
+    purposes = list(PURPOSE_PROFILES)
+    purpose_cum_weights = [sum(PURPOSE_PROFILES[p][0] for p in purposes[:i + 1]) for i in range(len(purposes))]
+    hour_cum_weights = [sum(START_HOUR_WEIGHTS[:i + 1]) for i in range(24)]
+
+    hours = rng.choices(range(24), cum_weights=hour_cum_weights, k=count)
+    # 出发时间取整到分钟，与前端 datetime-local 输入一致
+    starts = sorted(day_start + hour * 3600 + rng.randrange(60) * 60 for hour in hours)
+
+    trips = []
+    for start in starts:
+        purpose = rng.choices(purposes, cum_weights=purpose_cum_weights)[0]
+        _, median_hours, (low, high) = PURPOSE_PROFILES[purpose]
+        hours_long = min(max(rng.lognormvariate(math.log(median_hours), 0.5), 0.25), 72)
+        end = start + int(hours_long * 60) * 60
+        # 提前申请的时间：中位数一天半，长尾到两个月
+        lead_hours = min(max(rng.lognormvariate(math.log(36), 1.0), 0.25), 60 * 24)
+        created = start - int(lead_hours * 3600)
+        if created > now:
+            created = now - rng.randrange(3600)
+
+        status = _trip_status(rng, start, end, now)
+        trips.append((start, end, [
+            rng.randint(ctx['requester_first'], ctx['requester_last']),
+            purpose,
+            rng.choice(ctx['destinations']),
+            _format_ts(start),
+            _format_ts(end),
+            rng.randint(low, high),
+            status,
+            rng.randint(ctx['approver_first'], ctx['approver_last']),
+            None,
+            None,
+            _format_ts(created),
+            rng.choice(ctx['notes']) if rng.random() < 0.1 else '',
+            rng.choice(REJECTION_REASONS) if status == 'rejected' else None,
+        ]))
+    return trips
+
+
+class TripAssigner:
+    """按出发时间顺序给需要用车的行程分配司机和车辆（跨天保留占用状态）
+
+    车辆按容量从小到大挑选能坐下的空闲车；没有空闲的司机或车辆时改为拒绝。
+    conflict_rate 比例的行程故意分配一个正在出车的司机，让冲突检测有数据可查。
+    """
+
+    def __init__(self, context):
+        self.seed = context['seed']
+        self.conflict_rate = context['conflict_rate']
+        self.drivers = _ResourcePool(range(context['driver_first'], context['driver_last'] + 1))
+        self.vehicles = {capacity: _ResourcePool(vids)
+                         for capacity, vids in context['vehicles_by_capacity'].items()}
+        self.capacities = sorted(self.vehicles)
+
+    def assign(self, day, trips):
+        rng = _rng(self.seed, 'assign', day)
+        rows = []
+        for start, end, row in trips:
+            if row[6] in ('assigned', 'in_progress', 'completed'):
+                self.drivers.release_until(start)
+                for capacity in self.capacities:
+                    self.vehicles[capacity].release_until(start)
+                passengers = row[5]
+                pool = next((self.vehicles[c] for c in self.capacities
+                             if c >= passengers and self.vehicles[c].available()), None)
+                double_book = rng.random() < self.conflict_rate
+                if pool is None or not (self.drivers.available() or double_book):
+                    row[6] = 'rejected'
+                    row[12] = 'No available vehicles'
+                else:
+                    row[9] = self.drivers.take(rng, end, double_book)
+                    row[8] = pool.take(rng, end)
+            rows.append(tuple(row))
+        return rows
+
+
+def _daily_counts(args, first_day, days):
+    """按星期权重把行程总数分到每一天（最大余数法，总数精确）"""
+    weights = [WEEKDAY_WEIGHTS[time.gmtime(first_day + day * 86400).tm_wday] for day in range(days)]
+    total = sum(weights)
+    shares = [args.trips * w / total for w in weights]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(range(days), key=lambda day: shares[day] - counts[day], reverse=True)
+    for day in by_remainder[:args.trips - sum(counts)]:
+        counts[day] += 1
+    return counts
+
+
+def _run_tasks(args, context, func, tasks):
+    """按顺序产出每个任务的结果；workers > 1 时在多个进程中生成"""
+    if args.workers > 1:
+        with multiprocessing.Pool(args.workers, initializer=_init_worker, initargs=(context,)) as pool:
+            yield from pool.imap(func, tasks)
+    else:
+        _init_worker(context)
+        yield from map(func, tasks)
+
+
+def _drop_trip_indexes(conn):
+    """删除 trip_requests 上的索引和触发器，返回重建用的 SQL（写完后一次性建索引更快）"""
+    objects = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master "
+        "WHERE tbl_name = 'trip_requests' AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+    ).fetchall()
+    for object_type, name, _ in objects:
+        conn.execute(f'DROP {object_type.upper()} IF EXISTS "{name}"')
+    return [sql for _, _, sql in objects]
+
+
+def scale_main(args):
+    """按参数生成大规模、可复现的数据集"""
+    started = time.perf_counter()
+    args.drivers = args.drivers or max(15, args.employees // 30)
+    args.approvers = args.approvers or max(5, args.employees // 250)
+    needed = args.departments + args.drivers + args.approvers + 2
+    if args.employees < needed:
+        raise SystemExit(f'--employees must be at least {needed} for these role counts')
+
+    until = datetime.strptime(args.until, '%Y-%m-%d') if args.until else datetime.now().replace(
+        hour=0, minute=0, second=0, microsecond=0)
+    # 时间全部按 UTC 秒数计算，不受本机时区影响
+    now = int((until - datetime(1970, 1, 1)).total_seconds()) + 12 * 3600
+    first_day = now - 12 * 3600 - args.days * 86400
+    total_days = args.days + args.future_days
+
+    conn = sqlite3.connect(args.database)
+    for pragma in SCALE_PRAGMAS:
+        conn.execute(pragma)
+    print(f"成功连接到数据库: {args.database}")
+
+    # 先去掉触发器和索引，否则清空和写入都要逐行维护它们
+    saved_sql = _drop_trip_indexes(conn)
+    clean_database(conn)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trip_changes'").fetchone():
+        conn.execute("DELETE FROM trip_changes")
+    conn.commit()
+
+    roles = _role_ranges(args)
+    rng = _rng(args.seed, 'reference')
+    pool_fake = Faker('en_US')
+    pool_fake.seed_instance(args.seed)
+    vehicles = generate_vehicles(args)
+    vehicles_by_capacity = {}
+    for vid, _, _, _, capacity, _, status, _, _ in vehicles:
+        if status == 'available':
+            vehicles_by_capacity.setdefault(capacity, []).append(vid)
+    context = {
+        'seed': args.seed,
+        'now': now,
+        'first_day': first_day,
+        'departments': args.departments,
+        'roles': roles,
+        'driver_first': roles['driver'][0],
+        'driver_last': roles['driver'][1],
+        'approver_first': roles['approver'][0],
+        'approver_last': roles['approver'][1],
+        'requester_first': roles['employee'][0],
+        'requester_last': roles['employee'][1],
+        'vehicles_by_capacity': vehicles_by_capacity,
+        'conflict_rate': args.conflict_rate,
+        # 目的地和备注从固定的池中抽取，避免每行都调用 Faker
+        'destinations': [f"{pool_fake.street_address()}, {pool_fake.city()}" for _ in range(2000)],
+        'notes': [pool_fake.sentence(nb_words=8) for _ in range(500)],
+    }
+
+    # 部门（经理是前 departments 个员工）
+    names = [SCALE_DEPARTMENT_NAMES[i] if i < len(SCALE_DEPARTMENT_NAMES)
+             else f"{SCALE_DEPARTMENT_NAMES[i % len(SCALE_DEPARTMENT_NAMES)]} {i // len(SCALE_DEPARTMENT_NAMES) + 1}"
+             for i in range(args.departments)]
+    conn.executemany("INSERT INTO departments (did, dname, manager_id, dphone) VALUES (?, ?, ?, ?)",
+                     [(i + 1, name, i + 1, f"(555){rng.randint(200, 999)}{i + 1:04d}") for i, name in enumerate(names)])
+    conn.commit()
+    print(f"生成了 {args.departments} 个部门")
+
+    chunks = [(first, min(first + args.batch_size - 1, args.employees))
+              for first in range(1, args.employees + 1, args.batch_size)]
+    for employees, users in _run_tasks(args, context, generate_employee_chunk, chunks):
+        conn.executemany('''
+            INSERT INTO employees (eid, fname, lname, ephone, email, role, did, e_is_active, join_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', employees)
+        conn.executemany('''
+            INSERT INTO users (uid, password, username, eid, u_is_active, utype)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', users)
+        conn.commit()
+    print(f"生成了 {args.employees} 名员工（司机 {args.drivers} 名，审批员 {args.approvers} 名）")
+
+    conn.executemany('''
+        INSERT INTO vehicles (vid, plate, brand, model, capacity, color, vstatus, current_mileage, fuel)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', vehicles)
+    conn.commit()
+    print(f"生成了 {args.vehicles} 辆车")
+
+    trips_started = time.perf_counter()
+    counts = _daily_counts(args, first_day, total_days)
+    status_counts = {}
+    written = 0
+    pending_rows = 0
+    assigner = TripAssigner(context)
+    for day, trips in enumerate(_run_tasks(args, context, generate_trip_day, list(enumerate(counts)))):
+        rows = assigner.assign(day, trips)
+        conn.executemany('''
+            INSERT INTO trip_requests
+            (eid, purpose, destination, start_time, end_time, passenger_number, current_status,
+             approved_by, assigned_vid, assigned_eid, created_at, notes, rejection_reason)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        for row in rows:
+            status_counts[row[6]] = status_counts.get(row[6], 0) + 1
+        written += len(rows)
+        pending_rows += len(rows)
+        if pending_rows >= args.batch_size * 10:
+            conn.commit()
+            pending_rows = 0
+            rate = written / (time.perf_counter() - trips_started)
+            print(f"  已写入 {written}/{args.trips} 条行程（{rate:,.0f} 行/秒）")
+    # 正在进行的行程占用的车辆标记为 assigned，与应用中的状态流转一致
+    conn.execute('''
+        UPDATE vehicles SET vstatus = 'assigned'
+        WHERE vid IN (SELECT assigned_vid FROM trip_requests WHERE current_status = 'in_progress')
+    ''')
+    conn.commit()
+    print(f"生成了 {written} 条行程记录: {status_counts}")
+
+    print("正在重建 trip_requests 的索引和触发器...")
+    for sql in saved_sql:
+        conn.execute(sql)
+    # 写入时触发器已删除，手动让所有数据版本号变化，应用的缓存和页面 ETag 随之失效
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'data_versions'").fetchone():
+        conn.execute("UPDATE data_versions SET version = version + 1")
+    conn.commit()
+    # 统计表同样没有随写入更新，按新数据重建
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trip_stats'").fetchone():
+        print("正在重建行程统计表 trip_stats...")
+        trip_stats.rebuild(conn)
+    # 全文索引的触发器同样被删除了
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trip_search'").fetchone():
+        print("正在重建全文索引 trip_search...")
+        search.rebuild(conn)
+    if args.analyze:
+        conn.execute("ANALYZE")
+        conn.commit()
+    conn.close()
+
+    # 恢复应用使用的 WAL 模式
+    conn = sqlite3.connect(args.database)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+
+    print(f"\n=== 数据生成完成，用时 {time.perf_counter() - started:.1f} 秒 ===")
+    print("所有用户的初始密码均为: password123")
+
+
 def main():
     conn = None
     try:
@@ -312,5 +772,33 @@ def main():
             conn.close()
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Generate test data for the Vehicle Management System')
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--scale', action='store_true',
+                        help='generate a large, reproducible dataset instead of the small demo data')
+    parser.add_argument('--seed', type=int, default=42, help='same seed and parameters give the same data')
+    parser.add_argument('--departments', type=int, default=16)
+    parser.add_argument('--employees', type=int, default=50000)
+    parser.add_argument('--drivers', type=int, default=None, help='default: employees / 30')
+    parser.add_argument('--approvers', type=int, default=None, help='default: employees / 250')
+    parser.add_argument('--vehicles', type=int, default=5000)
+    parser.add_argument('--trips', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=365, help='days of trip history before --until')
+    parser.add_argument('--future-days', type=int, default=30, help='days of upcoming trips after --until')
+    parser.add_argument('--until', help='YYYY-MM-DD treated as "today" (default: today); fix it for reproducible data')
+    parser.add_argument('--conflict-rate', type=float, default=0.002,
+                        help='share of assigned trips deliberately double-booking a busy driver')
+    parser.add_argument('--workers', type=int, default=1, help='processes generating rows in parallel')
+    parser.add_argument('--batch-size', type=int, default=10000, help='employees per generated chunk')
+    parser.add_argument('--no-analyze', dest='analyze', action='store_false', help='skip ANALYZE at the end')
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    args = parse_args()
+    if args.scale:
+        scale_main(args)
+    else:
+        DATABASE = args.database
+        main()
\ No newline at end of file
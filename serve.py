@@ -0,0 +1,44 @@
+"""用 gevent 运行应用：每个连接（包括 /events 的长连接）只占一个 greenlet，
+大量空闲的推送连接不会占满工作线程。需要先安装 gevent：pip install gevent
+
+管理员 SQL、导出和等待连接池这类执行时间不定的数据库操作在 gevent 的线程池中执行
+（见 app.run_blocking），执行期间其他请求和推送连接不会被阻塞。写线程和归档线程
+是真正的系统线程（打补丁之前的 start_new_thread），等待写锁时同样不阻塞。
+
+    python serve.py --port 5000
+"""
+from gevent import monkey
+
+# 必须在导入其他模块之前打补丁，threading、socket 等才会换成协作式的实现
+monkey.patch_all()
+
+import argparse
+
+from gevent import get_hub
+from gevent.pywsgi import WSGIServer
+
+import app as app_module
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the Vehicle Management System with gevent')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--database', default=app_module.DATABASE, help='SQLite database file')
+    parser.add_argument('--threads', type=int, default=16,
+                        help='Threads for long-running database work (admin SQL, exports, pool waits)')
+    args = parser.parse_args()
+
+    app_module.DATABASE = args.database
+    threadpool = get_hub().threadpool
+    threadpool.maxsize = args.threads
+    app_module.app.config['BLOCKING_EXECUTOR'] = lambda func, *call_args: threadpool.apply(func, call_args)
+    start_new_thread = monkey.get_original('_thread', 'start_new_thread')
+    app_module.app.config['THREAD_SPAWNER'] = lambda target, name: start_new_thread(target, ())
+
+    print(f'Serving on http://{args.host}:{args.port} (gevent)')
+    WSGIServer((args.host, args.port), app_module.app).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
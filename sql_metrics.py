@@ -0,0 +1,406 @@
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+from db_pool import PooledConnection
+from migrations import query_plan
+
+# 延迟直方图的桶上界（毫秒）和每个请求查询数的桶上界
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])')
+_VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """把字面量换成 ?、合并空白和 IN (?, ?, ...) 列表，得到用于归类的 SQL 文本"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _SPACE.sub(' ', sql).strip()
+    return _VALUE_LIST.sub('(?, ...)', sql)
+
+
+class Histogram:
+    """固定桶的直方图，分位数按桶上界估算"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return round(self.max, 3)
+
+    def snapshot(self):
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            cumulative += count
+            buckets.append({'le': bound, 'count': cumulative})
+        return {
+            'count': self.count,
+            'sum': round(self.total, 3),
+            'max': round(self.max, 3),
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': buckets,
+        }
+
+
+class Statement:
+    """一次 execute / executemany：SQL、参数、耗时（包括读取结果）和返回行数"""
+
+    __slots__ = ('sql', 'params', 'ms', 'rows', 'many')
+
+    def __init__(self, sql, params, many=False):
+        self.sql = sql
+        self.params = params
+        self.ms = 0.0
+        self.rows = 0
+        self.many = many
+
+
+class RequestTrace:
+    """一个请求内执行的所有语句"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint or '<unknown>'
+        self.started = time.perf_counter()
+        self.statements = []
+        # trace 回调看到的语句数（包括隐式 BEGIN/COMMIT），其中触发器语句单独计数
+        self.traced = 0
+        self.triggers = 0
+        self.muted = False
+
+    def on_trace(self, statement):
+        if self.muted:
+            return
+        self.traced += 1
+        if statement.startswith('-- TRIGGER'):
+            self.triggers += 1
+
+
+class InstrumentedCursor:
+    """计时并统计行数的游标包装，其余属性直接转发"""
+
+    def __init__(self, cursor, trace):
+        self._cursor = cursor
+        self._trace = trace
+        self._statement = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _timed(self, statement, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            statement.ms += (time.perf_counter() - started) * 1000
+
+    def execute(self, sql, params=()):
+        self._statement = Statement(sql, params)
+        self._trace.statements.append(self._statement)
+        self._timed(self._statement, self._cursor.execute, sql, params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        self._statement = Statement(sql, seq_of_params[0] if seq_of_params else (), many=True)
+        self._trace.statements.append(self._statement)
+        self._timed(self._statement, self._cursor.executemany, sql, seq_of_params)
+        return self
+
+    def _fetch(self, method, *args):
+        if self._statement is None:
+            return method(*args)
+        result = self._timed(self._statement, method, *args)
+        if isinstance(result, list):
+            self._statement.rows += len(result)
+        elif result is not None:
+            self._statement.rows += 1
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(self._cursor.fetchmany, size if size is not None else self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+
+class InstrumentedConnection(PooledConnection):
+    """记录每条语句耗时的池化连接；归还前为慢查询取 EXPLAIN QUERY PLAN"""
+
+    def __init__(self, pool, conn, metrics, trace, on_close=None):
+        super().__init__(pool, conn, on_close=on_close)
+        self._metrics = metrics
+        self._trace = trace
+        self._first_statement = len(trace.statements)
+        conn.set_trace_callback(trace.on_trace)
+
+    def _raw(self):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed database.')
+        return self._conn
+
+    def cursor(self):
+        return InstrumentedCursor(self._raw().cursor(), self._trace)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def commit(self):
+        conn = self._raw()
+        statement = Statement('COMMIT', ())
+        self._trace.statements.append(statement)
+        started = time.perf_counter()
+        try:
+            conn.commit()
+        finally:
+            statement.ms = (time.perf_counter() - started) * 1000
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn = self._conn
+        self._trace.muted = True
+        try:
+            self._metrics.explain_slow(conn, self._trace.statements[self._first_statement:])
+        finally:
+            self._trace.muted = False
+            conn.set_trace_callback(None)
+        super().close()
+
+
+class TracedUnitConnection:
+    """写线程交给写单元的连接的包装：语句计入提交该单元的请求的 trace，其余属性直接转发"""
+
+    def __init__(self, conn, trace):
+        self._conn = conn
+        self._trace = trace
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self):
+        return InstrumentedCursor(self._conn.cursor(), self._trace)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+class SqlMetrics:
+    """按端点汇总 SQL 统计，并保留最近的慢查询（规范化 SQL + 执行计划）"""
+
+    def __init__(self, slow_ms=100.0, slow_log_size=100, max_statements=500):
+        self.slow_ms = slow_ms
+        self.max_statements = max_statements
+        self.slow_log = deque(maxlen=slow_log_size)
+        self.requests = 0
+        self._endpoints = {}
+        self._statements = {}      # 规范化 SQL -> 累计统计
+        self._plans = {}           # 规范化 SQL -> 执行计划
+        self._statement_ms = Histogram()
+        self._lock = threading.Lock()
+
+    def start_request(self, endpoint):
+        return RequestTrace(endpoint)
+
+    def connect(self, pool, conn, trace, on_close=None):
+        return InstrumentedConnection(pool, conn, self, trace, on_close=on_close)
+
+    def trace_unit(self, unit, trace):
+        """包装写单元：它在写线程中执行的语句（包括触发器）计入 trace，即提交它的请求
+
+        提交者在 WriteQueue.submit 中等待单元执行完，trace 不会被两个线程同时修改。
+        组提交的 COMMIT 由同一批的单元共同分担，不计入任何请求。
+        """
+        def traced(conn):
+            first = len(trace.statements)
+            conn.set_trace_callback(trace.on_trace)
+            try:
+                return unit(TracedUnitConnection(conn, trace))
+            finally:
+                trace.muted = True
+                try:
+                    self.explain_slow(conn, trace.statements[first:])
+                finally:
+                    trace.muted = False
+                    conn.set_trace_callback(None)
+        return traced
+
+    def explain_slow(self, conn, statements):
+        """为本连接上的慢语句取执行计划（同一条规范化 SQL 只取一次）"""
+        for statement in statements:
+            if statement.ms < self.slow_ms or statement.sql == 'COMMIT':
+                continue
+            normalized = normalize_sql(statement.sql)
+            with self._lock:
+                if normalized in self._plans:
+                    continue
+            try:
+                plan = query_plan(conn, statement.sql, statement.params)
+            except (sqlite3.Error, ValueError):
+                plan = []
+            with self._lock:
+                if len(self._plans) < self.max_statements:
+                    self._plans[normalized] = plan
+
+    def finish_request(self, trace):
+        """请求结束时汇总该请求的语句"""
+        request_ms = (time.perf_counter() - trace.started) * 1000
+        sql_ms = sum(statement.ms for statement in trace.statements)
+        rows = sum(statement.rows for statement in trace.statements)
+        slowest = max(trace.statements, key=lambda statement: statement.ms, default=None)
+        at = time.strftime('%Y-%m-%d %H:%M:%S')
+
+        with self._lock:
+            self.requests += 1
+            stats = self._endpoints.get(trace.endpoint)
+            if stats is None:
+                stats = self._endpoints[trace.endpoint] = {
+                    'requests': 0, 'queries': 0, 'statements': 0, 'trigger_statements': 0,
+                    'rows': 0, 'max_queries': 0, 'slowest': None,
+                    'request_ms': Histogram(), 'sql_ms': Histogram(), 'queries_per_request': Histogram(QUERY_COUNT_BUCKETS),
+                }
+            stats['requests'] += 1
+            stats['queries'] += len(trace.statements)
+            stats['statements'] += trace.traced
+            stats['trigger_statements'] += trace.triggers
+            stats['rows'] += rows
+            stats['max_queries'] = max(stats['max_queries'], len(trace.statements))
+            stats['request_ms'].observe(request_ms)
+            stats['sql_ms'].observe(sql_ms)
+            stats['queries_per_request'].observe(len(trace.statements))
+            if slowest is not None and (stats['slowest'] is None or slowest.ms > stats['slowest']['ms']):
+                stats['slowest'] = {'sql': normalize_sql(slowest.sql), 'ms': round(slowest.ms, 3),
+                                    'rows': slowest.rows, 'at': at}
+
+            for statement in trace.statements:
+                normalized = normalize_sql(statement.sql)
+                self._statement_ms.observe(statement.ms)
+                entry = self._statements.get(normalized)
+                if entry is None:
+                    if len(self._statements) >= self.max_statements:
+                        normalized = '<other>'
+                    entry = self._statements.setdefault(normalized, {
+                        'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'endpoints': set()})
+                entry['count'] += 1
+                entry['total_ms'] += statement.ms
+                entry['max_ms'] = max(entry['max_ms'], statement.ms)
+                entry['rows'] += statement.rows
+                entry['endpoints'].add(trace.endpoint)
+
+                if statement.ms >= self.slow_ms:
+                    self.slow_log.append({
+                        'at': at,
+                        'endpoint': trace.endpoint,
+                        'sql': normalized,
+                        'ms': round(statement.ms, 3),
+                        'rows': statement.rows,
+                        'executemany': statement.many,
+                        'plan': self._plans.get(normalized),
+                    })
+
+    def summary(self):
+        """/admin/metrics 中显示的简要统计"""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'statements': self._statement_ms.count,
+                'sql_ms_total': round(self._statement_ms.total, 3),
+                'slow_queries': len(self.slow_log),
+            }
+
+    def snapshot(self, top=50):
+        with self._lock:
+            endpoints = {}
+            for name, stats in sorted(self._endpoints.items()):
+                sql_ms = stats['sql_ms']
+                request_ms = stats['request_ms']
+                endpoints[name] = {
+                    'requests': stats['requests'],
+                    'queries': stats['queries'],
+                    'avg_queries': round(stats['queries'] / stats['requests'], 2),
+                    'max_queries': stats['max_queries'],
+                    'statements': stats['statements'],
+                    'trigger_statements': stats['trigger_statements'],
+                    'rows': stats['rows'],
+                    'sql_ms_total': round(sql_ms.total, 3),
+                    'sql_share': round(sql_ms.total / request_ms.total, 4) if request_ms.total else None,
+                    'slowest': stats['slowest'],
+                    'histograms': {
+                        'request_ms': request_ms.snapshot(),
+                        'sql_ms': sql_ms.snapshot(),
+                        'queries_per_request': stats['queries_per_request'].snapshot(),
+                    },
+                }
+
+            statements = sorted(self._statements.items(), key=lambda item: -item[1]['total_ms'])[:top]
+            return {
+                'slow_ms': self.slow_ms,
+                'requests': self.requests,
+                'statement_ms': self._statement_ms.snapshot(),
+                'endpoints': endpoints,
+                'top_statements': [{
+                    'sql': sql,
+                    'count': entry['count'],
+                    'total_ms': round(entry['total_ms'], 3),
+                    'avg_ms': round(entry['total_ms'] / entry['count'], 3),
+                    'max_ms': round(entry['max_ms'], 3),
+                    'rows': entry['rows'],
+                    'endpoints': sorted(entry['endpoints']),
+                    'plan': self._plans.get(sql),
+                } for sql, entry in statements],
+                'slow_queries': list(reversed(self.slow_log)),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self._endpoints.clear()
+            self._statements.clear()
+            self._plans.clear()
+            self.slow_log.clear()
+            self._statement_ms = Histogram()
@@ -0,0 +1,200 @@
+import csv
+import io
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import deque
+
+# 进度回调的间隔（SQLite 虚拟机指令数），越小超时和取消越及时，开销也越大
+PROGRESS_INTERVAL = 10000
+
+
+class RunningQuery:
+    """一条正在执行的管理员 SQL：行数上限、时间预算和取消标记"""
+
+    def __init__(self, query_id, sql, conn, time_budget, max_rows, user=None):
+        self.query_id = query_id
+        self.sql = sql
+        self.conn = conn
+        self.time_budget = time_budget
+        self.max_rows = max_rows
+        self.user = user
+        self.started_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.started = time.perf_counter()
+        self.deadline = self.started + time_budget
+        self.finished = None
+        self.status = 'running'
+        self.error = None
+        self.rows = 0
+        self.vm_steps = 0
+        self.truncated = False
+        self.cancel_requested = False
+        self.timed_out = False
+
+    def _progress(self):
+        """SQLite 进度回调，返回非零值时当前语句以 interrupted 错误中止"""
+        self.vm_steps += PROGRESS_INTERVAL
+        if self.cancel_requested:
+            return 1
+        if time.perf_counter() > self.deadline:
+            self.timed_out = True
+            return 1
+        return 0
+
+    def interrupted_status(self):
+        """语句被中止时的原因"""
+        if self.cancel_requested:
+            return 'cancelled'
+        if self.timed_out or time.perf_counter() > self.deadline:
+            return 'timeout'
+        return 'error'
+
+    def elapsed_ms(self):
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return round((end - self.started) * 1000, 3)
+
+    def summary(self):
+        return {
+            'query_id': self.query_id,
+            'sql': self.sql,
+            'user': self.user,
+            'started_at': self.started_at,
+            'status': self.status,
+            'error': self.error,
+            'rows': self.rows,
+            'truncated': self.truncated,
+            'vm_steps': self.vm_steps,
+            'elapsed_ms': self.elapsed_ms(),
+            'time_budget_s': self.time_budget,
+            'max_rows': self.max_rows,
+        }
+
+
+class QueryRegistry:
+    """记录正在执行和最近结束的管理员查询，支持从其他请求取消"""
+
+    def __init__(self, history=50):
+        self._running = {}
+        self._recent = deque(maxlen=history)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self, conn, sql, time_budget, max_rows, user=None):
+        """登记查询并在连接上安装进度回调，之后必须调用 finish"""
+        with self._lock:
+            query = RunningQuery(next(self._ids), sql, conn, time_budget, max_rows, user)
+            self._running[query.query_id] = query
+        conn.set_progress_handler(query._progress, PROGRESS_INTERVAL)
+        return query
+
+    def finish(self, query, status=None, error=None):
+        """移除进度回调并把查询移到历史记录；重复调用没有影响"""
+        with self._lock:
+            if self._running.pop(query.query_id, None) is None:
+                return
+            query.finished = time.perf_counter()
+            if status is not None:
+                query.status = status
+            elif query.status == 'running':
+                query.status = 'completed'
+            if error is not None:
+                query.error = error
+            self._recent.append(query)
+        try:
+            query.conn.set_progress_handler(None, 0)
+        except sqlite3.ProgrammingError:
+            pass
+
+    def cancel(self, query_id):
+        """请求取消查询，返回是否找到该查询"""
+        with self._lock:
+            query = self._running.get(query_id)
+            if query is None:
+                return False
+            query.cancel_requested = True
+            # 进度回调之外再中断一次，覆盖正在等待锁等不执行指令的情况；
+            # 在锁内调用，保证连接此时还没有还给连接池
+            query.conn.interrupt()
+        return True
+
+    def get(self, query_id):
+        with self._lock:
+            query = self._running.get(query_id)
+            if query is None:
+                query = next((q for q in self._recent if q.query_id == query_id), None)
+            return query.summary() if query else None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'running': [query.summary() for query in self._running.values()],
+                'recent': [query.summary() for query in reversed(self._recent)],
+            }
+
+
+def iter_rows(query, cursor, batch_size=500):
+    """按批从游标读取，最多 query.max_rows 行；中止时记录原因而不是抛出异常"""
+    try:
+        while True:
+            remaining = query.max_rows - query.rows if query.max_rows is not None else batch_size
+            if remaining <= 0:
+                # 再多读一行，判断结果是否被截断
+                query.truncated = cursor.fetchone() is not None
+                return
+            batch = cursor.fetchmany(min(batch_size, remaining))
+            if not batch:
+                return
+            query.rows += len(batch)
+            yield from batch
+    except sqlite3.OperationalError as e:
+        query.status = query.interrupted_status() if 'interrupt' in str(e) else 'error'
+        query.error = str(e)
+
+
+def _json_default(value):
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+
+def ndjson_chunks(columns, rows, batch_size=500):
+    """把行编码为 NDJSON，每 batch_size 行输出一块"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row)), default=_json_default, ensure_ascii=False))
+        if len(lines) >= batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def csv_chunks(columns, rows, batch_size=500):
+    """把行编码为 CSV（第一行为列名），每 batch_size 行输出一块"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    pending = 1
+    for row in rows:
+        writer.writerow(tuple(row))
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks, level=6):
+    """对文本块做流式 gzip 压缩，内存占用与总大小无关"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,237 @@
+import threading
+import time
+
+
+def quote_identifier(name):
+    """给表名、列名加双引号（名字本身已经过 schema 校验）"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def list_tables(conn):
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    ).fetchall()
+    return [row['name'] for row in rows]
+
+
+def table_schema(conn, table):
+    """从 PRAGMA table_info 读取列信息和主键，表不存在时抛出 ValueError
+
+    主键只有一列时用它做 keyset 分页的键，否则（没有主键或复合主键）用 rowid。
+    sortable 为可以排序的列（见 _sortable_columns）。
+    """
+    if table not in list_tables(conn):
+        raise ValueError(f'Unknown table: {table}')
+
+    columns = [{
+        'name': row['name'],
+        'type': row['type'],
+        'notnull': bool(row['notnull']),
+        'default': row['dflt_value'],
+        'pk': row['pk'],
+    } for row in conn.execute(f'PRAGMA table_info({quote_identifier(table)})').fetchall()]
+
+    pk_columns = [column for column in columns if column['pk']]
+    pk = pk_columns[0]['name'] if len(pk_columns) == 1 else 'rowid'
+    # INTEGER PRIMARY KEY 就是 rowid，索引中每一项的最后是 rowid
+    rowid_pk = pk == 'rowid' or pk_columns[0]['type'].upper() == 'INTEGER'
+    return {
+        'table': table,
+        'columns': columns,
+        'names': [column['name'] for column in columns],
+        'pk': pk,
+        'sortable': _sortable_columns(conn, table, pk, rowid_pk),
+    }
+
+
+def _sortable_columns(conn, table, pk, rowid_pk):
+    """可以按 (列, 主键) 的顺序直接读取索引的列：主键，以及某个完整（非部分）索引的第一列，
+    该索引的第二列是主键，或者只有这一列而主键就是 rowid。其他列排序要读取并排序整张表。
+    """
+    sortable = [] if pk == 'rowid' else [pk]
+    for index in conn.execute(f'PRAGMA index_list({quote_identifier(table)})').fetchall():
+        if index['partial']:
+            continue
+        keys = [row['name'] for row in conn.execute(f"PRAGMA index_info({quote_identifier(index['name'])})")]
+        if not keys or keys[0] is None or keys[0] in sortable:
+            continue
+        if (len(keys) == 1 and rowid_pk) or (len(keys) > 1 and keys[1] == pk):
+            sortable.append(keys[0])
+    return sortable
+
+
+def _search_condition(column, term, exact, case_sensitive):
+    if exact:
+        if case_sensitive:
+            return f'CAST({column} AS TEXT) = ?', term
+        return f'lower(CAST({column} AS TEXT)) = lower(?)', term
+    if case_sensitive:
+        return f'instr(CAST({column} AS TEXT), ?) > 0', term
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"CAST({column} AS TEXT) LIKE ? ESCAPE '\\'", f'%{escaped}%'
+
+
+def filter_conditions(schema, search=None, search_column=None, exact=False, case_sensitive=False):
+    """把搜索条件转成 (WHERE 条件列表, 参数列表)，search_column 不是表中的列时搜索所有列"""
+    if not search:
+        return [], []
+    names = schema['names']
+    searched = [search_column] if search_column in names else names
+    parts = []
+    params = []
+    for name in searched:
+        condition, param = _search_condition(quote_identifier(name), search, exact, case_sensitive)
+        parts.append(condition)
+        params.append(param)
+    return ['(' + ' OR '.join(parts) + ')'], params
+
+
+def _selected_columns(schema, columns):
+    """要输出的列（按表中顺序），主键总会包含在内"""
+    names = schema['names']
+    pk = schema['pk']
+    selected = [name for name in names if name in columns] if columns else list(names)
+    if pk != 'rowid' and pk not in selected:
+        selected.insert(0, pk)
+    return selected
+
+
+def _after_condition(sort, pk, descending, value, key):
+    """(sort, pk) 在游标之后的条件；SQLite 升序时 NULL 在前，降序时 NULL 在后"""
+    if sort == pk:
+        return (f'{pk} < ?' if descending else f'{pk} > ?'), [key]
+    op = '<' if descending else '>'
+    if value is None:
+        if descending:
+            return f'({sort} IS NULL AND {pk} < ?)', [key]
+        return f'(({sort} IS NULL AND {pk} > ?) OR {sort} IS NOT NULL)', [key]
+    condition = f'({sort} {op} ? OR ({sort} = ? AND {pk} {op} ?)'
+    if descending:
+        condition += f' OR {sort} IS NULL'
+    return condition + ')', [value, value, key]
+
+
+def browse_rows(conn, schema, columns=None, sort=None, descending=False,
+                search=None, search_column=None, exact=False, case_sensitive=False,
+                after=None, limit=50):
+    """按 (排序列, 主键) 做 keyset 分页读取一页，返回 (显示的列, rows, next_cursor)
+
+    columns 为要显示的列（主键总会包含在内），search_column 为 None 时在所有列中搜索。
+    after 为上一页返回的游标 [排序列的值, 主键值]。sort 不在 schema['sortable'] 中时按主键排序。
+    """
+    pk = schema['pk']
+    sort = sort if sort in schema['sortable'] else pk
+    selected = _selected_columns(schema, columns)
+
+    quoted_pk = 'rowid' if pk == 'rowid' else quote_identifier(pk)
+    quoted_sort = 'rowid' if sort == 'rowid' else quote_identifier(sort)
+    select_list = [quote_identifier(name) for name in selected]
+    # 游标需要主键和排序列，即使它们不在显示的列中
+    select_list.append(f'{quoted_pk} AS __pk')
+    select_list.append(f'{quoted_sort} AS __sort')
+
+    conditions, params = filter_conditions(schema, search, search_column, exact, case_sensitive)
+    if after is not None:
+        condition, after_params = _after_condition(quoted_sort, quoted_pk, descending, after[0], after[1])
+        conditions.append(condition)
+        params.extend(after_params)
+
+    direction = 'DESC' if descending else 'ASC'
+    order_by = f'{quoted_pk} {direction}' if sort == pk else f'{quoted_sort} {direction}, {quoted_pk} {direction}'
+    sql = f'''
+        SELECT {', '.join(select_list)}
+        FROM {quote_identifier(schema['table'])}
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY {order_by}
+        LIMIT ?
+    '''
+    rows = conn.execute(sql, params + [limit + 1]).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = [rows[-1]['__sort'], rows[-1]['__pk']]
+
+    page = []
+    for row in rows:
+        item = {name: row[name] for name in selected}
+        item['__pk'] = row['__pk']
+        page.append(item)
+    return selected, page, next_cursor
+
+
+def export_rows(conn, schema, columns=None, search=None, search_column=None, exact=False,
+                case_sensitive=False, after_pk=None, upper_pk=None, batch_size=1000):
+    """按主键顺序导出（可筛选的）整张表，返回 (列名, 行迭代器, 主键上界)
+
+    调用方应在同一个读事务中调用并读完迭代器，保证导出的是同一个快照。
+    upper_pk 为空时取当前最大主键，之后插入的行不会出现在本次导出中；
+    中断后用 after_pk=已收到的最后一个主键、upper_pk=同一个上界即可继续导出。
+    没有单列主键的表第一列输出 rowid，用于续传。
+    """
+    pk = schema['pk']
+    quoted_pk = 'rowid' if pk == 'rowid' else quote_identifier(pk)
+    quoted_table = quote_identifier(schema['table'])
+    selected = _selected_columns(schema, columns)
+    select_list = [quote_identifier(name) for name in selected]
+    if pk == 'rowid':
+        selected.insert(0, 'rowid')
+        select_list.insert(0, 'rowid')
+
+    if upper_pk is None:
+        upper_pk = conn.execute(f'SELECT MAX({quoted_pk}) FROM {quoted_table}').fetchone()[0]
+
+    conditions, params = filter_conditions(schema, search, search_column, exact, case_sensitive)
+    if after_pk is not None:
+        conditions.append(f'{quoted_pk} > ?')
+        params.append(after_pk)
+    conditions.append(f'{quoted_pk} <= ?')
+    params.append(upper_pk)
+
+    cursor = conn.execute(f'''
+        SELECT {', '.join(select_list)}
+        FROM {quoted_table}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {quoted_pk}
+    ''', params)
+
+    def rows():
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                return
+            yield from batch
+
+    return selected, rows(), upper_pk
+
+
+class RowCountCache:
+    """缓存各表的行数，避免每次打开表都 COUNT(*) 全表
+
+    数值最多过期 ttl 秒；管理员写操作后调用 invalidate 立即失效。
+    """
+
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn, table):
+        """返回 (行数, 数值的年龄秒数)"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._counts.get(table)
+        if cached is not None and now - cached[1] < self.ttl:
+            return cached[0], round(now - cached[1], 1)
+
+        count = conn.execute(f'SELECT COUNT(*) FROM {quote_identifier(table)}').fetchone()[0]
+        with self._lock:
+            self._counts[table] = (count, now)
+        return count, 0.0
+
+    def invalidate(self, table=None):
+        with self._lock:
+            if table is None:
+                self._counts.clear()
+            else:
+                self._counts.pop(table, None)
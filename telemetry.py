@@ -0,0 +1,138 @@
+import math
+import sqlite3
+from datetime import datetime
+
+# 读数类型：行程开始、行驶中、行程结束
+KINDS = ('start', 'reading', 'end')
+# 可以上传读数的行程状态（行程结束后补传的读数也接受）
+TELEMETRY_STATUSES = ('assigned', 'in_progress', 'completed')
+TELEMETRY_COLUMNS = ('rid', 'vid', 'eid', 'kind', 'recorded_at', 'odometer', 'fuel')
+
+
+def parse_reading(item, now=None):
+    """校验一条读数，返回 (dict, None) 或 (None, 错误信息)
+
+    item 需要 trip_id、odometer（公里）和 fuel（油箱百分比），kind 默认为 reading，
+    recorded_at 默认为当前时间（可以带 T 分隔符，统一保存为 YYYY-MM-DD HH:MM:SS）。
+    """
+    if not isinstance(item, dict):
+        return None, 'Reading must be an object'
+    kind = item.get('kind', 'reading')
+    if kind not in KINDS:
+        return None, f'Invalid kind: {kind}'
+    try:
+        rid = int(item['trip_id'])
+        odometer = float(item['odometer'])
+        fuel = float(item['fuel'])
+    except KeyError as e:
+        return None, f'Missing field: {e.args[0]}'
+    except (TypeError, ValueError):
+        return None, 'trip_id, odometer and fuel must be numbers'
+    # float() 接受 'nan' 和 'inf'，NaN 与任何数比较都为假，会绕过下面的范围检查
+    if not (math.isfinite(odometer) and math.isfinite(fuel)):
+        return None, 'odometer and fuel must be finite numbers'
+    if odometer < 0:
+        return None, 'odometer must not be negative'
+    if not 0 <= fuel <= 100:
+        return None, 'fuel must be between 0 and 100'
+    try:
+        recorded = datetime.fromisoformat(str(item['recorded_at'])) if item.get('recorded_at') else (now or datetime.now())
+    except ValueError:
+        return None, f"Invalid recorded_at: {item['recorded_at']}"
+    return {'rid': rid, 'kind': kind, 'recorded_at': recorded.strftime('%Y-%m-%d %H:%M:%S'),
+            'odometer': odometer, 'fuel': fuel}, None
+
+
+def record(conn, readings):
+    """追加读数（包含 TELEMETRY_COLUMNS 的 dict），vehicle_daily_usage 由触发器更新，返回写入的条数"""
+    conn.executemany(f'''
+        INSERT INTO trip_telemetry ({', '.join(TELEMETRY_COLUMNS)})
+        VALUES ({', '.join('?' for _ in TELEMETRY_COLUMNS)})
+    ''', [tuple(reading[column] for column in TELEMETRY_COLUMNS) for reading in readings])
+    return len(readings)
+
+
+def rebuild(conn):
+    """按全部读数重建 vehicle_daily_usage（在一个事务中），返回写入的行数"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM vehicle_daily_usage')
+        # 与迁移 9 中的触发器一致：同一行程按 (recorded_at, id) 排序，相邻两次读数的差计入后一次的日期
+        conn.execute('''
+            INSERT INTO vehicle_daily_usage (day, vid, distance_km, fuel_used, readings)
+            SELECT substr(recorded_at, 1, 10), vid,
+                   TOTAL(MAX(0, odometer - previous_odometer)), TOTAL(MAX(0, previous_fuel - fuel)), COUNT(*)
+            FROM (
+                SELECT vid, recorded_at, odometer, fuel,
+                       LAG(odometer) OVER w AS previous_odometer, LAG(fuel) OVER w AS previous_fuel
+                FROM trip_telemetry
+                WINDOW w AS (PARTITION BY rid ORDER BY recorded_at, id)
+            )
+            GROUP BY 1, 2
+        ''')
+        total = conn.execute('SELECT COUNT(*) FROM vehicle_daily_usage').fetchone()[0]
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return total
+
+
+def _fuel_per_100km(fuel_used, distance_km):
+    return round(fuel_used * 100 / distance_km, 2) if distance_km else None
+
+
+def usage(conn, start_day, end_day, vid=None, by_day=False):
+    """汇总 [start_day, end_day] 内每辆车（by_day 时每辆车每天）的行驶里程、耗油量和百公里油耗
+
+    耗油量和百公里油耗的单位是油箱的百分比；km_per_day 为里程除以统计时段的天数。
+    """
+    conditions = ['day >= ?', 'day <= ?']
+    params = [start_day, end_day]
+    if vid is not None:
+        conditions.append('vid = ?')
+        params.append(vid)
+    group = 'day, vid' if by_day else 'vid'
+    rows = conn.execute(f'''
+        SELECT {group}, TOTAL(distance_km) AS distance_km, TOTAL(fuel_used) AS fuel_used,
+               SUM(readings) AS readings, COUNT(*) AS active_days
+        FROM vehicle_daily_usage
+        WHERE {' AND '.join(conditions)}
+        GROUP BY {group}
+        ORDER BY {group}
+    ''', params).fetchall()
+
+    days = (datetime.fromisoformat(end_day) - datetime.fromisoformat(start_day)).days + 1
+    result = []
+    for row in rows:
+        entry = {'vid': row['vid'], 'distance_km': round(row['distance_km'], 2),
+                 'fuel_used': round(row['fuel_used'], 2), 'readings': row['readings'],
+                 'fuel_per_100km': _fuel_per_100km(row['fuel_used'], row['distance_km'])}
+        if by_day:
+            entry['day'] = row['day']
+        else:
+            entry['active_days'] = row['active_days']
+            entry['km_per_day'] = round(row['distance_km'] / days, 2)
+        result.append(entry)
+    return result
+
+
+def trip_summary(conn, rid):
+    """一个行程的全部读数，以及开始到结束的里程和耗油量（相邻读数之差的和，加油不算负的耗油）"""
+    readings = [dict(row) for row in conn.execute('''
+        SELECT id, kind, recorded_at, odometer, fuel, vid, eid, received_at
+        FROM trip_telemetry
+        WHERE rid = ?
+        ORDER BY recorded_at, id
+    ''', (rid,))]
+    distance = fuel_used = 0.0
+    for previous, reading in zip(readings, readings[1:]):
+        distance += max(0.0, reading['odometer'] - previous['odometer'])
+        fuel_used += max(0.0, previous['fuel'] - reading['fuel'])
+    return {
+        'trip_id': rid,
+        'readings': readings,
+        'distance_km': round(distance, 2),
+        'fuel_used': round(fuel_used, 2),
+        'fuel_per_100km': _fuel_per_100km(fuel_used, distance),
+    }
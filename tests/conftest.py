@@ -0,0 +1,82 @@
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import migrations  # noqa: E402
+
+# seed.py --scale 的小规模参数：几秒内生成，固定 --until 使数据可以复现
+SEED_ARGS = ['--employees', '2000', '--vehicles', '200', '--trips', '20000', '--until', '2026-06-01']
+PASSWORD = 'password123'
+
+
+@pytest.fixture(scope='session')
+def seeded_database(tmp_path_factory):
+    """5003project.db 的结构 + 全部迁移 + seed.py --scale 生成的数据（已 ANALYZE），整个测试会话只生成一次"""
+    path = str(tmp_path_factory.mktemp('seed') / 'seed.db')
+    shutil.copy(os.path.join(ROOT, '5003project.db'), path)
+    conn = sqlite3.connect(path)
+    try:
+        migrations.apply_migrations(conn)
+    finally:
+        conn.close()
+    subprocess.run([sys.executable, 'seed.py', '--scale', '--database', path, *SEED_ARGS],
+                   cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+    return path
+
+
+@pytest.fixture
+def db_path(seeded_database, tmp_path):
+    """每个测试一份可以随意修改的数据库副本"""
+    path = str(tmp_path / 'test.db')
+    shutil.copy(seeded_database, path)
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope='session')
+def app_module(seeded_database, tmp_path_factory):
+    """使用数据库副本的 app 模块；连接池和写线程是进程级的，所有应用测试共用这一份数据库"""
+    path = str(tmp_path_factory.mktemp('app') / 'app.db')
+    shutil.copy(seeded_database, path)
+    import app
+    app.DATABASE = path
+    app.app.config['TESTING'] = True
+    app.get_pool()
+    return app
+
+
+@pytest.fixture
+def login(app_module):
+    """login(user_type, condition='') 以满足条件的第一个启用的用户登录，返回 (测试客户端, 用户行)"""
+    conn = sqlite3.connect(app_module.DATABASE)
+    conn.row_factory = sqlite3.Row
+
+    def login(user_type, condition=''):
+        user = conn.execute(f'''
+            SELECT u.uid, u.username, u.eid FROM users u
+            WHERE u.utype = ? AND u.u_is_active = 1 {condition}
+            ORDER BY u.uid LIMIT 1
+        ''', (user_type,)).fetchone()
+        assert user is not None, f'no {user_type} user matches {condition!r}'
+        client = app_module.app.test_client()
+        response = client.post('/login', data={'username': user['username'], 'password': PASSWORD,
+                                               'user_id': user['uid'], 'user_type': user_type})
+        assert response.status_code == 302
+        return client, user
+
+    yield login
+    conn.close()
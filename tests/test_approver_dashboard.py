@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def approver(app_module, login):
+    """已完成行程最多的审批员（超过一页）"""
+    conn = sqlite3.connect(app_module.DATABASE)
+    try:
+        uid = conn.execute('''
+            SELECT approved_by FROM trip_requests_all
+            WHERE current_status = 'completed' AND approved_by IS NOT NULL
+            GROUP BY approved_by ORDER BY COUNT(*) DESC LIMIT 1
+        ''').fetchone()[0]
+    finally:
+        conn.close()
+    client, user = login('approver', f'AND u.uid = {uid}')
+    return client, user['uid']
+
+
+def expected(app_module, uid, status):
+    conn = sqlite3.connect(app_module.DATABASE)
+    try:
+        return [tuple(row) for row in conn.execute('''
+            SELECT created_at, rid FROM trip_requests_all
+            WHERE approved_by = ? AND current_status = ?
+            ORDER BY created_at DESC, rid DESC
+        ''', (uid, status))]
+    finally:
+        conn.close()
+
+
+def test_dashboard_counts_and_first_page(app_module, approver):
+    client, uid = approver
+    page_size = app_module.app.config['DASHBOARD_PAGE_SIZE']
+    html = client.get('/approver/dashboard').get_data(as_text=True)
+
+    assert f'{len(expected(app_module, uid, "pending"))} pending' in html
+    completed = expected(app_module, uid, 'completed')
+    assert len(completed) > page_size
+    created_at, rid = completed[page_size - 1]
+    assert f'data-before-created="{created_at}"' in html
+    assert f'data-before-rid="{rid}"' in html
+
+
+def test_requests_pages_walk_the_whole_tab(app_module, approver):
+    client, uid = approver
+    seen = []
+    params = {'status': 'completed', 'limit': 50}
+    while True:
+        result = client.get('/approver/requests', query_string=params).get_json()
+        assert result['success']
+        seen.extend((row['created_at'], row['rid']) for row in result['requests'])
+        cursor = result['next_cursor']
+        if cursor is None:
+            break
+        params.update(before_created=cursor['created_at'], before_rid=cursor['rid'])
+
+    assert seen == expected(app_module, uid, 'completed')
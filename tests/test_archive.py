@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import telemetry
+import trip_stats
+from archive import ARCHIVED_STATUSES, TRIP_COLUMNS, archive_batch, restore_trips
+from write_queue import run_in_transaction
+
+CUTOFF = '2026-01-01 00:00:00'
+SEARCH_WORDS = ('street', 'road', 'avenue', 'lane', 'apt')
+
+
+def snapshot(conn):
+    """读者能看到的内容：全部行程、统计和每个搜索词的匹配"""
+    return {
+        'trips': [tuple(row) for row in conn.execute(
+            f"SELECT {', '.join(TRIP_COLUMNS)} FROM trip_requests_all ORDER BY rid")],
+        'stats': sorted(tuple(row) for row in conn.execute('SELECT * FROM trip_stats')),
+        'search': {word: [row[0] for row in conn.execute(
+            'SELECT rowid FROM trip_search WHERE trip_search MATCH ? ORDER BY rank, rowid', (word,))]
+            for word in SEARCH_WORDS},
+    }
+
+
+def archive_all(conn, cutoff, batch_size=500):
+    moved = 0
+    while True:
+        count = run_in_transaction(conn, lambda c: archive_batch(c, cutoff, batch_size))
+        if not count:
+            return moved
+        moved += count
+
+
+def test_archive_and_restore_leave_readers_unchanged(conn):
+    before = snapshot(conn)
+
+    moved = archive_all(conn, CUTOFF)
+    assert moved > 0
+    assert conn.execute('SELECT COUNT(*) FROM trip_requests_archive').fetchone()[0] == moved
+    assert conn.execute('SELECT COUNT(*) FROM trip_requests JOIN trip_requests_archive USING (rid)').fetchone()[0] == 0
+    statuses = {row[0] for row in conn.execute('SELECT DISTINCT current_status FROM trip_requests_archive')}
+    assert statuses <= set(ARCHIVED_STATUSES)
+    assert conn.execute(f'''
+        SELECT COUNT(*) FROM trip_requests
+        WHERE current_status IN ({', '.join('?' for _ in ARCHIVED_STATUSES)}) AND end_time < ?
+    ''', (*ARCHIVED_STATUSES, CUTOFF)).fetchone()[0] == 0
+    assert snapshot(conn) == before
+
+    rids = [row[0] for row in conn.execute('SELECT rid FROM trip_requests_archive ORDER BY rid LIMIT 100')]
+    assert run_in_transaction(conn, lambda c: restore_trips(c, rids)) == len(rids)
+    assert conn.execute(f"SELECT COUNT(*) FROM trip_requests WHERE rid IN ({', '.join('?' for _ in rids)})",
+                        rids).fetchone()[0] == len(rids)
+    assert snapshot(conn) == before
+
+    # 触发器增量维护的结果与全量重建的结果相同
+    conn.execute("INSERT INTO trip_search (trip_search) VALUES ('integrity-check')")
+    conn.commit()
+    trip_stats.rebuild(conn)
+    assert snapshot(conn) == before
+
+
+@pytest.fixture
+def finished_trip(app_module):
+    """热表中最早结束、申请人有账号且分配了车辆的已完成行程，带有唯一的目的地和两条读数"""
+    def setup(conn):
+        trip = conn.execute('''
+            SELECT tr.rid, tr.eid, tr.assigned_vid, tr.assigned_eid, tr.start_time, tr.end_time, tr.created_at
+            FROM trip_requests tr
+            WHERE tr.current_status = 'completed' AND tr.assigned_vid IS NOT NULL
+              AND EXISTS (SELECT 1 FROM users u WHERE u.eid = tr.eid AND u.utype = 'normal' AND u.u_is_active = 1)
+            ORDER BY tr.end_time LIMIT 1
+        ''').fetchone()
+        conn.execute("UPDATE trip_requests SET destination = '9 Quillfeather Wharf' WHERE rid = ?", (trip['rid'],))
+        reading = {'rid': trip['rid'], 'vid': trip['assigned_vid'], 'eid': trip['assigned_eid']}
+        telemetry.record(conn, [dict(reading, kind='start', recorded_at=trip['start_time'], odometer=1000.0, fuel=80.0),
+                                dict(reading, kind='end', recorded_at=trip['end_time'], odometer=1042.5, fuel=74.0)])
+        return dict(trip)
+
+    return app_module.run_write(setup)
+
+
+def test_archived_trip_is_still_found(app_module, login, finished_trip):
+    trip = finished_trip
+    requester, _ = login('normal', f"AND u.eid = {trip['eid']}")
+    admin, _ = login('database_manager')
+    day = trip['start_time'][:10]
+
+    def views():
+        history = requester.get('/user/trips', query_string={
+            'status': 'completed', 'from': trip['created_at'][:10], 'to': trip['created_at'][:10]}).get_json()
+        found = requester.get('/trips/search', query_string={'q': 'quillfeather'}).get_json()
+        usage = admin.get('/admin/vehicle_usage', query_string={
+            'vid': trip['assigned_vid'], 'from': day, 'to': trip['end_time'][:10], 'by_day': '1'}).get_json()
+        summary = admin.get('/admin/trip_telemetry', query_string={'trip_id': trip['rid']}).get_json()
+        return ([row['rid'] for row in history['trips']], [row['rid'] for row in found['trips']],
+                usage['rows'], summary['distance_km'])
+
+    before = views()
+    assert trip['rid'] in before[0]
+    assert before[1] == [trip['rid']]
+    assert before[3] == 42.5
+
+    cutoff = (datetime.fromisoformat(trip['end_time']) + timedelta(seconds=1)).strftime('%Y-%m-%d %H:%M:%S')
+    moved = app_module.run_write(lambda conn: archive_batch(conn, cutoff, 100000))
+    assert moved >= 1
+    assert app_module.run_write(lambda conn: conn.execute(
+        'SELECT COUNT(*) FROM trip_requests_archive WHERE rid = ?', (trip['rid'],)).fetchone()[0]) == 1
+    assert views() == before
+
+
+def test_editing_archived_trips_keeps_stats_and_versions(conn):
+    """管理员直接修改、删除归档表中的行程：trip_stats 与全量重建一致，相关的版本号都加一"""
+    archive_all(conn, CUTOFF)
+    conn.commit()
+    edited, deleted = [dict(row) for row in conn.execute('''
+        SELECT rid, eid, approved_by FROM trip_requests_archive
+        WHERE approved_by IS NOT NULL AND assigned_vid IS NOT NULL ORDER BY rid LIMIT 2
+    ''')]
+    other_approver = conn.execute('SELECT approved_by FROM trip_requests WHERE approved_by <> ? LIMIT 1',
+                                  (edited['approved_by'],)).fetchone()[0]
+    names = ['trip_requests', f"requester:{edited['eid']}", f"approver:{edited['approved_by']}",
+             f'approver:{other_approver}', f"requester:{deleted['eid']}", f"approver:{deleted['approved_by']}"]
+
+    def versions():
+        return {name: conn.execute('SELECT version FROM data_versions WHERE name = ?', (name,)).fetchone()
+                for name in names}
+
+    before = versions()
+    conn.execute('''
+        UPDATE trip_requests_archive
+        SET current_status = 'cancelled', approved_by = ?, start_time = datetime(start_time, '-3 days'),
+            assigned_vid = NULL, assigned_eid = NULL
+        WHERE rid = ?
+    ''', (other_approver, edited['rid']))
+    conn.execute('DELETE FROM trip_requests_archive WHERE rid = ?', (deleted['rid'],))
+    conn.commit()
+
+    after = versions()
+    for name in names:
+        assert after[name] is not None and after[name] != before[name], name
+
+    # 移出后留下的 trips 为 0 的行不会被读到，重建时不会生成
+    counted = 'SELECT * FROM trip_stats WHERE trips <> 0'
+    stats = sorted(tuple(row) for row in conn.execute(counted))
+    trip_stats.rebuild(conn)
+    assert sorted(tuple(row) for row in conn.execute(counted)) == stats
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+# 比种子数据中所有车辆都大，需要这么多座位的请求只能分配到测试添加的车辆
+BUS_CAPACITY = 60
+
+
+@pytest.fixture
+def contested(app_module, login):
+    """两个审批员各有一条同一时间段、只有一辆车能坐下的待审批请求，返回 [(客户端, rid)] 和车辆 vid"""
+    def setup(conn):
+        vid = conn.execute('''
+            INSERT INTO vehicles (plate, brand, model, capacity, color, vstatus)
+            VALUES ('BUS-' || (SELECT COUNT(*) FROM vehicles), 'Volvo', '9700', ?, 'White', 'available')
+        ''', (BUS_CAPACITY,)).lastrowid
+        requester = conn.execute("SELECT eid FROM users WHERE utype = 'normal' AND u_is_active = 1 LIMIT 1").fetchone()[0]
+        approvers = [row[0] for row in conn.execute('''
+            SELECT uid FROM users WHERE utype = 'approver' AND u_is_active = 1 ORDER BY uid LIMIT 2
+        ''')]
+        rids = [conn.execute('''
+            INSERT INTO trip_requests (eid, purpose, destination, start_time, end_time, passenger_number, approved_by)
+            VALUES (?, 'company tour', 'Harbour Road', '2031-05-04 09:00:00', '2031-05-04 17:00:00', ?, ?)
+        ''', (requester, BUS_CAPACITY, approver)).lastrowid for approver in approvers]
+        return vid, list(zip(approvers, rids))
+
+    vid, trips = app_module.run_write(setup)
+    return [(login('approver', f'AND u.uid = {uid}')[0], rid) for uid, rid in trips], vid
+
+
+def approve(client, rid):
+    return client.post('/approver/process_request', json={'request_id': rid, 'action': 'approve'}).get_json()
+
+
+def test_racing_approvers_assign_the_vehicle_once(app_module, contested):
+    trips, vid = contested
+    barrier = threading.Barrier(len(trips))
+    results = {}
+
+    def run(client, rid):
+        barrier.wait()
+        results[rid] = approve(client, rid)
+
+    threads = [threading.Thread(target=run, args=trip) for trip in trips]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert sorted(result['success'] for result in results.values()) == [False, True]
+    conn = app_module.get_pool().acquire()
+    try:
+        assigned = conn.execute('''
+            SELECT rid FROM trip_requests WHERE assigned_vid = ? AND current_status = 'assigned'
+        ''', (vid,)).fetchall()
+        pending = conn.execute('''
+            SELECT COUNT(*) FROM trip_requests WHERE rid IN (?, ?) AND current_status = 'pending'
+        ''', [rid for _, rid in trips]).fetchone()[0]
+    finally:
+        app_module.get_pool().release(conn)
+    assert len(assigned) == 1
+    assert results[assigned[0]['rid']]['success']
+    assert pending == 1
+
+
+def test_conflicting_assignment_stops_after_max_retries(app_module, contested, monkeypatch):
+    trips, vid = contested
+    (first, first_rid), (second, second_rid) = trips
+    assert approve(first, first_rid)['success']
+
+    # 内存日历过时：一直选中已经被占用的车辆，条件更新每次都失败
+    monkeypatch.setattr(app_module, 'pick_vehicle', lambda *args: vid)
+    monkeypatch.setitem(app_module.app.config, 'ASSIGN_MAX_RETRIES', 2)
+    before = dict(app_module.assignment_stats)
+
+    result = approve(second, second_rid)
+    stats = app_module.assignment_stats
+    assert result == {'success': False,
+                      'message': 'The assigned driver or vehicle was taken concurrently, please retry'}
+    assert stats['attempts'] - before['attempts'] == 3
+    assert stats['conflicts'] - before['conflicts'] == 3
+    assert stats['retries'] - before['retries'] == 2
+    assert stats['exhausted'] - before['exhausted'] == 1
+    assert stats['assigned'] == before['assigned']
@@ -0,0 +1,73 @@
+import os
+import shutil
+
+import pytest
+
+import migrations
+from conftest import ROOT
+
+
+@pytest.mark.parametrize('name', list(migrations.HOT_QUERIES))
+def test_hot_query_uses_index(conn, name):
+    """seed.py --scale 生成并 ANALYZE 过的数据库上，每个热点查询都不做全表扫描"""
+    plan = migrations.query_plan(conn, *migrations.HOT_QUERIES[name])
+    assert migrations.check_query_plans(conn, {name: migrations.HOT_QUERIES[name]}) == {}, plan
+
+
+def test_full_scan_is_reported(conn):
+    problems = migrations.check_query_plans(conn, {'notes': ('SELECT rid FROM trip_requests WHERE notes = ?', ('x',))})
+    assert problems == {'notes': ['SCAN trip_requests']}
+
+
+def test_full_index_scan_is_reported(conn):
+    """只为排序按整个索引扫描也要读完全部行，除非查询在允许列表中"""
+    query = ('SELECT * FROM trip_requests WHERE notes = ? ORDER BY approved_by, current_status, created_at', ('x',))
+    problems = migrations.check_query_plans(conn, {'ordered': query})
+    assert [step.split(' USING ')[0] for step in problems['ordered']] == ['SCAN trip_requests']
+    assert ' INDEX ' in problems['ordered'][0]
+    assert migrations.check_query_plans(conn, {'ordered': query}, index_scans_allowed={'ordered'}) == {}
+
+
+def test_single_row_table_scan_is_accepted(conn):
+    conn.execute('CREATE TABLE settings (name TEXT, value TEXT)')
+    conn.execute("INSERT INTO settings VALUES ('mode', 'on')")
+    query = ('SELECT value FROM settings WHERE name = ?', ('mode',))
+    assert migrations.check_query_plans(conn, {'settings': query}) == {}
+
+    conn.execute("INSERT INTO settings VALUES ('other', 'off')")
+    assert migrations.check_query_plans(conn, {'settings': query}) == {'settings': ['SCAN settings']}
+
+
+def test_small_table_scan_is_accepted_by_statistics(conn):
+    """ANALYZE 统计为很小的表可以扫描，统计显示变大后重新报告"""
+    conn.execute('CREATE TABLE settings (name TEXT, value TEXT)')
+    conn.executemany('INSERT INTO settings VALUES (?, ?)', [('mode', 'on'), ('other', 'off'), ('third', 'on')])
+    query = ('SELECT value FROM settings WHERE name = ?', ('mode',))
+    conn.execute('ANALYZE settings')
+    assert migrations.check_query_plans(conn, {'settings': query}) == {}
+
+    conn.execute("UPDATE sqlite_stat1 SET stat = '100000' WHERE tbl = 'settings'")
+    assert migrations.check_query_plans(conn, {'settings': query}) == {'settings': ['SCAN settings']}
+
+
+def test_migrate_command_reports_applied_migrations(app_module, tmp_path, monkeypatch):
+    """命令行不创建进程内连接池（不会先自动迁移、不启动写线程），flask migrate 报告它执行的迁移"""
+    path = str(tmp_path / 'fresh.db')
+    shutil.copy(os.path.join(ROOT, '5003project.db'), path)
+    pool = app_module._pool
+    monkeypatch.setattr(app_module, 'DATABASE', path)
+    runner = app_module.app.test_cli_runner()
+
+    result = runner.invoke(args=['migrate'])
+    assert result.exit_code == 0, result.output
+    versions = [version for version, _, _ in migrations.MIGRATIONS]
+    assert f'Applied migrations: {versions}' in result.output
+    assert f'Schema version: {versions[-1]}' in result.output
+    assert 'Applied migrations: none' in runner.invoke(args=['migrate']).output
+    assert app_module._pool is pool
+
+
+def test_check_indexes_command(app_module):
+    result = app_module.app.test_cli_runner().invoke(args=['check-indexes'])
+    assert result.exit_code == 0, result.output
+    assert 'FAIL' not in result.output
@@ -0,0 +1,100 @@
+import sqlite3
+
+import search
+from test_write_queue import new_trip
+
+SEARCH_WORDS = ('street', 'road', 'avenue', 'lane', 'apt')
+
+
+def matches(conn, query):
+    return [row[0] for row in conn.execute(
+        'SELECT rowid FROM trip_search WHERE trip_search MATCH ? ORDER BY rank, rowid', (query,))]
+
+
+def test_invalid_query_is_rejected_before_the_page_cache(app_module, login, monkeypatch):
+    client, _ = login('database_manager')
+    # 校验之前构造出 FTS5 不能解析的查询
+    monkeypatch.setattr(search, 'match_query', lambda text, columns=None: 'street AND')
+    entries = app_module.page_cache.stats()['entries']
+
+    response = client.get('/trips/search', query_string={'q': 'street'})
+    assert response.get_json()['success'] is False
+    assert 'ETag' not in response.headers
+    assert app_module.page_cache.stats()['entries'] == entries
+
+
+def test_failed_search_is_not_cached(app_module, login, monkeypatch):
+    client, _ = login('database_manager')
+    original = search.search
+    calls = []
+
+    def failing_once(*args, **kwargs):
+        calls.append(True)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('interrupted')
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(search, 'search', failing_once)
+    params = {'q': 'road', 'limit': 7}
+    failed = client.get('/trips/search', query_string=params)
+    assert failed.get_json() == {'success': False, 'message': 'Search failed: interrupted'}
+    assert 'ETag' not in failed.headers
+
+    retried = client.get('/trips/search', query_string=params)
+    assert retried.get_json()['success']
+    assert len(calls) == 2
+
+
+def test_triggers_keep_the_index_in_sync(conn):
+    trip = conn.execute('SELECT eid FROM trip_requests LIMIT 1').fetchone()
+    rid = conn.execute('''
+        INSERT INTO trip_requests (eid, purpose, destination, start_time, end_time, passenger_number, notes)
+        VALUES (?, 'client pickup', '5 Zephyrine Quay', '2027-01-01 09:00:00', '2027-01-01 10:00:00', 1, 'bring badges')
+    ''', (trip['eid'],)).lastrowid
+    assert matches(conn, 'zephyrine') == [rid]
+    assert matches(conn, '{notes} : badges') == [rid]
+
+    conn.execute("""
+        UPDATE trip_requests SET destination = '5 Marlowe Quay', current_status = 'rejected',
+               rejection_reason = 'quibblesome paperwork'
+        WHERE rid = ?
+    """, (rid,))
+    assert matches(conn, 'zephyrine') == []
+    assert matches(conn, 'marlowe') == [rid]
+    assert matches(conn, '{rejection_reason} : quibblesome') == [rid]
+
+    conn.execute('DELETE FROM trip_requests WHERE rid = ?', (rid,))
+    assert matches(conn, 'marlowe') == []
+    conn.execute("INSERT INTO trip_search (trip_search) VALUES ('integrity-check')")
+
+
+def test_rebuild_search_command_matches_incremental(app_module, login):
+    requester, _ = login('normal')
+    assert requester.post('/user/new_request', json=new_trip(destination='8 Thistlewood Pier',
+                                                             notes='quarterly audit')).get_json()['success']
+
+    conn = sqlite3.connect(app_module.DATABASE)
+    try:
+        queries = [*SEARCH_WORDS, 'thistlewood', 'audit', '"thistlewood pier"']
+        incremental = {query: matches(conn, query) for query in queries}
+        assert len(incremental['thistlewood']) == 1
+
+        result = app_module.app.test_cli_runner().invoke(args=['rebuild-search'])
+        assert result.exit_code == 0, result.output
+        total = conn.execute('SELECT COUNT(*) FROM trip_requests_all').fetchone()[0]
+        assert f'{total} trips indexed' in result.output
+        assert {query: matches(conn, query) for query in queries} == incremental
+    finally:
+        conn.close()
+
+
+def test_search_is_scoped_to_the_requester(login):
+    first, first_user = login('normal')
+    second, second_user = login('normal', f"AND u.eid <> {first_user['eid']}")
+    for client in (first, second):
+        assert client.post('/user/new_request', json=new_trip(destination='3 Gallowglass Row')).get_json()['success']
+
+    for client, user in ((first, first_user), (second, second_user)):
+        result = client.get('/trips/search', query_string={'q': 'gallowglass'}).get_json()
+        assert result['success']
+        assert [trip['eid'] for trip in result['trips']] == [user['eid']]
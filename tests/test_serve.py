@@ -0,0 +1,166 @@
+import http.cookiejar
+import json
+import os
+import queue
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import pytest
+
+from conftest import PASSWORD, ROOT
+from test_write_queue import new_trip
+
+pytest.importorskip('gevent')
+
+# 在内存中计数，大约需要几秒，期间不读写数据库文件
+SLOW_SQL = '''
+    WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 5000000)
+    SELECT COUNT(*) AS total FROM c
+'''
+
+
+@pytest.fixture
+def server(db_path):
+    """在子进程中用 serve.py 运行应用，返回 (基础 URL, 数据库路径)"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, 'serve.py', '--port', str(port), '--database', db_path],
+                               cwd=ROOT, stdout=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                urllib.request.urlopen(url + '/', timeout=1).close()
+                break
+            except OSError:
+                assert process.poll() is None and time.monotonic() < deadline, 'serve.py did not start'
+                time.sleep(0.1)
+        yield url, db_path
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def login(url, db_path, user_type):
+    """返回带有登录会话的 opener 和用户行"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        user = conn.execute('''
+            SELECT uid, username, eid FROM users WHERE utype = ? AND u_is_active = 1 ORDER BY uid LIMIT 1
+        ''', (user_type,)).fetchone()
+    finally:
+        conn.close()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    form = {'username': user['username'], 'password': PASSWORD, 'user_id': user['uid'], 'user_type': user_type}
+    opener.open(url + '/login', urllib.parse.urlencode(form).encode(), timeout=10).close()
+    return opener, user
+
+
+def post_json(opener, url, data, timeout=60):
+    request = urllib.request.Request(url, json.dumps(data).encode(), {'Content-Type': 'application/json'})
+    with opener.open(request, timeout=timeout) as response:
+        return json.load(response)
+
+
+def test_event_stream_stays_live_during_slow_admin_sql(server):
+    url, db_path = server
+    requester, _ = login(url, db_path, 'normal')
+    admin, _ = login(url, db_path, 'database_manager')
+
+    lines = queue.Queue()
+
+    def read_events():
+        with requester.open(url + '/events', timeout=60) as stream:
+            for line in stream:
+                lines.put(line.decode().strip())
+
+    threading.Thread(target=read_events, daemon=True).start()
+    assert lines.get(timeout=10).startswith('retry:')
+
+    result = {}
+
+    def run_sql():
+        result['response'] = post_json(admin, url + '/admin/execute_sql', {'sql': SLOW_SQL})
+        result['finished'] = time.monotonic()
+
+    sql = threading.Thread(target=run_sql)
+    sql.start()
+    time.sleep(0.5)
+
+    # SQL 执行期间提交新的请求，推送连接应该马上收到事件
+    assert post_json(requester, url + '/user/new_request', new_trip(), timeout=10)['success']
+    while lines.get(timeout=10) != 'event: trip':
+        pass
+    received = time.monotonic()
+
+    sql.join(60)
+    assert result['response']['success']
+    assert result['response']['data'] == [{'total': 5000000}]
+    assert received < result['finished']
+
+
+def test_requests_are_served_while_the_writer_waits_for_the_write_lock(server):
+    url, db_path = server
+    requester, _ = login(url, db_path, 'normal')
+
+    # 另一个进程持有写锁，写线程在 busy_timeout 中等待
+    blocker = sqlite3.connect(db_path)
+    blocker.execute('BEGIN IMMEDIATE')
+    result = {}
+    write = threading.Thread(target=lambda: result.update(
+        post_json(requester, url + '/user/new_request', new_trip(), timeout=30)))
+    try:
+        write.start()
+        time.sleep(0.5)
+        started = time.monotonic()
+        urllib.request.urlopen(url + '/', timeout=10).close()
+        assert time.monotonic() - started < 1
+        assert not result
+    finally:
+        time.sleep(1)
+        blocker.rollback()
+        blocker.close()
+    write.join(30)
+    assert result['success']
+
+
+def test_import_runs_in_the_threadpool(server):
+    """导入在线程池中执行：请求体先读到临时文件，上传的文件和请求体都能导入"""
+    url, db_path = server
+    admin, _ = login(url, db_path, 'database_manager')
+    conn = sqlite3.connect(db_path)
+    try:
+        manager = conn.execute('SELECT MIN(eid) FROM employees').fetchone()[0]
+    finally:
+        conn.close()
+
+    body = f'dname,manager_id,dphone\nImport Body Dept,{manager},555-0190\n'.encode()
+    request = urllib.request.Request(url + '/admin/import?table=departments&format=csv', body,
+                                     {'Content-Type': 'text/csv'})
+    with admin.open(request, timeout=30) as response:
+        assert json.load(response)['success']
+
+    boundary = 'importboundary'
+    upload = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="d.csv"\r\n'
+              f'Content-Type: text/csv\r\n\r\ndname,manager_id,dphone\nImport Upload Dept,{manager},555-0191\n'
+              f'\r\n--{boundary}--\r\n').encode()
+    request = urllib.request.Request(url + '/admin/import?table=departments&format=csv', upload,
+                                     {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    with admin.open(request, timeout=30) as response:
+        assert json.load(response)['success']
+
+    conn = sqlite3.connect(db_path)
+    try:
+        names = {row[0] for row in conn.execute("SELECT dname FROM departments WHERE dname LIKE 'Import % Dept'")}
+    finally:
+        conn.close()
+    assert names == {'Import Body Dept', 'Import Upload Dept'}
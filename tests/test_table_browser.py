@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+
+from table_browser import browse_rows, list_tables, table_schema
+
+
+class RecordingConnection:
+    """记录 browse_rows 执行的语句和参数，用来检查查询计划"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = []
+
+    def execute(self, sql, params=()):
+        self.statements.append((sql, params))
+        return self.conn.execute(sql, params)
+
+
+def browsable(conn, schema):
+    """WITHOUT ROWID 且没有单列主键的表（如 FTS5 的内部表）不能分页浏览"""
+    try:
+        conn.execute(f'SELECT {schema["pk"]} FROM "{schema["table"]}" LIMIT 1')
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def test_only_indexed_columns_are_sortable(conn):
+    schema = table_schema(conn, 'users')
+    assert schema['sortable'][0] == 'uid'
+    assert 'username' in schema['sortable']
+    assert 'password' not in schema['sortable']
+
+
+def test_unindexed_sort_falls_back_to_primary_key(conn):
+    schema = table_schema(conn, 'users')
+    _, rows, _ = browse_rows(conn, schema, sort='password', descending=True, limit=5)
+    expected = [row['uid'] for row in conn.execute('SELECT uid FROM users ORDER BY uid DESC LIMIT 5')]
+    assert [row['uid'] for row in rows] == expected
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_sortable_columns_page_without_sorting(conn, descending):
+    for table in list_tables(conn):
+        schema = table_schema(conn, table)
+        if not browsable(conn, schema):
+            continue
+        for sort in schema['sortable'] or [schema['pk']]:
+            recorder = RecordingConnection(conn)
+            _, _, cursor = browse_rows(recorder, schema, sort=sort, descending=descending, limit=20)
+            if cursor is not None:
+                browse_rows(recorder, schema, sort=sort, descending=descending, after=cursor, limit=20)
+            for sql, params in recorder.statements:
+                plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+                assert not any('TEMP B-TREE' in step for step in plan), (table, sort, plan)
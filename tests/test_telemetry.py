@@ -0,0 +1,88 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import telemetry
+
+
+def usage_rows(conn):
+    return [(row[0], row[1], round(row[2], 6), round(row[3], 6), row[4]) for row in conn.execute(
+        'SELECT day, vid, distance_km, fuel_used, readings FROM vehicle_daily_usage ORDER BY day, vid')]
+
+
+def readings_for(trip, start, steps):
+    """从 start 开始的一组读数：steps 为 (相对分钟数, 里程表, 油量)"""
+    return [{'rid': trip['rid'], 'vid': trip['assigned_vid'], 'eid': trip['assigned_eid'], 'kind': 'reading',
+             'recorded_at': (start + timedelta(minutes=minutes)).strftime('%Y-%m-%d %H:%M:%S'),
+             'odometer': odometer, 'fuel': fuel} for minutes, odometer, fuel in steps]
+
+
+def test_triggers_match_rebuild(conn):
+    trips = conn.execute('''
+        SELECT rid, assigned_vid, assigned_eid FROM trip_requests
+        WHERE assigned_vid IS NOT NULL AND current_status IN ('assigned', 'in_progress', 'completed')
+        ORDER BY rid LIMIT 3
+    ''').fetchall()
+    start = datetime(2026, 3, 1, 22, 0)
+    # 按时间顺序、跨过午夜、加油（油量上升）、迟到的读数、相同时间的读数、行驶中里程表不变
+    telemetry.record(conn, readings_for(trips[0], start, [(0, 100, 90), (30, 130, 85), (90, 190, 95), (150, 250, 88)]))
+    telemetry.record(conn, readings_for(trips[0], start, [(60, 160, 80), (-30, 90, 92)]))
+    telemetry.record(conn, readings_for(trips[1], start, [(0, 500, 50), (0, 505, 49), (45, 505, 49), (200, 620, 40)]))
+    telemetry.record(conn, readings_for(trips[2], start, [(120, 10, 60)]))
+    telemetry.record(conn, readings_for(trips[2], start, [(10, 5, 70), (300, 80, 55), (130, 12, 59)]))
+    conn.commit()
+
+    incremental = usage_rows(conn)
+    assert {row[0] for row in incremental} == {'2026-03-01', '2026-03-02'}
+    assert telemetry.rebuild(conn) == len(incremental)
+    assert usage_rows(conn) == incremental
+
+    # 行程汇总与按天汇总的里程一致
+    total = sum(telemetry.trip_summary(conn, trip['rid'])['distance_km'] for trip in trips)
+    assert round(total, 6) == round(sum(row[2] for row in incremental), 6)
+
+
+def test_readings_are_append_only(conn):
+    trip = conn.execute('SELECT rid, assigned_vid, assigned_eid FROM trip_requests WHERE assigned_vid IS NOT NULL LIMIT 1').fetchone()
+    telemetry.record(conn, readings_for(trip, datetime(2026, 3, 1, 8, 0), [(0, 100, 90)]))
+    conn.commit()
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute('UPDATE trip_telemetry SET odometer = 0')
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute('DELETE FROM trip_telemetry')
+
+
+@pytest.mark.parametrize('odometer, fuel', [('nan', 50), ('inf', 50), (float('nan'), 50), (1000, 'nan'),
+                                            (1000, float('-inf'))])
+def test_non_finite_readings_are_rejected(odometer, fuel):
+    reading, error = telemetry.parse_reading({'trip_id': 1, 'odometer': odometer, 'fuel': fuel})
+    assert reading is None
+    assert error == 'odometer and fuel must be finite numbers'
+
+
+def test_rebuild_usage_command_matches_uploaded_readings(app_module, login):
+    conn = sqlite3.connect(app_module.DATABASE)
+    conn.row_factory = sqlite3.Row
+    try:
+        trip = conn.execute('''
+            SELECT tr.rid, tr.assigned_eid FROM trip_requests tr
+            WHERE tr.current_status IN ('assigned', 'in_progress') AND tr.assigned_vid IS NOT NULL
+              AND EXISTS (SELECT 1 FROM users u WHERE u.eid = tr.assigned_eid AND u.utype = 'driver'
+                          AND u.u_is_active = 1)
+            ORDER BY tr.rid LIMIT 1
+        ''').fetchone()
+        driver, _ = login('driver', f"AND u.eid = {trip['assigned_eid']}")
+        readings = [{'trip_id': trip['rid'], 'recorded_at': recorded_at, 'odometer': odometer, 'fuel': fuel}
+                    for recorded_at, odometer, fuel in [('2026-04-02T09:00', 700, 60), ('2026-04-02T11:00', 780, 52),
+                                                        ('2026-04-03T08:00', 900, 95), ('2026-04-02T10:00', 720, 57)]]
+        result = driver.post('/driver/telemetry', json={'readings': readings}).get_json()
+        assert result['success'] and result['inserted'] == len(readings)
+
+        incremental = usage_rows(conn)
+        result = app_module.app.test_cli_runner().invoke(args=['rebuild-usage'])
+        assert result.exit_code == 0, result.output
+        assert f'{len(incremental)} rows' in result.output
+        assert usage_rows(conn) == incremental
+    finally:
+        conn.close()
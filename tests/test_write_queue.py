@@ -0,0 +1,147 @@
+import sqlite3
+
+import pytest
+
+from sql_metrics import RequestTrace, SqlMetrics
+from write_queue import WriteQueue
+
+
+def new_trip(**overrides):
+    trip = {'purpose': 'business trip', 'destination': '12 Harbour Road', 'start_time': '2027-03-01 09:00:00',
+            'end_time': '2027-03-01 12:00:00', 'passenger_number': 2, 'notes': ''}
+    trip.update(overrides)
+    return trip
+
+
+@pytest.fixture
+def writer(db_path):
+    queue = WriteQueue(max_batch=8)
+    queue.start(lambda: sqlite3.connect(db_path, check_same_thread=False))
+    yield queue
+    queue.stop()
+
+
+def test_unit_statements_are_charged_to_the_trace(writer):
+    metrics = SqlMetrics(slow_ms=10000)
+    trace = RequestTrace('new_request')
+    unit = metrics.trace_unit(lambda conn: conn.execute(
+        "UPDATE vehicles SET fuel = fuel WHERE vid = (SELECT MIN(vid) FROM vehicles)").rowcount, trace)
+
+    assert writer.submit(unit) == 1
+    metrics.finish_request(trace)
+    stats = metrics.snapshot()['endpoints']['new_request']
+    assert stats['queries'] == 1
+    assert stats['statements'] >= 1
+
+
+def test_write_endpoints_report_sql_metrics(app_module, login, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'SQL_INSTRUMENTATION', True)
+    app_module.sql_metrics.reset()
+    client, _ = login('normal')
+
+    assert client.post('/user/new_request', json=new_trip()).get_json()['success']
+    stats = app_module.sql_metrics.snapshot()['endpoints']['new_request']
+    assert stats['queries'] > 0
+    assert stats['sql_ms_total'] > 0
+    statements = app_module.sql_metrics.snapshot()['top_statements']
+    assert any('INSERT INTO trip_requests' in entry['sql'] and 'new_request' in entry['endpoints']
+               for entry in statements)
+
+
+def test_failed_unit_is_rolled_back_and_reported(db_path):
+    aborts = []
+    queue = WriteQueue(max_batch=8, on_abort=lambda: aborts.append(True))
+    queue.start(lambda: sqlite3.connect(db_path, check_same_thread=False))
+    try:
+        def failing(conn):
+            conn.execute("UPDATE vehicles SET fuel = -1")
+            raise ValueError('boom')
+
+        with pytest.raises(ValueError):
+            queue.submit(failing)
+        assert aborts == [True]
+        assert queue.submit(lambda conn: conn.execute("SELECT COUNT(*) FROM vehicles WHERE fuel = -1").fetchone()[0]) == 0
+        assert aborts == [True]
+        assert queue.stats()['rolled_back_units'] == 1
+    finally:
+        queue.stop()
+
+
+def test_rolled_back_unit_invalidates_trip_followers(app_module):
+    """单元让审批员路由读到了随后被回滚的 trip_changes 行：路由必须重建，而不是留着不存在的待审批请求"""
+    router = app_module.approver_router
+    conn = app_module.get_pool().acquire()
+    try:
+        approver, eid = conn.execute('''
+            SELECT approved_by, eid FROM trip_requests WHERE current_status = 'pending' LIMIT 1
+        ''').fetchone()
+        other = conn.execute('''
+            SELECT approved_by FROM trip_requests WHERE approved_by <> ? LIMIT 1
+        ''', (approver,)).fetchone()[0]
+        router.sync(conn)
+    finally:
+        app_module.get_pool().release(conn)
+
+    phantom = []
+
+    def unit(conn):
+        phantom.append(conn.execute('''
+            INSERT INTO trip_requests (eid, purpose, destination, start_time, end_time, passenger_number, approved_by)
+            VALUES (?, 'business trip', 'Nowhere', '2027-01-01 09:00:00', '2027-01-01 10:00:00', 1, ?)
+        ''', (eid, approver)).lastrowid)
+        router.sync(conn)
+        assert phantom[0] in router._pending
+        raise RuntimeError('rejected after routing')
+
+    with pytest.raises(RuntimeError):
+        app_module.run_write(unit)
+    assert router.last_seq is None
+
+    # 回滚释放的 seq 被下一次写入重新使用，重建后的路由只看到真正提交的行程
+    real = app_module.run_write(lambda conn: conn.execute('''
+        INSERT INTO trip_requests (eid, purpose, destination, start_time, end_time, passenger_number, approved_by)
+        VALUES (?, 'business trip', 'Somewhere', '2027-01-02 09:00:00', '2027-01-02 10:00:00', 1, ?)
+    ''', (eid, other)).lastrowid)
+    conn = app_module.get_pool().acquire()
+    try:
+        router.sync(conn)
+    finally:
+        app_module.get_pool().release(conn)
+    assert router._pending.get(real) == other
+    if phantom[0] != real:
+        assert phantom[0] not in router._pending
+
+
+def test_writer_survives_failing_on_abort_and_connect(db_path):
+    """on_abort 或 connect() 抛出异常时提交者得到错误，写线程继续处理后面的单元"""
+    connects = []
+
+    def connect():
+        connects.append(True)
+        if len(connects) == 1:
+            raise OSError('database unavailable')
+        return sqlite3.connect(db_path, check_same_thread=False)
+
+    def on_abort():
+        raise KeyError('follower already gone')
+
+    queue = WriteQueue(max_batch=8, on_abort=on_abort)
+    queue.start(connect)
+    try:
+        with pytest.raises(OSError):
+            queue.submit(lambda conn: 1, timeout=2)
+
+        def failing(conn):
+            raise ValueError('boom')
+
+        with pytest.raises(ValueError):
+            queue.submit(failing, timeout=2)
+        assert queue.submit(lambda conn: conn.execute('SELECT 1').fetchone()[0], timeout=2) == 1
+        stats = queue.stats()
+        assert stats['running']
+        assert stats['aborted_batches'] == 1
+        assert stats['abort_errors'] == 2
+        assert len(connects) == 2
+    finally:
+        queue.stop()
+    assert not queue.stats()['running']
@@ -0,0 +1,84 @@
+import sqlite3
+
+# trip_stats 的维度：全部行程（key 为 0）、申请人部门、车辆、司机
+DIMENSIONS = ('all', 'department', 'vehicle', 'driver')
+# 这些状态的行程时长计入车辆和司机的占用时间
+BUSY_STATUSES = ('assigned', 'in_progress', 'completed')
+# 已被审批员处理过的状态（用于计算拒绝率）
+DECIDED_STATUSES = ('approved', 'rejected', 'assigned', 'in_progress', 'completed')
+
+# 每个维度的键，以及重建时需要的 JOIN 和条件；与迁移 6 中触发器的写法一致
+_REBUILD_SOURCES = {
+    'all': ('0', '', ''),
+    'department': ('e.did', 'JOIN employees e ON e.eid = tr.eid', ''),
+    'vehicle': ('tr.assigned_vid', '', 'WHERE tr.assigned_vid IS NOT NULL'),
+    'driver': ('tr.assigned_eid', '', 'WHERE tr.assigned_eid IS NOT NULL'),
+}
+_BUSY_SECONDS = ('MAX(0, COALESCE(CAST(ROUND((julianday(tr.end_time) - julianday(tr.start_time)) * 86400) '
+                 'AS INTEGER), 0))')
+
+
+def rebuild(conn):
+    """按全部行程（包括已归档的）重建 trip_stats（在一个事务中），返回写入的行数"""
+    archived = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'trip_requests_all'").fetchone()
+    source = 'trip_requests_all' if archived else 'trip_requests'
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM trip_stats')
+        for dimension, (key, join, where) in _REBUILD_SOURCES.items():
+            conn.execute(f'''
+                INSERT INTO trip_stats (dimension, day, key, status, trips, busy_seconds)
+                SELECT ?, substr(tr.start_time, 1, 10), {key}, tr.current_status, COUNT(*), SUM({_BUSY_SECONDS})
+                FROM {source} tr {join}
+                {where}
+                GROUP BY 2, 3, 4
+            ''', (dimension,))
+        total = conn.execute('SELECT COUNT(*) FROM trip_stats').fetchone()[0]
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return total
+
+
+def summarize(conn, dimension, start_day, end_day, key=None, by_day=False):
+    """汇总 [start_day, end_day] 内某个维度的行程数和占用时间
+
+    返回按键（by_day 时按日期和键）分组的 dict 列表：各状态行程数 statuses、
+    总数 trips、拒绝率 rejection_rate 和占用小时数 busy_hours。
+    """
+    conditions = ['dimension = ?', 'day >= ?', 'day <= ?', 'trips <> 0']
+    params = [dimension, start_day, end_day]
+    if key is not None:
+        conditions.append('key = ?')
+        params.append(key)
+    group = 'day, key' if by_day else 'key'
+    rows = conn.execute(f'''
+        SELECT {group}, status, SUM(trips) AS trips, SUM(busy_seconds) AS busy_seconds
+        FROM trip_stats
+        WHERE {' AND '.join(conditions)}
+        GROUP BY {group}, status
+    ''', params).fetchall()
+
+    groups = {}
+    for row in rows:
+        ident = (row['day'], row['key']) if by_day else row['key']
+        entry = groups.get(ident)
+        if entry is None:
+            entry = groups[ident] = {'key': row['key'], 'statuses': {}, 'trips': 0, 'busy_seconds': 0}
+            if by_day:
+                entry['day'] = row['day']
+        entry['statuses'][row['status']] = row['trips']
+        entry['trips'] += row['trips']
+        if row['status'] in BUSY_STATUSES:
+            entry['busy_seconds'] += row['busy_seconds']
+
+    result = []
+    for ident in sorted(groups):
+        entry = groups[ident]
+        decided = sum(entry['statuses'].get(status, 0) for status in DECIDED_STATUSES)
+        entry['rejection_rate'] = round(entry['statuses'].get('rejected', 0) / decided, 4) if decided else None
+        entry['busy_hours'] = round(entry.pop('busy_seconds') / 3600, 2)
+        result.append(entry)
+    return result
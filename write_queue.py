@@ -0,0 +1,288 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+
+
+class WriteQueueFull(Exception):
+    """写队列中等待的写单元已达到上限"""
+
+
+class WriteTimeout(Exception):
+    """写单元在等待时间内没有开始执行（已经取消，不会再执行）"""
+
+
+def start_daemon_thread(target, name):
+    """默认的后台线程启动函数：在守护线程中执行 target()"""
+    threading.Thread(target=target, name=name, daemon=True).start()
+
+
+def run_in_transaction(conn, unit):
+    """不经过写线程，直接在 conn 上用一个 BEGIN IMMEDIATE 事务执行写单元（命令行等单独进程使用）"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        result = unit(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return result
+
+
+class _UnitConnection:
+    """交给写单元的连接：事务由写线程统一提交，单元不能自己提交或回滚"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def commit(self):
+        raise sqlite3.ProgrammingError('Write units are committed by the writer thread')
+
+    def rollback(self):
+        raise sqlite3.ProgrammingError('Write units are rolled back by the writer thread')
+
+
+class _Unit:
+    __slots__ = ('fn', 'submitted', 'started', 'done', 'result', 'error')
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.submitted = time.perf_counter()
+        self.started = False
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+class WriteQueue:
+    """唯一的写连接和执行写操作的线程
+
+    写端点把写操作包装成写单元（接收连接、返回结果的函数）提交到队列，由写线程
+    依次执行，不再有多个连接争抢写锁、在 busy_timeout 中等待。写线程每次取出队列中
+    最多 max_batch 个单元，在一个 BEGIN IMMEDIATE 事务中执行并一起提交（组提交）：
+    每个单元有自己的 SAVEPOINT，单元抛出异常时只回滚它自己的修改，异常原样交给
+    提交者；提交完成后提交者才得到结果。提交失败时整批失败。两种情况都会调用
+    on_abort()：单元可能已经让内存状态看到了被回滚的数据（如 trip_changes 的行，
+    回滚后它们的 seq 还会被重新使用）。
+    """
+
+    def __init__(self, max_batch=32, max_queue=1000, max_delay=0.0, on_abort=None):
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.max_delay = max_delay
+        self.on_abort = on_abort
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._started = False
+        self._running = False
+        self._stopping = False
+
+        # 统计计数器
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.batches = 0
+        self.aborted_batches = 0
+        self.rolled_back_units = 0
+        self.abort_errors = 0
+        self.max_depth = 0
+        self.batch_units_max = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.commit_time_total = 0.0
+        self.commit_time_max = 0.0
+        self._commit_times = deque(maxlen=1000)
+
+    def start(self, connect, spawn=start_daemon_thread):
+        """启动写线程，connect() 返回写线程独占的可写连接
+
+        spawn(target, name) 启动执行 target() 的线程；gevent 下要传入启动真正系统线程的函数，
+        否则写线程会变成 greenlet，SQLite 调用（包括等待写锁）期间整个进程都被阻塞。
+        """
+        with self._cond:
+            if self._started:
+                return
+            self._started = self._running = True
+        spawn(lambda: self._run(connect), 'db-writer')
+
+    def stop(self):
+        """执行完已提交的单元后停止写线程"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            while self._running:
+                self._cond.wait()
+
+    def submit(self, fn, timeout=10.0):
+        """提交写单元 fn(conn) 并等待它所在的事务提交，返回 fn 的返回值（fn 的异常原样抛出）
+
+        队列已满时抛出 WriteQueueFull；timeout 秒内没有开始执行时取消并抛出 WriteTimeout，
+        已经开始执行的单元会等到它的事务结束；写线程意外退出时抛出 RuntimeError。
+        """
+        unit = _Unit(fn)
+        with self._cond:
+            if not self._running or self._stopping:
+                raise RuntimeError('Writer thread is not running')
+            if len(self._pending) >= self.max_queue:
+                self.rejected += 1
+                raise WriteQueueFull(f'At most {self.max_queue} writes can be queued')
+            self._pending.append(unit)
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, len(self._pending))
+            self._cond.notify_all()
+
+            deadline = unit.submitted + timeout
+            while not unit.done:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 and not unit.started:
+                    self._pending.remove(unit)
+                    self.timeouts += 1
+                    raise WriteTimeout(f'Write did not start within {timeout}s')
+                if not self._running:
+                    raise RuntimeError('Writer thread stopped before the write finished')
+                # 已经开始执行的单元等到事务结束，每秒检查一次写线程是否还在运行
+                self._cond.wait(remaining if remaining > 0 else 1.0)
+
+        if unit.error is not None:
+            raise unit.error
+        return unit.result
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending and not self._stopping:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            if self.max_delay and len(self._pending) < self.max_batch:
+                # 稍等片刻，让更多单元进入同一批
+                self._cond.wait(self.max_delay)
+            batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            now = time.perf_counter()
+            for unit in batch:
+                unit.started = True
+                waited = now - unit.submitted
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+            return batch
+
+    def _run(self, connect):
+        conn = None
+        try:
+            while True:
+                batch = self._take_batch()
+                if batch is None:
+                    break
+                try:
+                    if conn is None:
+                        conn = connect()
+                    self._execute(conn, batch)
+                except Exception as e:
+                    conn = self._abort_batch(conn, batch, e)
+                finally:
+                    # 无论如何都要唤醒这一批的提交者
+                    self._finish(batch)
+        finally:
+            if conn is not None:
+                conn.close()
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+
+    def _abort_batch(self, conn, batch, error):
+        """事务本身失败（无法连接、无法开始、被 SQLite 整体回滚或无法提交）：整批失败
+
+        返回下一批使用的连接，None 表示下一批重新连接。
+        """
+        try:
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            conn = None
+        for unit in batch:
+            unit.result, unit.error = None, error
+        with self._cond:
+            self.aborted_batches += 1
+        self._call_on_abort()
+        return conn
+
+    def _call_on_abort(self):
+        # on_abort 出错不能让写线程退出或让已经成功的单元失败，只计数
+        if not self.on_abort:
+            return
+        try:
+            self.on_abort()
+        except Exception:
+            with self._cond:
+                self.abort_errors += 1
+
+    def _execute(self, conn, batch):
+        started = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        unit_conn = _UnitConnection(conn)
+        for unit in batch:
+            conn.execute('SAVEPOINT write_unit')
+            try:
+                unit.result = unit.fn(unit_conn)
+            except Exception as e:
+                unit.error = e
+                if not conn.in_transaction:
+                    raise sqlite3.OperationalError(f'Transaction rolled back by SQLite: {e}') from e
+                conn.execute('ROLLBACK TO write_unit')
+                with self._cond:
+                    self.rolled_back_units += 1
+                # 在同一批的下一个单元之前调用，后面的单元不会再用到被回滚的状态
+                self._call_on_abort()
+            conn.execute('RELEASE write_unit')
+        conn.commit()
+        elapsed = time.perf_counter() - started
+        with self._cond:
+            self.batches += 1
+            self.batch_units_max = max(self.batch_units_max, len(batch))
+            self.commit_time_total += elapsed
+            self.commit_time_max = max(self.commit_time_max, elapsed)
+            self._commit_times.append(elapsed)
+
+    def _finish(self, batch):
+        with self._cond:
+            for unit in batch:
+                unit.done = True
+                if unit.error is None:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            recent = sorted(self._commit_times)
+            finished = self.completed + self.failed
+            return {
+                'running': self._running,
+                'depth': len(self._pending),
+                'max_depth': self.max_depth,
+                'max_queue': self.max_queue,
+                'max_batch': self.max_batch,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'batches': self.batches,
+                'aborted_batches': self.aborted_batches,
+                'rolled_back_units': self.rolled_back_units,
+                'abort_errors': self.abort_errors,
+                'batch_units_avg': round(finished / (self.batches + self.aborted_batches), 3)
+                if self.batches + self.aborted_batches else None,
+                'batch_units_max': self.batch_units_max,
+                'wait_time_avg_ms': round(self.wait_time_total * 1000 / finished, 3) if finished else 0.0,
+                'wait_time_max_ms': round(self.wait_time_max * 1000, 3),
+                'commit_time_avg_ms': round(self.commit_time_total * 1000 / self.batches, 3) if self.batches else 0.0,
+                'commit_time_p95_ms': round(recent[int(len(recent) * 0.95)] * 1000, 3) if recent else 0.0,
+                'commit_time_max_ms': round(self.commit_time_max * 1000, 3),
+            }